@@ -0,0 +1,124 @@
+"""
+Cost of resolving ECS AMI release notes, per-call markdown parsing versus the cached release index and the
+build-time snapshot packaged with the Lambda.
+
+Uses the releases page fixture in benchmarks/fixtures/ecs_ami_releases.json instead of the GitHub API,
+and AMI names from the fixture instead of EC2.
+
+Usage:
+    python3 benchmarks/ami_release_lookup.py [--amis 10] [--invocations 5]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from unittest import mock
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "lambda", "runtask_fulfillment"))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "lambda", "shared"))
+
+import markdown_to_json  # noqa: E402
+from tools import ami_release_index, get_ami_releases  # noqa: E402
+
+FIXTURE = os.path.join(BENCHMARK_DIR, "fixtures", "ecs_ami_releases.json")
+
+
+def legacy_lookup(releases, ami_data):
+    """Previous implementation, parses every release body once per AMI id"""
+    releases_info = []
+    for ami in ami_data:
+        for release in releases:
+            details = markdown_to_json.dictify(release["body"])
+            for os_name in details.keys():
+                if os_name.startswith("Amazon"):
+                    if os_name == "Amazon ECS-optimized Amazon Linux AMI":
+                        if ami["name"] in details[os_name]:
+                            releases_info.append({"ami_id": ami["id"], "os_name": os_name})
+                            break
+                    else:
+                        for os_architecture in details[os_name].keys():
+                            if ami["name"] in details[os_name][os_architecture][0]:
+                                releases_info.append({"ami_id": ami["id"], "os_name": os_name})
+                                break
+    return releases_info
+
+
+class FakeResponse:
+    def __init__(self, releases, status_code=200):
+        self.releases = releases
+        self.status_code = status_code
+        self.headers = {"ETag": '"fixture"'}
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.releases
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--amis", type=int, default=10, help="AMI ids resolved per invocation")
+    parser.add_argument("--invocations", type=int, default=5, help="Warm invocations to simulate")
+    args = parser.parse_args()
+
+    with open(FIXTURE, encoding="utf-8") as file:
+        releases = json.load(file)
+    ami_names = [f"al2023-ami-ecs-hvm-2023.0.{release['tag_name']}-kernel-6.1-x86_64" for release in releases]
+    ami_data = [{"id": f"ami-{index:017x}", "name": ami_names[index % len(ami_names)]} for index in range(args.amis)]
+
+    start = time.perf_counter()
+    for _ in range(args.invocations):
+        legacy_results = legacy_lookup(releases, ami_data)
+    legacy_seconds = time.perf_counter() - start
+
+    requests_made = []
+
+    def fake_get(url, headers=None, timeout=None):
+        requests_made.append(headers.get("If-None-Match"))
+        return FakeResponse(releases, 304 if headers.get("If-None-Match") else 200)
+
+    names = {ami["id"]: ami["name"] for ami in ami_data}
+    tool = get_ami_releases.GetECSAmisReleases()
+    ami_release_index._snapshot = False  # live index only for the first measurements
+    with mock.patch.object(get_ami_releases.requests, "get", fake_get), \
+            mock.patch.object(tool, "get_ami_names_from_ids", lambda ami_ids: {ami_id: names[ami_id] for ami_id in ami_ids}):
+        start = time.perf_counter()
+        indexed_results = tool.get_ecs_amis_releases_info(list(names))
+        cold_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(args.invocations - 1):
+            indexed_results = tool.get_ecs_amis_releases_info(list(names))
+        warm_seconds = time.perf_counter() - start
+
+        get_ami_releases._release_index["expires_at"] = 0
+        tool.get_ecs_amis_releases_info(list(names))
+        live_requests = len(requests_made)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "ami_release_index.tsv")
+            ami_release_index.write_snapshot(path, ami_release_index.build_release_index(releases)[0], {})
+            get_ami_releases._release_index["expires_at"] = 0
+            start = time.perf_counter()
+            ami_release_index._snapshot = ami_release_index.ReleaseSnapshot(path)
+            snapshot_results = tool.get_ecs_amis_releases_info(list(names))
+            snapshot_seconds = time.perf_counter() - start
+
+    print(f"releases: {len(releases)}, AMIs per invocation: {args.amis}, invocations: {args.invocations}")
+    print(f"legacy per-call parsing : {legacy_seconds * 1000 / args.invocations:10.2f} ms per invocation ({len(legacy_results)} matches)")
+    print(f"indexed, cold container : {cold_seconds * 1000:10.2f} ms ({len(indexed_results)} matches)")
+    if args.invocations > 1:
+        print(f"indexed, warm container : {warm_seconds * 1000 / (args.invocations - 1):10.2f} ms per invocation")
+    print(f"snapshot, cold container: {snapshot_seconds * 1000:10.2f} ms ({len(snapshot_results)} matches)")
+    print(f"GitHub requests made    : {live_requests} (conditional: {sum(1 for etag in requests_made if etag)}), "
+          f"with snapshot: {len(requests_made) - live_requests}")
+
+
+if __name__ == "__main__":
+    main()
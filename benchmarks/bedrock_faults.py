@@ -0,0 +1,284 @@
+"""
+Fault injection scenarios for bedrock_resilience.ResilientBedrock, the wrapper of stream_messages and apply_guardrail.
+
+FaultInjectingBedrock is a bedrock-runtime stand-in answering converse_stream with a short text response and
+apply_guardrail with no intervention, after applying the next fault of its schedule:
+- throttle, unavailable, validation: the call raises the matching ClientError
+- stream_error: the stream raises a modelStreamErrorException after a few events
+- stall_first, stall_mid: the stream stops sending events before the first or in the middle of the response,
+  until it is closed
+- slow: the first event arrives after --slow-ms
+- slow_tail: the JSON object is complete early, trailing text deltas and the metadata event follow for --slow-ms
+
+Every scenario runs with short timeouts and backoff, checks its outcome and reports the attempts and elapsed time.
+The script exits with status 1 when a scenario does not behave as expected.
+
+Usage:
+    python3 benchmarks/bedrock_faults.py [--slow-ms 400] [--hedge-after-ms 100]
+"""
+
+import argparse
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "lambda", "runtask_fulfillment"))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "lambda", "shared"))
+
+import bedrock_resilience  # noqa: E402
+import json_stream  # noqa: E402
+import utils  # noqa: E402
+from botocore.exceptions import ClientError, EventStreamError  # noqa: E402
+
+ERRORS = {
+    "throttle": ("ThrottlingException", "Too many requests, please wait before trying again."),
+    "unavailable": ("ServiceUnavailableException", "Service unavailable."),
+    "validation": ("ValidationException", "Malformed input request."),
+}
+RESPONSE_TEXT = ['{"resources": ', '"aws_s3_bucket.artifacts", ', '"impact_analysis": "none"}']
+
+
+class FaultStream:
+    """Converse stream events of a short text response, interrupted by the injected fault"""
+
+    def __init__(self, fault, slow_seconds):
+        self.fault = fault
+        self.slow_seconds = slow_seconds
+        self.closed = threading.Event()
+
+    def __iter__(self):
+        if self.fault == "slow" and self.closed.wait(self.slow_seconds):
+            return
+        if self.fault == "stall_first":
+            self.closed.wait()
+            return
+        yield {"messageStart": {"role": "assistant"}}
+        for index, text in enumerate(RESPONSE_TEXT):
+            if self.closed.is_set():
+                return
+            if index == 1 and self.fault == "stall_mid":
+                self.closed.wait()
+                return
+            if index == 1 and self.fault == "stream_error":
+                raise EventStreamError(
+                    {"Error": {"Code": "modelStreamErrorException", "Message": "Model stream error."}}, "ConverseStream"
+                )
+            yield {"contentBlockDelta": {"delta": {"text": text}, "contentBlockIndex": 0}}
+        if self.fault == "slow_tail":
+            # Trailing tokens after the object, frequent enough to keep the stream from being seen as stalled
+            deadline = time.monotonic() + self.slow_seconds
+            while time.monotonic() < deadline and not self.closed.wait(0.05):
+                yield {"contentBlockDelta": {"delta": {"text": "\n"}, "contentBlockIndex": 0}}
+        yield {"contentBlockStop": {"contentBlockIndex": 0}}
+        yield {"messageStop": {"stopReason": "end_turn"}}
+        yield {"metadata": {"usage": {"inputTokens": 10, "outputTokens": 12, "totalTokens": 22}, "metrics": {"latencyMs": 5}}}
+
+    def close(self):
+        self.closed.set()
+
+
+class FaultInjectingBedrock:
+    """bedrock-runtime stand-in applying one fault of the schedule per call, see the module documentation"""
+
+    def __init__(self, faults=(), slow_seconds=0.4, default=None):
+        self.faults = list(faults)
+        self.default = default
+        self.slow_seconds = slow_seconds
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _next_fault(self):
+        with self.lock:
+            self.calls += 1
+            return self.faults.pop(0) if self.faults else self.default
+
+    def _raise(self, fault, operation_name):
+        if fault in ERRORS:
+            code, message = ERRORS[fault]
+            raise ClientError({"Error": {"Code": code, "Message": message}}, operation_name)
+
+    def converse_stream(self, modelId, messages, system, inferenceConfig, toolConfig=None):
+        fault = self._next_fault()
+        self._raise(fault, "ConverseStream")
+        return {"stream": self._tracked(FaultStream(fault, self.slow_seconds))}
+
+    def _tracked(self, stream):
+        client = self
+
+        class TrackedStream:
+            def __iter__(self):
+                with client.lock:
+                    client.in_flight += 1
+                    client.max_in_flight = max(client.max_in_flight, client.in_flight)
+                try:
+                    yield from stream
+                finally:
+                    with client.lock:
+                        client.in_flight -= 1
+
+            def close(self):
+                stream.close()
+
+        return TrackedStream()
+
+    def apply_guardrail(self, guardrailIdentifier, guardrailVersion, source, content):
+        self._raise(self._next_fault(), "ApplyGuardrail")
+        return {"action": "NONE", "outputs": [], "assessments": []}
+
+
+def converse(resilient, client, json_parser=None):
+    return resilient.stream_messages(client, "fault-model", [{"role": "user", "content": [{"text": "plan"}]}], "system", json_parser=json_parser)
+
+
+def scenario_retry(name, faults, expected_retries, **options):
+    def run(args):
+        client = FaultInjectingBedrock(faults, args.slow_ms / 1000)
+        resilient = new_resilient(args, **options)
+        parser = json_stream.IncrementalObjectParser()
+        stop_reason, message, usage = converse(resilient, client, parser)
+        ok = usage["retries"] == expected_retries and parser.complete and stop_reason == "end_turn"
+        return ok, f"retries={usage['retries']} calls={client.calls} fields={sorted(parser.fields)}"
+    return name, run
+
+
+def scenario_failure(name, faults, expected_error, expected_calls, **options):
+    def run(args):
+        client = FaultInjectingBedrock(faults, args.slow_ms / 1000)
+        try:
+            converse(new_resilient(args, **options), client)
+        except Exception as e:
+            ok = type(e).__name__ == expected_error and client.calls == expected_calls
+            return ok, f"{type(e).__name__} after calls={client.calls}"
+        return False, "no error raised"
+    return name, run
+
+
+def scenario_hedge(name):
+    def run(args):
+        client = FaultInjectingBedrock(["slow"], args.slow_ms / 1000)
+        resilient = new_resilient(args, hedge_after=args.hedge_after_ms / 1000)
+        start = time.monotonic()
+        _, _, usage = converse(resilient, client)
+        elapsed_ms = (time.monotonic() - start) * 1000
+        ok = usage["hedged_requests"] == 1 and elapsed_ms < args.slow_ms and client.calls == 2
+        return ok, f"hedged={usage['hedged_requests']} calls={client.calls} elapsed={elapsed_ms:.0f} ms (slow request {args.slow_ms:.0f} ms)"
+    return name, run
+
+
+def scenario_early_return(name):
+    def run(args):
+        client = FaultInjectingBedrock(["slow_tail"], args.slow_ms / 1000)
+        parser = json_stream.IncrementalObjectParser()
+        start = time.monotonic()
+        stop_reason, _, usage = converse(new_resilient(args), client, parser)
+        elapsed_ms = (time.monotonic() - start) * 1000
+        # The usage of the metadata event arrives once the rest of the stream was read in the background
+        pending = utils.wait_for_usage(args.slow_ms * 2 / 1000)
+        ok = parser.complete and elapsed_ms < args.slow_ms / 2 and not pending and usage["input_tokens"] == 10
+        return ok, (
+            f"returned after {elapsed_ms:.0f} ms (tail {args.slow_ms:.0f} ms) input_tokens={usage['input_tokens']} "
+            f"pending={pending}"
+        )
+    return name, run
+
+
+def scenario_deadline(name, faults, **options):
+    def run(args):
+        client = FaultInjectingBedrock(faults, args.slow_ms / 1000)
+        resilient = new_resilient(args, **options)
+        resilient.deadline = time.monotonic() + args.slow_ms / 1000
+        start = time.monotonic()
+        try:
+            converse(resilient, client)
+        except Exception as e:
+            elapsed_ms = (time.monotonic() - start) * 1000
+            # Closed at the deadline instead of waiting for the stall timeouts of every attempt
+            ok = type(e).__name__ == "DeadlineExceededError" and elapsed_ms < args.slow_ms * 1.5
+            return ok, f"{type(e).__name__} after calls={client.calls} elapsed={elapsed_ms:.0f} ms (deadline {args.slow_ms:.0f} ms)"
+        return False, "no error raised"
+    return name, run
+
+
+def scenario_concurrency(name, max_concurrency, requests, throttles):
+    def run(args):
+        client = FaultInjectingBedrock(["throttle"] * throttles, args.slow_ms / 1000, default="slow")
+        resilient = new_resilient(args, max_concurrency=max_concurrency, max_attempts=throttles + 2)
+        with ThreadPoolExecutor(max_workers=requests) as executor:
+            results = list(executor.map(lambda _: converse(resilient, client), range(requests)))
+        ok = client.max_in_flight <= max_concurrency and len(results) == requests
+        return ok, (
+            f"requests={requests} max_in_flight={client.max_in_flight} limit={resilient.limiter.limit:.2f}/{max_concurrency} "
+            f"retries={sum(usage['retries'] for _, _, usage in results)}"
+        )
+    return name, run
+
+
+def scenario_guardrail(name):
+    def run(args):
+        client = FaultInjectingBedrock(["throttle", "unavailable"])
+        response = new_resilient(args).apply_guardrail(
+            client, guardrailIdentifier="fault", guardrailVersion="1", source="OUTPUT", content=[{"text": {"text": "ok"}}]
+        )
+        return response["action"] == "NONE" and client.calls == 3, f"action={response['action']} calls={client.calls}"
+    return name, run
+
+
+def new_resilient(args, **options):
+    settings = dict(
+        max_attempts=4,
+        base_delay=0.01,
+        max_delay=0.05,
+        first_event_timeout=args.slow_ms * 2 / 1000,
+        idle_timeout=0.2,
+        max_concurrency=4,
+    )
+    settings.update(options)
+    return bedrock_resilience.ResilientBedrock(**settings)
+
+
+SCENARIOS = [
+    scenario_retry("no fault", [], 0),
+    scenario_retry("throttled twice", ["throttle", "throttle"], 2),
+    scenario_retry("service unavailable", ["unavailable"], 1),
+    scenario_retry("error in the stream", ["stream_error"], 1),
+    scenario_retry("stalled before the first event", ["stall_first"], 1),
+    scenario_retry("stalled in the middle", ["stall_mid"], 1),
+    scenario_failure("validation error is not retried", ["validation"], "ClientError", 1),
+    scenario_failure("attempts exhausted", ["throttle"] * 4, "ClientError", 4),
+    scenario_hedge("slow request hedged"),
+    scenario_early_return("returned when the JSON object closes"),
+    scenario_deadline("stall cut at the run deadline", ["stall_first"] * 4, first_event_timeout=10),
+    scenario_deadline("retries stop at the run deadline", ["stall_first"] * 4, first_event_timeout=0.15),
+    scenario_concurrency("concurrency limit", 4, 16, 0),
+    scenario_concurrency("concurrency limit with throttling", 4, 16, 3),
+    scenario_guardrail("guardrail retried"),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--slow-ms", type=float, default=400, help="Delay of the first event of a slow request")
+    parser.add_argument("--hedge-after-ms", type=float, default=100, help="Hedging threshold of the hedging scenario")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.ERROR)
+    failures = 0
+    for name, run in SCENARIOS:
+        start = time.monotonic()
+        try:
+            ok, details = run(args)
+        except Exception as e:
+            ok, details = False, f"unexpected {type(e).__name__}: {e}"
+        failures += not ok
+        print(f"{'PASS' if ok else 'FAIL'} {name:<36} {(time.monotonic() - start) * 1000:7.0f} ms  {details}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Chunked analysis of a plan larger than the model input limit, ai.eval with the map and staged reduce steps.
+
+The plan of --resources S3 buckets is analyzed with CHUNK_TOKEN_LIMIT set to --token-limit, so it is split into
+chunks, against ChunkedBedrock, a bedrock-runtime stand-in answering:
+- chunk analyses with one finding per resource and an impact analysis of --impact-chars, the chunks holding one
+  of the --failed-resources buckets are rejected with a ValidationException
+- merges of partial analyses with an impact analysis of --impact-chars
+- every other request with a short plan summary
+
+The script exits with status 1 when a merge request exceeds the token limit, when the failed resources are not
+named in the impact analysis, when that outcome is not tagged as incomplete or when the results would be cached.
+Without failed resources, the outcome must be tagged as passed and the results cacheable.
+
+Usage:
+    python3 benchmarks/chunked_analysis.py [--resources 600] [--token-limit 1500] [--failed-resources 3]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import re
+import sys
+import threading
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--resources", type=int, default=600, help="S3 buckets of the plan")
+    parser.add_argument("--token-limit", type=int, default=1500, help="Input token limit of the model")
+    parser.add_argument("--impact-chars", type=int, default=2000, help="Impact analysis size of each response")
+    parser.add_argument("--failed-resources", type=int, default=3, help="Buckets whose chunk analysis fails")
+    return parser.parse_args()
+
+
+args = parse_args()
+os.environ.update(
+    AWS_DEFAULT_REGION=os.environ.get("AWS_DEFAULT_REGION", "us-east-1"),
+    BEDROCK_LLM_MODEL="chunked-model",
+    CHUNK_TOKEN_LIMIT=str(args.token_limit),
+    WORKSPACE_STORE_BACKEND="none",
+    RESULT_CACHE_BACKEND="none",
+)
+os.environ.pop("BEDROCK_GUARDRAIL_ID", None)
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "lambda", "runtask_fulfillment"))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "lambda", "shared"))
+
+import ai  # noqa: E402
+import plan_reducer  # noqa: E402
+import result_cache  # noqa: E402
+import runtask_utils  # noqa: E402
+from botocore.exceptions import ClientError  # noqa: E402
+from unittest import mock  # noqa: E402
+
+ADDRESS = re.compile(r"aws_s3_bucket\.bucket_\d+")
+
+
+class ChunkedBedrock:
+    """bedrock-runtime stand-in of the chunked analysis, see the module documentation"""
+
+    def __init__(self, failed_addresses, impact_chars):
+        self.failed_addresses = set(failed_addresses)
+        self.impact_chars = impact_chars
+        self.lock = threading.Lock()
+        self.merge_tokens = []
+        self.chunk_calls = 0
+
+    def converse_stream(self, modelId, messages, system, inferenceConfig, toolConfig=None):
+        text = "".join(block.get("text", "") for block in messages[0]["content"])
+        impact = ("Impact of the changes. " * (self.impact_chars // 23 + 1))[:self.impact_chars]
+        if "Merge the partial analyses" in text:
+            with self.lock:
+                self.merge_tokens.append(plan_reducer.estimate_tokens(text))
+            answer = json.dumps({"thinking": "merged", "resources": "merged resources", "impact_analysis": impact})
+        elif "Analyze the terraform plan above" in text:
+            addresses = sorted(set(ADDRESS.findall(text)))
+            with self.lock:
+                self.chunk_calls += 1
+            if self.failed_addresses.intersection(addresses):
+                raise ClientError({"Error": {"Code": "ValidationException", "Message": "Rejected chunk"}}, "ConverseStream")
+            answer = json.dumps({
+                "thinking": "chunk",
+                "resources": ", ".join(addresses),
+                "findings": {address: "Bucket created" for address in addresses},
+                "impact_analysis": impact,
+            })
+        else:
+            answer = "Plan summary"
+        return {"stream": [
+            {"messageStart": {"role": "assistant"}},
+            {"contentBlockDelta": {"delta": {"text": answer}, "contentBlockIndex": 0}},
+            {"contentBlockStop": {"contentBlockIndex": 0}},
+            {"messageStop": {"stopReason": "end_turn"}},
+            {"metadata": {"usage": {"inputTokens": 1, "outputTokens": 1, "totalTokens": 2}, "metrics": {"latencyMs": 1}}},
+        ]}
+
+
+def build_resource_changes(count):
+    return [
+        {
+            "address": f"aws_s3_bucket.bucket_{index}",
+            "type": "aws_s3_bucket",
+            "actions": ["create"],
+            "after": {"bucket": f"benchmark-bucket-{index}", "tags": {"team": "platform", "index": str(index)}},
+        }
+        for index in range(count)
+    ]
+
+
+def main():
+    logging.getLogger().setLevel(logging.CRITICAL)
+    resource_changes = build_resource_changes(args.resources)
+    step = max(1, args.resources // max(1, args.failed_resources))
+    failed = [f"aws_s3_bucket.bucket_{index}" for index in range(0, args.resources, step)][:args.failed_resources]
+    bedrock = ChunkedBedrock(failed, args.impact_chars)
+
+    with mock.patch.object(ai, "bedrock_client", bedrock):
+        # The usage metrics are printed as EMF documents on stdout
+        with contextlib.redirect_stdout(io.StringIO()):
+            message, results = ai.eval(None, resource_changes=resource_changes)
+
+    impact = next(result for result in results if result["attributes"]["outcome-id"] == "Impact-Analysis")
+    labels = [tag["label"] for tag in impact["attributes"]["tags"]["status"]]
+    checks = {
+        "merge requests within the token limit": bool(bedrock.merge_tokens) and max(bedrock.merge_tokens) <= args.token_limit,
+        "failed resources named": all(address in impact["attributes"]["body"] for address in failed),
+        "impact analysis tag": labels == [runtask_utils.INCOMPLETE_LABEL if failed else "Passed"],
+        "run task message": ("analysis failed" in message) == bool(failed),
+        "results cached only when complete": result_cache.is_cacheable(results) != bool(failed),
+    }
+
+    print(
+        f"resources: {args.resources}, token limit: {args.token_limit}, chunk analyses: {bedrock.chunk_calls}, "
+        f"failed resources: {len(failed)}"
+    )
+    print(f"merge requests: {len(bedrock.merge_tokens)}, largest: {max(bedrock.merge_tokens, default=0)} tokens")
+    failures = 0
+    for name, ok in checks.items():
+        failures += not ok
+        print(f"{'PASS' if ok else 'FAIL'} {name}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""
+Step Functions state size and serialization cost of the fulfillment results, inline and with the claim check.
+
+The fulfillment Lambda, handler.lambda_handler, runs on a synthetic plan from benchmarks/plan_generator.py with
+the analysis replaced by --outcomes outcomes of --body-kb each, and by the outcomes of the analysis at its caps
+(9000 characters of description and impact, 700 of AMI summary) written in non ASCII text. Each case runs once with
+the results inline in the state and once with the filesystem claim check backend and its default budget. The state
+built by runtask_states.asl.json is serialized for each transition from the fulfillment to the end of the execution,
+then the callback Lambda rehydrates it and the PATCH bodies sent to HCP Terraform by both modes are compared.
+
+The script exits with status 1 when the PATCH bodies differ, when the claim check leaves a state above the Step
+Functions limit, or when it offloads results whose inline state fits its budget.
+
+Usage:
+    python3 benchmarks/claim_check.py [--body-kb 1,16,64,128] [--outcomes 3] [--resources 500] [--reserve-kb 16]
+"""
+
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from unittest import mock
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.update(
+    BEDROCK_LLM_MODEL="benchmark-model",
+    RESULT_CACHE_BACKEND="none",
+    WORKSPACE_STORE_BACKEND="none",
+    IDEMPOTENCY_BACKEND="none",
+    log_level="WARNING",
+)
+os.environ.pop("CW_LOG_GROUP_NAME", None)
+sys.path.insert(0, BENCHMARK_DIR)
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "lambda", "runtask_fulfillment"))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "lambda", "shared"))
+
+import claim_check  # noqa: E402
+import handler  # noqa: E402
+import plan_generator  # noqa: E402
+import runtask_utils  # noqa: E402
+
+_spec = importlib.util.spec_from_file_location(
+    "callback_handler", os.path.join(BENCHMARK_DIR, "..", "lambda", "runtask_callback", "handler.py")
+)
+callback_handler = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(callback_handler)
+
+STATE_LIMIT_BYTES = claim_check.STATE_LIMIT_BYTES
+# Caps of the outcome bodies written by ai.eval
+CAPPED_BODIES = {"Description": 9000, "Impact": 9000, "AMI summary": 700}
+# Serializations of the state from the fulfillment output to the end of the execution
+TRANSITIONS = ["runtask_fulfillment", "runtask_callback", "success"]
+
+
+def build_detail(run_id):
+    return {
+        "payload_version": 1,
+        "access_token": "benchmark-token",
+        "organization_name": "benchmark",
+        "workspace_id": "ws-benchmark",
+        "run_id": run_id,
+        "stage": "post_plan",
+        "task_result_id": f"taskrs-{run_id}",
+        "task_result_callback_url": f"https://app.terraform.io/api/v2/task-results/taskrs-{run_id}/callback",
+        "plan_json_api_url": "https://app.terraform.io/api/v2/plans/plan-benchmark/json-output",
+    }
+
+
+def build_results(outcomes, body_kb):
+    return [
+        runtask_utils.generate_runtask_result(
+            outcome_id=f"Outcome-{index}",
+            description=f"Benchmark outcome {index}",
+            result=("| resource | finding |<br>" * (body_kb * 1024 // 26 + 1))[: body_kb * 1024],
+        )
+        for index in range(outcomes)
+    ]
+
+
+def build_capped_results():
+    # Escaped as \uXXXX in the state, six bytes per character
+    text = "リソース変更の分析結果。"
+    return [
+        runtask_utils.generate_runtask_result(
+            outcome_id=f"Outcome-{index}",
+            description=name,
+            result=(text * (size // len(text) + 1))[:size],
+        )
+        for index, (name, size) in enumerate(CAPPED_BODIES.items())
+    ]
+
+
+def run_fulfillment(detail, plan, results, store):
+    """State of the execution after the runtask_fulfillment ResultSelector"""
+    state = {
+        "detail": detail,
+        "result": {
+            "request": {"status": "verified", "raw": {"StatusCode": 200, "ExecutedVersion": "$LATEST", "Payload": "verified"}},
+            "stage": {"status": "implemented"},
+        },
+    }
+    event = {"job_name": f"execution-{detail['run_id']}", "payload": state, "action": "fulfillment"}
+    with mock.patch.object(claim_check, "get_store", lambda: store), \
+            mock.patch.object(runtask_utils, "get_plan", lambda *args: (plan, None)), \
+            mock.patch.object(handler, "process_run_task", lambda **_: (None, "passed", "Benchmark analysis", list(results))):
+        response = handler.lambda_handler(event, None)
+    state["result"]["fulfillment"] = {key: response[key] for key in ("status", "message", "url", "results", "claim_check")}
+    return state
+
+
+def run_callback(state, store):
+    """PATCH body sent to HCP Terraform and the time spent in the callback Lambda"""
+    sent = []
+    event = {"payload": json.loads(json.dumps(state)), "action": "callback"}
+    start = time.perf_counter()
+    with mock.patch.object(claim_check, "get_store", lambda: store), \
+            mock.patch.object(callback_handler, "__patch", lambda endpoint, headers, body, context: sent.append(body)):
+        callback_handler.lambda_handler(event, None)
+    return sent[0], (time.perf_counter() - start) * 1000
+
+
+def serialization_ms(state, repeat):
+    """Median time of the state serializations of the remaining transitions, in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in TRANSITIONS:
+            json.loads(json.dumps(state))
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--body-kb", default="1,16,64,128", help="Comma separated outcome body sizes in KB")
+    parser.add_argument("--outcomes", type=int, default=3, help="Outcomes in the results")
+    parser.add_argument("--resources", type=int, default=500, help="Resource changes of the synthetic plan")
+    parser.add_argument("--reserve-kb", type=int, default=16, help="Claim check reserve below the state limit")
+    parser.add_argument("--repeat", type=int, default=50, help="Serializations per case")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.CRITICAL)
+    plan = plan_generator.generate_plan(args.resources)
+    directory = tempfile.mkdtemp(prefix="runtask-claim-check-")
+    modes = {
+        "inline": claim_check.ClaimCheckStore(None),
+        "claim check": claim_check.ClaimCheckStore(
+            claim_check.FilesystemBackend(directory), reserve_bytes=args.reserve_kb * 1024
+        ),
+    }
+    cases = {f"{size} KB": build_results(args.outcomes, int(size)) for size in args.body_kb.split(",")}
+    cases["capped"] = build_capped_results()
+
+    failures = 0
+    print(f"plan: {args.resources} resources, claim check objects in {directory}")
+    print(f"budget: {modes['claim check'].budget_bytes / 1024:.0f} KB of the {STATE_LIMIT_BYTES / 1024:.0f} KB state limit")
+    print(
+        f"{'case':>8} {'mode':>11} {'state KB':>8} {'limit':>5} {'offloaded':>9} {'transitions ms':>14} "
+        f"{'callback ms':>11} {'patch':>5}"
+    )
+    for case, results in cases.items():
+        bodies = {}
+        for mode, store in modes.items():
+            state = run_fulfillment(build_detail(f"run-{case.replace(' ', '-')}"), plan, results, store)
+            state_bytes = len(json.dumps(state))
+            offloaded = state["result"]["fulfillment"]["claim_check"] is not None
+            bodies[mode], callback_ms = run_callback(state, store)
+            same = bodies[mode] == bodies["inline"]
+            if mode == "inline":
+                inline_over_budget = state_bytes > modes["claim check"].budget_bytes
+                ok = same
+            else:
+                ok = same and state_bytes <= STATE_LIMIT_BYTES and offloaded == inline_over_budget
+            failures += not ok
+            print(
+                f"{case:>8} {mode:>11} {state_bytes / 1024:>8.1f} {'over' if state_bytes > STATE_LIMIT_BYTES else 'ok':>5} "
+                f"{'yes' if offloaded else 'no':>9} {serialization_ms(state, args.repeat):>14.3f} {callback_ms:>11.2f} "
+                f"{'same' if same else 'DIFF':>5}{'' if ok else '  FAIL'}"
+            )
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
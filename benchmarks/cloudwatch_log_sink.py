@@ -0,0 +1,72 @@
+"""
+CloudWatch Logs calls and latency of writing the run task results, one call per message versus the buffered sink.
+
+Uses the in-memory LocalLogsClient from lambda/runtask_fulfillment/log_sink.py with a fixed latency per call.
+
+Usage:
+    python3 benchmarks/cloudwatch_log_sink.py [--outcomes 3] [--body-kb 9] [--latency-ms 20]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda", "runtask_fulfillment"))
+
+from log_sink import LocalLogsClient, RunTaskLogSink  # noqa: E402
+
+
+def legacy_write(cwl_client, log_group_name, log_stream_name, messages):
+    """Previous implementation, one PutLogEvents call per message and a CreateLogStream on the first failure"""
+    sequence_token = None
+    for message in messages:
+        event = {"timestamp": int(round(time.time() * 1000)), "message": time.strftime("%Y-%m-%d %H:%M:%S") + ": " + message}
+        try:
+            if sequence_token is None:
+                raise NameError("SEQUENCE_TOKEN")
+            response = cwl_client.put_log_events(
+                logGroupName=log_group_name, logStreamName=log_stream_name, logEvents=[event], sequenceToken=sequence_token
+            )
+        except Exception:
+            cwl_client.create_log_stream(logGroupName=log_group_name, logStreamName=log_stream_name)
+            response = cwl_client.put_log_events(logGroupName=log_group_name, logStreamName=log_stream_name, logEvents=[event])
+        sequence_token = response["nextSequenceToken"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--outcomes", type=int, default=3, help="Run task outcomes, each writes a description and a body")
+    parser.add_argument("--body-kb", type=int, default=9, help="Size of each outcome body in KB")
+    parser.add_argument("--latency-ms", type=float, default=20, help="Simulated latency per CloudWatch Logs call")
+    args = parser.parse_args()
+
+    messages = []
+    for index in range(args.outcomes):
+        messages.append(f"Outcome {index}")
+        messages.append("x" * args.body_kb * 1024)
+
+    print(f"outcomes: {args.outcomes}, body: {args.body_kb} KB, latency per call: {args.latency_ms} ms")
+    for name in ["per message", "buffered sink"]:
+        client = LocalLogsClient(latency_seconds=args.latency_ms / 1000)
+        error = ""
+        start = time.perf_counter()
+        if name == "per message":
+            try:
+                legacy_write(client, "/runtask", "run-1", messages)
+            except Exception as e:
+                # Messages above the event size quota fail the previous implementation
+                error = f", failed: {e}"
+        else:
+            sink = RunTaskLogSink(client, "/runtask", "run-1")
+            for message in messages:
+                sink.write(message)
+            sink.flush()
+        elapsed = time.perf_counter() - start
+        events = len(client.streams.get(("/runtask", "run-1"), []))
+        print(f"{name:>14}: {elapsed * 1000:8.1f} ms, calls {client.calls}, events {events}{error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Duplicate delivery scenarios for the idempotent webhook ingress, runtask_eventbridge.lambda_handler, and the
+completion recorded by runtask_callback.lambda_handler.
+
+Signed run task requests are delivered again like HCP Terraform does when a delivery times out, sequentially and
+concurrently, against each idempotency backend:
+- memory and disk: the backends of a single container
+- dynamodb: kv_store.DynamoDBBackend over kv_store.LocalDynamoDBTable, an in-memory table evaluating the
+  conditional put like DynamoDB does
+
+The Secrets Manager cache, EventBridge and the HCP Terraform callback endpoint are stubbed. Every scenario counts the
+events forwarded to EventBridge, the script exits with status 1 when a scenario does not behave as expected.
+
+Usage:
+    python3 benchmarks/duplicate_deliveries.py [--deliveries 8]
+"""
+
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARK_DIR)
+
+import eventbridge_ingress  # noqa: E402  sets up the runtask_eventbridge import paths
+import handler  # noqa: E402
+import idempotency  # noqa: E402
+import kv_store  # noqa: E402
+
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "lambda", "runtask_callback"))
+_spec = importlib.util.spec_from_file_location(
+    "callback_handler", os.path.join(BENCHMARK_DIR, "..", "lambda", "runtask_callback", "handler.py")
+)
+callback_handler = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(callback_handler)
+
+
+class CountingEventBridge:
+    """EventBridge stand-in counting the forwarded events, the first `failures` calls report a failed entry"""
+
+    def __init__(self, failures=0, delay=0.0):
+        self.failures = failures
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.forwarded = 0
+
+    def put_events(self, Entries):
+        time.sleep(self.delay)
+        with self.lock:
+            self.calls += 1
+            if self.calls <= self.failures:
+                return {"FailedEntryCount": 1, "Entries": [{"ErrorCode": "InternalFailure"}]}
+            self.forwarded += 1
+        return {"FailedEntryCount": 0, "Entries": [{"EventId": str(self.calls)}]}
+
+
+class FailingBackend:
+    def put_if_absent(self, key, value, expires_at):
+        raise ConnectionError("backend unreachable")
+
+    put = delete = put_if_absent
+
+
+def new_backend(name):
+    if name == "memory":
+        return kv_store.MemoryBackend()
+    if name == "disk":
+        return kv_store.DiskBackend(directory=tempfile.mkdtemp(prefix="runtask-idempotency-"))
+    return kv_store.DynamoDBBackend(kv_store.LocalDynamoDBTable(key_name="idempotency_key"), key_name="idempotency_key")
+
+
+def run_task_payload(run_id="run-duplicate", **overrides):
+    payload = json.loads(eventbridge_ingress.build_payload(1))
+    payload.update(
+        run_id=run_id,
+        task_result_id=f"taskrs-{run_id}",
+        task_result_callback_url=f"https://app.terraform.io/api/v2/task-results/taskrs-{run_id}/callback",
+    )
+    payload.update(overrides)
+    return {key: value for key, value in payload.items() if value is not None}
+
+
+def deliver(payload, encoding="json"):
+    return handler.lambda_handler(eventbridge_ingress.build_event(json.dumps(payload), encoding), None)
+
+
+def callback(payload):
+    event = {
+        "payload": {
+            "detail": payload,
+            "result": {
+                "request": {"status": "verified"},
+                "stage": {"status": "implemented"},
+                "fulfillment": {"status": "passed", "message": "ok", "url": False, "results": []},
+            },
+        }
+    }
+    with mock.patch.object(callback_handler, "__patch", lambda *args: (b"", None)):
+        return callback_handler.lambda_handler(event, None)
+
+
+def scenario(name, backend_name=None, **store_options):
+    """Runs the decorated check with a fresh store over the backend and a counting EventBridge stand-in"""
+    def decorator(check):
+        def run(args):
+            backend = FailingBackend() if backend_name == "failing" else new_backend(backend_name)
+            options = dict(store_options)
+            bridge = CountingEventBridge(**options.pop("bridge", {}))
+            store = idempotency.IdempotencyStore(backend, **options)
+            with mock.patch.object(idempotency, "get_store", lambda: store), mock.patch.object(handler, "event_bridge_client", bridge):
+                return check(args, bridge)
+        return f"{name} ({backend_name})", run
+    return decorator
+
+
+def sequential(backend_name):
+    @scenario("sequential redeliveries", backend_name)
+    def check(args, bridge):
+        payload = run_task_payload()
+        bodies = [deliver(payload, encoding)["body"] for encoding in eventbridge_ingress.ENCODINGS * 2]
+        duplicates = sum(body.startswith("Duplicate") for body in bodies)
+        return bridge.forwarded == 1 and duplicates == len(bodies) - 1, f"forwarded={bridge.forwarded} duplicates={duplicates}"
+    return check
+
+
+def concurrent(backend_name):
+    @scenario("concurrent redeliveries", backend_name, bridge={"delay": 0.02})
+    def check(args, bridge):
+        payload = run_task_payload()
+        with ThreadPoolExecutor(max_workers=args.deliveries) as executor:
+            statuses = list(executor.map(lambda _: deliver(payload)["statusCode"], range(args.deliveries)))
+        return bridge.forwarded == 1 and statuses == [200] * args.deliveries, f"deliveries={args.deliveries} forwarded={bridge.forwarded}"
+    return check
+
+
+def released(backend_name):
+    @scenario("failed forward is released", backend_name, bridge={"failures": 1})
+    def check(args, bridge):
+        payload = run_task_payload()
+        statuses = [deliver(payload)["statusCode"] for _ in range(3)]
+        return bridge.forwarded == 1 and statuses == [500, 200, 200], f"statuses={statuses} forwarded={bridge.forwarded}"
+    return check
+
+
+def completed(backend_name):
+    @scenario("redelivery after the callback", backend_name)
+    def check(args, bridge):
+        payload = run_task_payload()
+        deliver(payload)
+        callback(payload)
+        body = deliver(payload)["body"]
+        return bridge.forwarded == 1 and body.endswith(idempotency.COMPLETED), f"forwarded={bridge.forwarded} body={body!r}"
+    return check
+
+
+def expired(backend_name):
+    # DynamoDB stores the expiry in whole seconds
+    @scenario("in flight key expired", backend_name, in_flight_ttl=1)
+    def check(args, bridge):
+        payload = run_task_payload()
+        deliver(payload)
+        time.sleep(2)
+        deliver(payload)
+        return bridge.forwarded == 2, f"forwarded={bridge.forwarded}"
+    return check
+
+
+@scenario("distinct stages and runs", "memory")
+def distinct(args, bridge):
+    for payload in (run_task_payload(), run_task_payload(stage="pre_plan"), run_task_payload("run-other")):
+        deliver(payload)
+    return bridge.forwarded == 3, f"forwarded={bridge.forwarded}"
+
+
+@scenario("key from the callback url", "memory")
+def callback_url(args, bridge):
+    payload = run_task_payload(task_result_id=None)
+    deliver(payload)
+    deliver(payload)
+    return bridge.forwarded == 1, f"key={idempotency.build_key(payload)} forwarded={bridge.forwarded}"
+
+
+@scenario("verification request without key", "memory")
+def verification(args, bridge):
+    payload = run_task_payload(run_id=None, task_result_id=None, task_result_callback_url=None)
+    deliver(payload)
+    deliver(payload)
+    return bridge.forwarded == 2, f"forwarded={bridge.forwarded}"
+
+
+@scenario("test-token verification request", "dynamodb")
+def placeholder_verification(args, bridge):
+    # The run task setup sends its verification requests with the same placeholder run and task result ids
+    payload = run_task_payload(run_id="run-xxxxxxxxxxxxxxxx", access_token="test-token")
+    deliver(payload)
+    deliver(payload)
+    return bridge.forwarded == 2, f"key={idempotency.build_key(payload)} forwarded={bridge.forwarded}"
+
+
+@scenario("backend errors fail open", "failing")
+def fail_open(args, bridge):
+    payload = run_task_payload()
+    statuses = [deliver(payload)["statusCode"] for _ in range(2)]
+    return bridge.forwarded == 2 and statuses == [200, 200], f"forwarded={bridge.forwarded}"
+
+
+BACKENDS = ["memory", "disk", "dynamodb"]
+SCENARIOS = (
+    [sequential(name) for name in BACKENDS]
+    + [concurrent(name) for name in BACKENDS]
+    + [released(name) for name in BACKENDS]
+    + [completed(name) for name in BACKENDS]
+    + [expired(name) for name in BACKENDS]
+    + [distinct, callback_url, verification, placeholder_verification, fail_open]
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--deliveries", type=int, default=8, help="Concurrent deliveries of the concurrent scenarios")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.CRITICAL)
+    failures = 0
+    with mock.patch.object(handler, "cache", eventbridge_ingress.StubSecretCache()):
+        for name, run in SCENARIOS:
+            start = time.monotonic()
+            try:
+                ok, details = run(args)
+            except Exception as e:
+                ok, details = False, f"unexpected {type(e).__name__}: {e}"
+            failures += not ok
+            print(f"{'PASS' if ok else 'FAIL'} {name:<48} {(time.monotonic() - start) * 1000:7.0f} ms  {details}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""
+Offline end-to-end latency of the fulfillment Lambda, handler.lambda_handler driven with every endpoint stubbed.
+
+- Bedrock: converse_stream replays the Converse stream events in benchmarks/fixtures/bedrock_converse_streams.json
+  (text, toolUse and metadata events) with a configurable time to first token and output tokens per second,
+  apply_guardrail answers after a configurable latency.
+- HCP Terraform serves a generated plan, EC2 describe_images and the GitHub releases API answer from the
+  fixtures, CloudWatch Logs is the LocalLogsClient of log_sink.py. Each stub adds its own latency.
+
+The report lists p50/p95/p99 per handler step and per ai.eval stage, in milliseconds.
+
+Usage:
+    python3 benchmarks/e2e_latency.py [--invocations 20] [--ttft-ms 600] [--tokens-per-second 80] [--ami-tool-use]
+"""
+
+import argparse
+import contextlib
+import functools
+import io
+import json
+import logging
+import os
+import sys
+import time
+from unittest import mock
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(BENCHMARK_DIR, "fixtures")
+
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.update(
+    BEDROCK_LLM_MODEL="replay-model",
+    BEDROCK_GUARDRAIL_ID="replay-guardrail",
+    BEDROCK_GUARDRAIL_VERSION="1",
+    CW_LOG_GROUP_NAME="/benchmark/runtask",
+    RESULT_CACHE_BACKEND="none",
+    WORKSPACE_STORE_BACKEND="none",
+    log_level="WARNING",
+)
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "lambda", "runtask_fulfillment"))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "lambda", "shared"))
+
+import ai  # noqa: E402
+import handler  # noqa: E402
+import hcp_client  # noqa: E402
+import result_cache  # noqa: E402
+import runtask_utils  # noqa: E402
+import scheduler  # noqa: E402
+from log_sink import LocalLogsClient  # noqa: E402
+from tools import ami_release_index, get_ami_releases  # noqa: E402
+
+OLD_AMI_ID = "ami-0123456789abcdef0"
+NEW_AMI_ID = "ami-0fedcba9876543210"
+EXTRA_AMI_ID = "ami-0aaaaaaaaaaaaaaa1"
+
+
+class ReplayEventStream:
+    """Iterates recorded Converse stream events, pacing the deltas like a model would generate them"""
+
+    def __init__(self, events, ttft_seconds, tokens_per_second):
+        self.events = events
+        self.ttft_seconds = ttft_seconds
+        self.tokens_per_second = tokens_per_second
+        self.closed = False
+
+    def __iter__(self):
+        first_delta = True
+        for event in self.events:
+            if self.closed:
+                return
+            if "contentBlockDelta" in event:
+                delta = event["contentBlockDelta"]["delta"]
+                if first_delta:
+                    time.sleep(self.ttft_seconds)
+                    first_delta = False
+                text = delta.get("text") or delta.get("toolUse", {}).get("input", "")
+                time.sleep(max(1, len(text) // 4) / self.tokens_per_second)
+            yield event
+
+    def close(self):
+        self.closed = True
+
+
+class ReplayBedrockRuntime:
+    """bedrock-runtime stand-in, each stage replays its recorded responses in order within one invocation"""
+
+    def __init__(self, recordings, ttft_ms, tokens_per_second, guardrail_ms, ami_tool_use=False):
+        self.recordings = recordings
+        self.ttft_seconds = ttft_ms / 1000
+        self.tokens_per_second = tokens_per_second
+        self.guardrail_seconds = guardrail_ms / 1000
+        self.ami_recording = "ami_tool_use" if ami_tool_use else "ami"
+        self.calls = {}
+
+    def reset(self):
+        self.calls = {}
+
+    def converse_stream(self, modelId, messages, system, inferenceConfig, toolConfig=None):
+        if "AMI" in system[0]["text"]:
+            stage = self.ami_recording
+        elif "summary" in messages[0]["content"][-1]["text"]:
+            stage = "summary"
+        else:
+            stage = "analysis"
+        index = self.calls.get(stage, 0)
+        self.calls[stage] = index + 1
+        responses = self.recordings[stage]
+        events = responses[min(index, len(responses) - 1)]
+        return {"stream": ReplayEventStream(events, self.ttft_seconds, self.tokens_per_second)}
+
+    def apply_guardrail(self, guardrailIdentifier, guardrailVersion, source, content):
+        time.sleep(self.guardrail_seconds)
+        return {"action": "NONE", "outputs": [], "assessments": []}
+
+
+class StubHCPClient:
+    """Serves the plan JSON for any HCP Terraform request"""
+
+    def __init__(self, plan_bytes, latency_ms):
+        self.plan_bytes = plan_bytes
+        self.latency_seconds = latency_ms / 1000
+
+    def request(self, method, url, headers=None, body=None, timeout=30, deadline=None):
+        time.sleep(self.latency_seconds)
+        return StubHCPResponse(self.plan_bytes)
+
+
+class StubHCPResponse(io.BytesIO):
+    status = 200
+    headers = {"Content-Type": "application/json"}
+
+
+class StubEC2:
+    """describe_images paginator answering from a fixed AMI id to name map"""
+
+    def __init__(self, ami_names, latency_ms):
+        self.ami_names = ami_names
+        self.latency_seconds = latency_ms / 1000
+
+    def get_paginator(self, operation_name):
+        return self
+
+    def paginate(self, Filters, **_):
+        time.sleep(self.latency_seconds)
+        ids = Filters[0]["Values"]
+        yield {"Images": [{"ImageId": ami_id, "Name": self.ami_names[ami_id]} for ami_id in ids if ami_id in self.ami_names]}
+
+
+class StubGitHub:
+    """requests module stand-in serving the recorded releases page"""
+
+    def __init__(self, releases, latency_ms):
+        self.releases = releases
+        self.latency_seconds = latency_ms / 1000
+
+    def get(self, url, headers=None, timeout=None, **_):
+        time.sleep(self.latency_seconds)
+        return StubGitHubResponse(self.releases)
+
+
+class StubGitHubResponse:
+    status_code = 200
+    headers = {"ETag": '"replay"'}
+
+    def __init__(self, releases):
+        self.releases = releases
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.releases
+
+
+class StubContext:
+    def get_remaining_time_in_millis(self):
+        return 900000
+
+
+def build_plan(resource_count):
+    """Plan with one ECS launch template AMI update, its auto scaling group and resource_count S3 buckets"""
+    resource_changes = [
+        {
+            "address": "module.ecs.aws_launch_template.ecs",
+            "module_address": "module.ecs",
+            "type": "aws_launch_template",
+            "change": {
+                "actions": ["update"],
+                "before": {"image_id": OLD_AMI_ID, "instance_type": "m6i.large", "latest_version": 3},
+                "after": {"image_id": NEW_AMI_ID, "instance_type": "m6i.large"},
+                "after_unknown": {"latest_version": True},
+            },
+        },
+        {
+            "address": "module.ecs.aws_autoscaling_group.ecs",
+            "module_address": "module.ecs",
+            "type": "aws_autoscaling_group",
+            "change": {
+                "actions": ["update"],
+                "before": {"launch_template": [{"version": "3"}]},
+                "after": {"launch_template": [{}]},
+                "after_unknown": {"launch_template": [{"version": True}]},
+            },
+        },
+    ]
+    for index in range(resource_count):
+        resource_changes.append({
+            "address": f"aws_s3_bucket.artifacts[{index}]",
+            "type": "aws_s3_bucket",
+            "change": {
+                "actions": ["create"],
+                "before": None,
+                "after": {"bucket": f"artifacts-{index}", "force_destroy": False, "tags": {"team": "platform"}},
+                "after_unknown": {"arn": True, "id": True},
+            },
+        })
+    return {"format_version": "1.2", "terraform_version": "1.9.0", "resource_changes": resource_changes}
+
+
+def build_event(run_id):
+    return {
+        "payload": {
+            "detail": {
+                "access_token": "replay-token",
+                "organization_name": "benchmark",
+                "workspace_id": "ws-benchmark",
+                "run_id": run_id,
+                "task_result_callback_url": "https://app.terraform.io/api/v2/task-results/replay/callback",
+                "stage": "post_plan",
+                "plan_json_api_url": "https://app.terraform.io/api/v2/plans/plan-replay/json-output",
+            }
+        }
+    }
+
+
+def timed(timings, name, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            timings.setdefault(name, []).append((time.perf_counter() - start) * 1000)
+    return wrapper
+
+
+def percentile(values, percent):
+    # Nearest rank percentile
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, int(round(percent / 100 * len(ordered) + 0.5)) - 1))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--invocations", type=int, default=20, help="Number of lambda_handler invocations")
+    parser.add_argument("--resources", type=int, default=20, help="S3 buckets added to the plan next to the AMI change")
+    parser.add_argument("--ttft-ms", type=float, default=600, help="Bedrock time to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=80, help="Bedrock output tokens per second")
+    parser.add_argument("--guardrail-ms", type=float, default=250, help="apply_guardrail latency")
+    parser.add_argument("--hcp-ms", type=float, default=150, help="HCP Terraform plan download latency")
+    parser.add_argument("--ec2-ms", type=float, default=120, help="describe_images latency per page")
+    parser.add_argument("--github-ms", type=float, default=300, help="GitHub releases API latency")
+    parser.add_argument("--logs-ms", type=float, default=40, help="CloudWatch Logs latency per call")
+    parser.add_argument("--ami-tool-use", action="store_true", help="Replay an AMI response that calls the tool once more")
+    parser.add_argument("--snapshot", action="store_true", help="Use a packaged AMI release snapshot instead of GitHub")
+    parser.add_argument("--guardrail-cache", action="store_true", help="Keep guardrail verdicts of identical replayed texts")
+    args = parser.parse_args()
+
+    with open(os.path.join(FIXTURES_DIR, "bedrock_converse_streams.json"), encoding="utf-8") as file:
+        recordings = json.load(file)
+    with open(os.path.join(FIXTURES_DIR, "ecs_ami_releases.json"), encoding="utf-8") as file:
+        releases = json.load(file)
+
+    release_names = sorted(ami_release_index.build_release_index(releases)[0])
+    ami_names = {OLD_AMI_ID: release_names[0], NEW_AMI_ID: release_names[1], EXTRA_AMI_ID: release_names[2]}
+    plan_bytes = json.dumps(build_plan(args.resources)).encode("utf-8")
+
+    bedrock = ReplayBedrockRuntime(recordings, args.ttft_ms, args.tokens_per_second, args.guardrail_ms, args.ami_tool_use)
+    logs_client = LocalLogsClient(latency_seconds=args.logs_ms / 1000)
+    timings = {}
+
+    original_run = scheduler.StageScheduler.run
+
+    def run_stages(self):
+        try:
+            return original_run(self)
+        finally:
+            for name, elapsed_ms in self.timings.items():
+                timings.setdefault(f"stage {name}", []).append(elapsed_ms)
+
+    snapshot = False
+    if args.snapshot:
+        path = os.path.join(os.environ.get("TMPDIR", "/tmp"), "benchmark_ami_release_index.tsv")
+        ami_release_index.write_snapshot(path, ami_release_index.build_release_index(releases)[0], {})
+        snapshot = ami_release_index.ReleaseSnapshot(path)
+
+    # Every invocation replays the same texts, the verdict cache would otherwise skip all guardrail calls
+    guardrail_cache = ai.guardrail_cache if args.guardrail_cache else result_cache.ResultCache(None)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    with mock.patch.object(ai, "bedrock_client", bedrock), \
+            mock.patch.object(handler, "cwl_client", logs_client), \
+            mock.patch.object(hcp_client, "get_client", lambda: StubHCPClient(plan_bytes, args.hcp_ms)), \
+            mock.patch.object(get_ami_releases, "ec2_client", StubEC2(ami_names, args.ec2_ms)), \
+            mock.patch.object(get_ami_releases, "requests", StubGitHub(releases, args.github_ms)), \
+            mock.patch.object(ami_release_index, "_snapshot", snapshot), \
+            mock.patch.object(ai, "guardrail_cache", guardrail_cache), \
+            mock.patch.object(scheduler.StageScheduler, "run", run_stages), \
+            mock.patch.object(runtask_utils, "get_plan", timed(timings, "get_plan", runtask_utils.get_plan)), \
+            mock.patch.object(handler, "process_run_task", timed(timings, "process_run_task", handler.process_run_task)), \
+            mock.patch.object(handler, "write_run_task_log", timed(timings, "write_run_task_log", handler.write_run_task_log)):
+        lambda_handler = timed(timings, "lambda_handler", handler.lambda_handler)
+        for invocation in range(args.invocations):
+            bedrock.reset()
+            # The usage metrics are printed as EMF documents on stdout
+            with contextlib.redirect_stdout(io.StringIO()):
+                response = lambda_handler(build_event(f"run-replay-{invocation}"), StubContext())
+            if len(response["results"]) != 3:
+                raise RuntimeError(f"Unexpected run task response: {response}")
+
+    print(
+        f"invocations: {args.invocations}, resources: {args.resources + 2}, ttft: {args.ttft_ms} ms, "
+        f"tokens/s: {args.tokens_per_second}, guardrail: {args.guardrail_ms} ms"
+    )
+    print(f"{'step':>28} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for name, values in timings.items():
+        print(f"{name:>28} {percentile(values, 50):9.1f} {percentile(values, 95):9.1f} {percentile(values, 99):9.1f}")
+    print(f"CloudWatch Logs calls: {logs_client.calls}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Per request cost of the webhook ingress Lambda, runtask_eventbridge.lambda_handler, across payload sizes and encodings.
+
+Every case is a Lambda function URL event signed with HMAC-SHA512 like HCP Terraform does, with a JSON or a form
+urlencoded body, sent as is or base64 encoded. The Secrets Manager cache and the EventBridge client are stubbed.
+The previous pipeline (base64 decoded twice, JSON parsed before the signature is verified) is replayed inline for
+comparison, with the same stubs. Requests with an invalid signature show the cost of rejecting them.
+
+Usage:
+    python3 benchmarks/eventbridge_ingress.py [--sizes 1,16,256,1024] [--repeat 200]
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import sys
+import time
+import urllib.parse
+from unittest import mock
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "lambda", "runtask_eventbridge"))
+sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "lambda", "shared"))
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+import handler  # noqa: E402
+import idempotency  # noqa: E402
+
+SECRET = "benchmark-hmac-secret"
+ENCODINGS = ["json", "json+base64", "form", "form+base64"]
+
+
+class StubSecretCache:
+    def get_secret_string(self, secret_id):
+        return SECRET
+
+
+class StubEventBridge:
+    def put_events(self, Entries):
+        return {"FailedEntryCount": 0, "Entries": [{"EventId": "benchmark"}]}
+
+
+def build_payload(size_kb):
+    """Run task request payload padded to about size_kb"""
+    payload = {
+        "payload_version": 1,
+        "stage": "post_plan",
+        "access_token": "token",
+        "organization_name": "benchmark",
+        "workspace_id": "ws-benchmark",
+        "run_id": "run-benchmark",
+        "task_result_callback_url": "https://app.terraform.io/api/v2/task-results/benchmark/callback",
+        "plan_json_api_url": "https://app.terraform.io/api/v2/plans/plan-benchmark/json-output",
+        "run_message": "",
+    }
+    padding = max(0, size_kb * 1024 - len(json.dumps(payload)))
+    payload["run_message"] = "x" * padding
+    return json.dumps(payload)
+
+
+def build_event(payload, encoding, valid_signature=True):
+    if encoding.startswith("form"):
+        body = urllib.parse.urlencode({"payload": payload}).encode("utf-8")
+        content_type = "application/x-www-form-urlencoded"
+    else:
+        body = payload.encode("utf-8")
+        content_type = "application/json; charset=utf-8"
+    signature = hmac.new(SECRET.encode(), body if valid_signature else b"tampered", hashlib.sha512).hexdigest()
+    is_base64 = encoding.endswith("base64")
+    return {
+        "headers": {"content-type": content_type, "x-tfc-task-signature": signature},
+        "body": base64.b64encode(body).decode("ascii") if is_base64 else body.decode("utf-8"),
+        "isBase64Encoded": is_base64,
+    }
+
+
+def legacy_handler(event, _):
+    """Previous request pipeline, replayed with the same stubs"""
+    headers = event.get("headers")
+    content_type = headers["content-type"].split(";", 1)[0].strip()
+    if content_type not in handler.SUPPORTED_CONTENT_TYPES:
+        return {"statusCode": 400}
+    payload = event["body"]
+    if event["isBase64Encoded"]:
+        payload = base64.b64decode(payload).decode("utf-8")
+    if content_type == "application/x-www-form-urlencoded":
+        payload = urllib.parse.parse_qs(payload)["payload"][0]
+    try:
+        json.loads(payload)
+    except ValueError:
+        return {"statusCode": 400}
+
+    secret = handler.cache.get_secret_string(handler.hcp_tf_hmac_secret_arn)
+    payload_bytes = base64.b64decode(event["body"]) if event["isBase64Encoded"] else event["body"].encode()
+    if not hmac.compare_digest(headers["x-tfc-task-signature"], handler.compute_signature(payload_bytes, secret)):
+        return {"statusCode": 401}
+    handler.forward_event(payload, handler.event_rule_detail_type)
+    return {"statusCode": 200}
+
+
+def measure(func, event, repeat):
+    """Median per call time in microseconds and the status code"""
+    status = func(event, None)["statusCode"]
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(event, None)
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return samples[len(samples) // 2], status
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1,16,256,1024", help="Comma separated payload sizes in KB")
+    parser.add_argument("--repeat", type=int, default=200, help="Calls per case")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.CRITICAL)
+    print(f"{'size KB':>7} {'encoding':>12} {'signature':>9} {'legacy us':>10} {'status':>6} {'ingress us':>10} {'status':>6} {'speedup':>7}")
+    # Every case replays the same payload, without the idempotency store its repeats are forwarded again
+    with mock.patch.object(handler, "cache", StubSecretCache()), \
+            mock.patch.object(handler, "event_bridge_client", StubEventBridge()), \
+            mock.patch.object(idempotency, "get_store", lambda: idempotency.IdempotencyStore(None)):
+        for size_kb in [int(size) for size in args.sizes.split(",")]:
+            payload = build_payload(size_kb)
+            for encoding in ENCODINGS:
+                for valid_signature in (True, False):
+                    event = build_event(payload, encoding, valid_signature)
+                    legacy_us, legacy_status = measure(legacy_handler, event, args.repeat)
+                    ingress_us, ingress_status = measure(handler.lambda_handler, event, args.repeat)
+                    print(
+                        f"{size_kb:>7} {encoding:>12} {'valid' if valid_signature else 'invalid':>9} "
+                        f"{legacy_us:>10.1f} {legacy_status:>6} {ingress_us:>10.1f} {ingress_status:>6} "
+                        f"{legacy_us / ingress_us:>6.2f}x"
+                    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Cold start import cost of each Lambda handler, measured with `python -X importtime`.
+
+Every run imports the handler in a fresh interpreter, the same way the Lambda runtime does on a cold start.
+The report shows the median cumulative import time of the handler module and its heaviest direct imports.
+Use --json to keep the results and compare them between releases.
+The script exits with status 1 when a handler imports one of the COLD_START_EXCLUDED modules, the AWS SDK is
+only loaded by the lazy clients on first use.
+
+Usage:
+    python3 benchmarks/import_time.py [--repeat 5] [--handlers runtask_fulfillment,runtask_eventbridge] [--json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda")
+HANDLERS = ["runtask_eventbridge", "runtask_request", "runtask_fulfillment", "runtask_callback", "runtask_edge"]
+COLD_START_EXCLUDED = ("boto3", "botocore")
+
+
+def import_times(handler):
+    """Import the handler once, return {module: (self_us, cumulative_us, depth)} for the handler import tree"""
+    env = dict(os.environ)
+    env.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    env["PYTHONPATH"] = os.path.join(LAMBDA_DIR, "shared")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import handler"],
+        cwd=os.path.join(LAMBDA_DIR, handler), env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1])
+
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        if depth == 0 and name.strip() != "handler":
+            # Imported by the interpreter start up, not by the handler, lines are printed children first
+            modules = {}
+            continue
+        modules[name.strip()] = (int(self_us), int(cumulative_us), depth)
+        if depth == 0:
+            break
+    return modules
+
+
+def measure(handler, repeat, top):
+    runs = [import_times(handler) for _ in range(repeat)]
+    total_ms = statistics.median(run["handler"][1] for run in runs) / 1000
+    children = [name for name, (_, _, depth) in runs[0].items() if depth == 1]
+    heaviest = sorted(
+        ((name, statistics.median(run.get(name, (0, 0, 0))[1] for run in runs) / 1000) for name in children),
+        key=lambda item: item[1], reverse=True,
+    )[:top]
+    excluded = sorted(name for name in runs[0] if name.split(".")[0] in COLD_START_EXCLUDED)
+    return {
+        "handler": handler,
+        "import_ms": round(total_ms, 1),
+        "heaviest": [[name, round(ms, 1)] for name, ms in heaviest],
+        "excluded_imports": excluded,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreter runs per handler")
+    parser.add_argument("--handlers", default=",".join(HANDLERS), help="Comma separated handler directories")
+    parser.add_argument("--top", type=int, default=5, help="Heaviest direct imports to report")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    for handler in args.handlers.split(","):
+        try:
+            results.append(measure(handler, args.repeat, args.top))
+        except RuntimeError as e:
+            results.append({"handler": handler, "error": str(e)})
+
+    failures = sum(bool(result.get("excluded_imports")) for result in results)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        sys.exit(1 if failures else 0)
+    for result in results:
+        if "error" in result:
+            print(f"{result['handler']:>20}: failed, {result['error']}")
+            continue
+        heaviest = ", ".join(f"{name} {ms:.1f}" for name, ms in result["heaviest"])
+        print(f"{result['handler']:>20}: {result['import_ms']:8.1f} ms  ({heaviest})")
+        if result["excluded_imports"]:
+            print(f"{'':>20}  FAIL imported at cold start: {', '.join(result['excluded_imports'])}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Peak memory of loading a Terraform plan JSON, full json.loads versus the streaming key extractor.
+
+Each measurement runs in a fresh interpreter so the peak RSS of one run does not leak into the next.
+
+The single string cases hold one multi-MB string literal (a user_data, policy or prior_state blob), spanning
+many reads, in a skipped top level key and in a resource change value. The extractor time must stay linear in its
+length, the script exits with status 1 when it takes more than --max-ratio times json.loads plus a second.
+
+Usage:
+    python3 benchmarks/plan_download_memory.py [--sizes 100,1000,10000] [--string-mb 2,8,32]
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+FULFILLMENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "lambda", "runtask_fulfillment")
+
+
+def write_plan(path, resource_count):
+    # Plan shaped like the HCP Terraform JSON plan, the keys skipped by the extractor dominate its size
+    resources = [
+        {
+            "address": f"module.app_{index // 50}.aws_instance.web[{index}]",
+            "module_address": f"module.app_{index // 50}",
+            "type": "aws_instance",
+            "name": "web",
+            "provider_name": "registry.terraform.io/hashicorp/aws",
+            "change": {
+                "actions": ["update"],
+                "before": {"ami": "ami-0123456789abcdef0", "tags": {"Name": f"web-{index}"}, "user_data": "x" * 512},
+                "after": {"ami": "ami-0fedcba9876543210", "tags": {"Name": f"web-{index}"}, "user_data": "x" * 512},
+                "after_unknown": {},
+                "before_sensitive": {},
+                "after_sensitive": {},
+            },
+        }
+        for index in range(resource_count)
+    ]
+    values = {resource["address"]: resource["change"]["after"] for resource in resources}
+    plan = {
+        "format_version": "1.2",
+        "terraform_version": "1.9.0",
+        "planned_values": {"root_module": {"resources": list(values.values())}},
+        "resource_changes": resources,
+        "prior_state": {"values": {"root_module": {"resources": list(values.values())}}},
+        "configuration": {"root_module": {"resources": [{"address": address, "expressions": {}} for address in values]}},
+    }
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(plan, file)
+
+
+def write_string_plan(path, string_mb, location):
+    """Small plan with one string literal of string_mb MB, in prior_state or in a resource change"""
+    blob = "\\x" * (string_mb * 1024 * 1024 // 3)  # escapes exercise a backslash at the end of a read
+    change = {"actions": ["update"], "before": {"user_data": ""}, "after": {"user_data": ""}}
+    if location == "resource_changes":
+        change["after"]["user_data"] = blob
+    plan = {
+        "format_version": "1.2",
+        "prior_state": {"values": {"user_data": blob if location == "prior_state" else ""}},
+        "resource_changes": [{"address": "aws_instance.web", "type": "aws_instance", "name": "web", "change": change}],
+        "terraform_version": "1.9.0",
+    }
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(plan, file)
+
+
+def measure(method, path):
+    """Child process: load the plan with the given method and print timing and peak RSS"""
+    sys.path.insert(0, FULFILLMENT_DIR)
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    with open(path, "rb") as file:
+        if method == "json.loads":
+            plan = json.loads(file.read().decode("utf-8"))
+        else:
+            import plan_stream
+
+            plan = plan_stream.load_keys(file)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({"seconds": elapsed, "peak_kb": peak, "delta_kb": peak - baseline, "resources": len(plan["resource_changes"])}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="100,1000,10000", help="Comma separated resource counts")
+    parser.add_argument("--string-mb", default="2,8,32", help="Comma separated sizes of the single string cases")
+    parser.add_argument("--max-ratio", type=float, default=20, help="Slowest accepted plan_stream to json.loads ratio")
+    parser.add_argument("--measure", nargs=2, metavar=("METHOD", "PATH"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(*args.measure)
+        return
+
+    print(f"{'case':>34} {'plan MB':>8} {'method':>12} {'seconds':>8} {'peak RSS MB':>12} {'delta MB':>9}")
+    failures = 0
+    with tempfile.TemporaryDirectory() as directory:
+        cases = []
+        for resource_count in [int(size) for size in args.sizes.split(",") if size]:
+            path = os.path.join(directory, f"plan-{resource_count}.json")
+            write_plan(path, resource_count)
+            cases.append((f"{resource_count} resources", path))
+        for string_mb in [int(size) for size in args.string_mb.split(",") if size]:
+            for location in ["prior_state", "resource_changes"]:
+                path = os.path.join(directory, f"plan-string-{string_mb}-{location}.json")
+                write_string_plan(path, string_mb, location)
+                cases.append((f"{string_mb} MB string in {location}", path))
+
+        for name, path in cases:
+            plan_mb = os.path.getsize(path) / 1024 / 1024
+            seconds = {}
+            for method in ["json.loads", "plan_stream"]:
+                output = subprocess.run(
+                    [sys.executable, __file__, "--measure", method, path],
+                    check=True, capture_output=True, text=True,
+                ).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                seconds[method] = result["seconds"]
+                print(
+                    f"{name:>34} {plan_mb:>8.1f} {method:>12} {result['seconds']:>8.2f} "
+                    f"{result['peak_kb'] / 1024:>12.1f} {result['delta_kb'] / 1024:>9.1f}"
+                )
+            if seconds["plan_stream"] > args.max_ratio * seconds["json.loads"] + 1:
+                print(f"FAIL {name}: plan_stream is not linear in the plan size")
+                failures += 1
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
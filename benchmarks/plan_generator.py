@@ -0,0 +1,169 @@
+"""
+Synthetic Terraform plan JSON generator for the scaling benchmarks.
+
+Plans mimic the HCP Terraform JSON plan output: resources spread over nested modules, a mix of create, update,
+replace, delete, read and no-op actions, large before/after values (user data, IAM policy documents, tags),
+unknown and sensitive attributes, and AMI transitions on launch templates and instances. The output is
+deterministic for a given size and seed.
+
+Usage:
+    python3 benchmarks/plan_generator.py --resources 1000 --output /tmp/plan.json [--seed 0] [--blob-kb 2]
+"""
+
+import argparse
+import json
+import random
+
+ACTIONS = [
+    (["create"], 35),
+    (["update"], 30),
+    (["delete", "create"], 8),
+    (["create", "delete"], 2),
+    (["delete"], 8),
+    (["no-op"], 14),
+    (["read"], 3),
+]
+AMI_SHARE = 0.05
+
+
+def _ami_id(rng):
+    return "ami-" + "".join(rng.choice("0123456789abcdef") for _ in range(17))
+
+
+def _module_address(rng, index):
+    # Up to three levels of nested modules, some resources stay in the root module
+    depth = rng.choice([0, 1, 1, 2, 2, 3])
+    parts = []
+    for level in range(depth):
+        parts.append(f"module.{['app', 'network', 'data', 'platform'][(index + level) % 4]}_{(index // 50 + level) % 20}")
+    return ".".join(parts)
+
+
+def _policy(rng, blob_bytes):
+    statements = []
+    while len(json.dumps(statements)) < blob_bytes:
+        statements.append({
+            "Effect": "Allow",
+            "Action": [f"s3:{action}" for action in rng.sample(["GetObject", "PutObject", "ListBucket", "DeleteObject"], 2)],
+            "Resource": f"arn:aws:s3:::bucket-{rng.randrange(10 ** 6)}/*",
+        })
+    return json.dumps({"Version": "2012-10-17", "Statement": statements})
+
+
+def _values(rng, kind, index, blob_bytes, ami_id):
+    tags = {f"tag-{key}": f"value-{rng.randrange(1000)}" for key in range(8)}
+    if kind == "aws_launch_template":
+        return {
+            "name": f"lt-{index}",
+            "image_id": ami_id,
+            "instance_type": rng.choice(["m6i.large", "m6i.xlarge", "c6i.large"]),
+            "user_data": "#!/bin/bash\n" + "echo ECS_CLUSTER=cluster >> /etc/ecs/ecs.config\n" * (blob_bytes // 48 + 1),
+            "block_device_mappings": [{"device_name": "/dev/xvda", "ebs": [{"volume_size": 30, "encrypted": True}]}],
+            "tags": tags,
+        }
+    if kind == "aws_instance":
+        return {"ami": ami_id, "instance_type": "t3.micro", "user_data_base64": "A" * blob_bytes, "tags": tags}
+    if kind == "aws_iam_policy":
+        return {"name": f"policy-{index}", "policy": _policy(rng, blob_bytes), "tags": tags}
+    if kind == "aws_security_group":
+        return {
+            "name": f"sg-{index}",
+            "ingress": [
+                {"from_port": port, "to_port": port, "protocol": "tcp", "cidr_blocks": [f"10.{port % 255}.0.0/16"]}
+                for port in range(rng.randrange(2, 12))
+            ],
+            "tags": tags,
+        }
+    return {"bucket": f"bucket-{index}", "force_destroy": False, "tags": tags}
+
+
+def _resource_change(rng, index, blob_bytes):
+    actions = rng.choices([actions for actions, _ in ACTIONS], weights=[weight for _, weight in ACTIONS])[0]
+    ami_transition = rng.random() < AMI_SHARE
+    if ami_transition:
+        kind = rng.choice(["aws_launch_template", "aws_instance"])
+    else:
+        kind = rng.choice(["aws_s3_bucket", "aws_iam_policy", "aws_security_group", "aws_launch_template"])
+
+    module_address = _module_address(rng, index)
+    address = f"{kind}.r{index}"
+    if module_address:
+        address = f"{module_address}.{address}"
+
+    old_ami = _ami_id(rng)
+    before = _values(rng, kind, index, blob_bytes, old_ami)
+    after = json.loads(json.dumps(before))
+    after_unknown = {}
+    if actions == ["update"] or ami_transition:
+        after["tags"]["updated"] = "true"
+        if kind in ("aws_launch_template", "aws_instance"):
+            after["ami" if kind == "aws_instance" else "image_id"] = _ami_id(rng) if ami_transition else old_ami
+        if kind == "aws_iam_policy":
+            after["policy"] = _policy(rng, blob_bytes)
+    if "create" in actions:
+        after_unknown = {"arn": True, "id": True}
+    if actions == ["create"]:
+        before = None
+    if actions == ["delete"]:
+        after = None
+
+    resource_change = {
+        "address": address,
+        "mode": "managed",
+        "type": kind,
+        "name": f"r{index}",
+        "provider_name": "registry.terraform.io/hashicorp/aws",
+        "change": {
+            "actions": actions,
+            "before": before,
+            "after": after,
+            "after_unknown": after_unknown,
+            "before_sensitive": {"user_data": True} if kind == "aws_launch_template" else {},
+            "after_sensitive": {"user_data": True} if kind == "aws_launch_template" else {},
+        },
+    }
+    if module_address:
+        resource_change["module_address"] = module_address
+    if actions in (["delete", "create"], ["create", "delete"]):
+        resource_change["action_reason"] = "replace_because_cannot_update"
+    return resource_change
+
+
+def generate_plan(resource_count, seed=0, blob_kb=2):
+    """Plan JSON with resource_count resource changes and the planned values, prior state and configuration keys"""
+    rng = random.Random(seed)
+    blob_bytes = blob_kb * 1024
+    resource_changes = [_resource_change(rng, index, blob_bytes) for index in range(resource_count)]
+    values = [
+        {"address": change["address"], "type": change["type"], "values": change["change"]["after"] or {}}
+        for change in resource_changes
+    ]
+    return {
+        "format_version": "1.2",
+        "terraform_version": "1.9.0",
+        "planned_values": {"root_module": {"resources": values}},
+        "resource_changes": resource_changes,
+        "prior_state": {"values": {"root_module": {"resources": values}}},
+        "configuration": {
+            "root_module": {"resources": [{"address": value["address"], "expressions": {}} for value in values]}
+        },
+    }
+
+
+def write_plan(path, resource_count, seed=0, blob_kb=2):
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(generate_plan(resource_count, seed, blob_kb), file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--resources", type=int, required=True, help="Number of resource changes")
+    parser.add_argument("--output", required=True, help="Plan JSON file to write")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument("--blob-kb", type=int, default=2, help="Approximate size of the large attribute values")
+    args = parser.parse_args()
+    write_plan(args.output, args.resources, args.seed, args.blob_kb)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Scaling of the fulfillment path with the plan size, on synthetic plans from benchmarks/plan_generator.py.
+
+For every size, in a fresh interpreter so peak RSS is not shared between sizes:
+- get_plan: streaming download and parse of the plan served by a stub HCP Terraform client
+- reduce_plan and ami_changes.find_ami_changes
+- prompt construction: size of the serialized reduced plan, estimated tokens and number of chunks
+- clean_response and the incremental parser on a model response listing one finding per resource
+- peak RSS
+
+The growth column is the exponent between two sizes, time ~ size^k, values well above 1 are super-linear.
+
+Usage:
+    python3 benchmarks/plan_scaling.py [--sizes 10,100,1000,10000,50000] [--blob-kb 2]
+"""
+
+import argparse
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def measure(path):
+    """Child process: run the fulfillment steps on the plan file and print the metrics as JSON"""
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    os.environ["log_level"] = "WARNING"
+    sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "lambda", "runtask_fulfillment"))
+    sys.path.insert(0, os.path.join(BENCHMARK_DIR, "..", "lambda", "shared"))
+    import io
+    import logging
+
+    import ai
+    import ami_changes
+    import hcp_client
+    import json_stream
+    import plan_reducer
+    import runtask_utils
+
+    logging.getLogger().setLevel(logging.WARNING)
+
+    class StubHCPResponse(io.FileIO):
+        headers = {}
+
+    class StubHCPClient:
+        def request(self, method, url, **_):
+            return StubHCPResponse(path, "rb")
+
+    hcp_client.get_client = StubHCPClient
+    metrics = {}
+
+    start = time.perf_counter()
+    plan, error = runtask_utils.get_plan("https://app.terraform.io/api/v2/plans/plan-scaling/json-output", "token")
+    metrics["get_plan_s"] = time.perf_counter() - start
+    if error:
+        raise RuntimeError(error)
+
+    start = time.perf_counter()
+    resource_changes, _ = plan_reducer.reduce_plan(plan)
+    metrics["reduce_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    found = ami_changes.find_ami_changes(resource_changes)
+    metrics["ami_changes_s"] = time.perf_counter() - start
+
+    plan_text = plan_reducer.serialize(resource_changes)
+    metrics["prompt_chars"] = len(plan_text)
+    metrics["prompt_tokens"] = plan_reducer.estimate_tokens(plan_text)
+    metrics["chunks"] = len(plan_reducer.chunk_changes(resource_changes, ai.chunk_token_limit)) if metrics["prompt_tokens"] > ai.chunk_token_limit else 1
+    metrics["ami_transitions"] = len(found)
+
+    # Model response with one finding per resource, wrapped in a tag so clean_response takes its cleanup path
+    response = json.dumps({
+        "thinking": "analysis",
+        "resources": "\n".join(f"- {change['address']}: {change['actions']}" for change in resource_changes),
+        "findings": {change["address"]: "One sentence finding for this resource." for change in resource_changes},
+        "impact_analysis": "## Impact Analysis",
+    })
+    response = "<json>" + response + "</json>"
+
+    start = time.perf_counter()
+    ai.clean_response(response)
+    metrics["clean_response_s"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    parser = json_stream.IncrementalObjectParser()
+    for index in range(0, len(response), 16):
+        parser.feed(response[index:index + 16])
+    metrics["incremental_s"] = time.perf_counter() - start
+
+    metrics["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps(metrics))
+
+
+def growth(previous, current, metric):
+    if previous is None or not previous[metric] or not current[metric] or previous["size"] == current["size"]:
+        return ""
+    return f"{math.log(current[metric] / previous[metric]) / math.log(current['size'] / previous['size']):.2f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,100,1000,10000,50000", help="Comma separated resource change counts")
+    parser.add_argument("--blob-kb", type=int, default=2, help="Approximate size of the large attribute values")
+    parser.add_argument("--measure", metavar="PATH", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args.measure)
+        return
+
+    sys.path.insert(0, BENCHMARK_DIR)
+    import plan_generator
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in [int(size) for size in args.sizes.split(",")]:
+            path = os.path.join(directory, f"plan-{size}.json")
+            plan_generator.write_plan(path, size, blob_kb=args.blob_kb)
+            output = subprocess.run(
+                [sys.executable, __file__, "--measure", path], check=True, capture_output=True, text=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            result.update(size=size, plan_mb=os.path.getsize(path) / 1024 / 1024)
+            results.append(result)
+            os.remove(path)
+
+    print(
+        f"{'resources':>9} {'plan MB':>8} {'get_plan s':>10} {'reduce s':>9} {'ami s':>7} {'prompt KB':>10} "
+        f"{'tokens':>9} {'chunks':>6} {'clean s':>8} {'stream s':>8} {'RSS MB':>7}  growth get_plan/reduce/clean"
+    )
+    previous = None
+    for result in results:
+        print(
+            f"{result['size']:>9} {result['plan_mb']:>8.1f} {result['get_plan_s']:>10.3f} {result['reduce_s']:>9.3f} "
+            f"{result['ami_changes_s']:>7.3f} {result['prompt_chars'] / 1024:>10.1f} {result['prompt_tokens']:>9} "
+            f"{result['chunks']:>6} {result['clean_response_s']:>8.4f} {result['incremental_s']:>8.4f} "
+            f"{result['peak_rss_mb']:>7.1f}  "
+            + "/".join(growth(previous, result, metric) or "-" for metric in ["get_plan_s", "reduce_s", "clean_response_s"])
+        )
+        previous = result
+
+
+if __name__ == "__main__":
+    main()
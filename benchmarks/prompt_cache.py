@@ -0,0 +1,207 @@
+"""
+Prompt cache behaviour of ai.eval against a bedrock-runtime stand-in that checks the Converse cache point layout.
+
+PromptCacheStandIn wraps the replaying client of benchmarks/e2e_latency.py and checks every converse_stream
+request like Bedrock does:
+- a cache point is {"cachePoint": {"type": "default"}} and only follows other blocks of tools, system or a message
+- at most MAX_CACHE_POINTS cache points per request
+- the prefix before a cache point must reach the minimum cacheable tokens, shorter prefixes are not cached
+
+Prefixes are cached per model for TTL seconds from their last use, in the tools, system, messages order. Each
+request reports cacheReadInputTokens and cacheWriteInputTokens in its metadata event, its time to first token
+shrinks with the share of the prompt read from the cache.
+
+The report runs ai.eval on the same plan --runs times, the later runs stand for retries, and lists the usage per stage.
+The script exits with status 1 when the analysis stage reports no input tokens, or when the EMF documents of a run
+lack the run totals under the stage `total`.
+
+Usage:
+    python3 benchmarks/prompt_cache.py [--resources 200] [--ttft-ms 600] [--no-prompt-cache]
+"""
+
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import e2e_latency  # noqa: E402  sets up the environment and the lambda import paths
+import ai  # noqa: E402
+import plan_reducer  # noqa: E402
+import result_cache  # noqa: E402
+from botocore.exceptions import ClientError  # noqa: E402
+from tools import ami_release_index, get_ami_releases  # noqa: E402
+
+MAX_CACHE_POINTS = 4
+CACHE_POINT = {"cachePoint": {"type": "default"}}
+
+
+class PromptCacheStandIn:
+    """bedrock-runtime stand-in adding the prompt cache to another stand-in, see the module documentation"""
+
+    def __init__(self, client, min_tokens=1024, ttl_seconds=300, cached_ttft_share=0.2):
+        self.client = client
+        self.min_tokens = min_tokens
+        self.ttl_seconds = ttl_seconds
+        self.cached_ttft_share = cached_ttft_share
+        self.lock = threading.Lock()
+        self.prefixes = {}
+        self.requests = []
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def check_layout(self, system, messages, toolConfig=None):
+        """
+        Returns:
+            cache_points (list): (tokens, prefix hash) of every cache point in prompt order.
+            tokens (int): Estimated tokens of the whole prompt.
+        Raises a ValidationException ClientError when a cache point is misplaced.
+        """
+        sections = []
+        if toolConfig:
+            sections.append(("toolConfig.tools", toolConfig.get("tools", [])))
+        sections.append(("system", system))
+        for index, message in enumerate(messages):
+            sections.append((f"messages[{index}].content", message["content"]))
+
+        digest = hashlib.sha256()
+        tokens = 0
+        cache_points = []
+        for name, blocks in sections:
+            for position, block in enumerate(blocks):
+                if "cachePoint" in block:
+                    if block != CACHE_POINT:
+                        raise _validation_error(f"{name}[{position}] is not a default cache point: {block}")
+                    if position == 0:
+                        raise _validation_error(f"{name}[{position}] cache point does not follow any content")
+                    cache_points.append((tokens, digest.copy().hexdigest()))
+                    continue
+                serialized = json.dumps(block, sort_keys=True)
+                digest.update(serialized.encode("utf-8"))
+                tokens += plan_reducer.estimate_tokens(serialized)
+
+        if len(cache_points) > MAX_CACHE_POINTS:
+            raise _validation_error(f"{len(cache_points)} cache points, at most {MAX_CACHE_POINTS} are supported")
+        return cache_points, tokens
+
+    def converse_stream(self, modelId, messages, system, inferenceConfig, toolConfig=None):
+        cache_points, prompt_tokens = self.check_layout(system, messages, toolConfig)
+
+        now = time.monotonic()
+        read_tokens = write_tokens = 0
+        with self.lock:
+            for tokens, prefix in cache_points:
+                key = (modelId, prefix)
+                if tokens < self.min_tokens:
+                    continue
+                if self.prefixes.get(key, 0) > now:
+                    read_tokens = tokens
+                else:
+                    write_tokens = tokens - read_tokens
+                self.prefixes[key] = now + self.ttl_seconds
+            usage = {
+                "inputTokens": prompt_tokens - read_tokens - write_tokens,
+                "cacheReadInputTokens": read_tokens,
+                "cacheWriteInputTokens": write_tokens,
+            }
+            self.requests.append(dict(usage, modelId=modelId, cachePoints=[tokens for tokens, _ in cache_points]))
+
+        kwargs = {"toolConfig": toolConfig} if toolConfig else {}
+        response = self.client.converse_stream(
+            modelId=modelId, messages=messages, system=system, inferenceConfig=inferenceConfig, **kwargs
+        )
+        stream = response["stream"]
+        stream.ttft_seconds *= self.cached_ttft_share + (1 - self.cached_ttft_share) * (1 - read_tokens / max(1, prompt_tokens))
+        stream.events = [_with_usage(event, usage) for event in stream.events]
+        return response
+
+
+def _with_usage(event, usage):
+    if "metadata" not in event:
+        return event
+    metadata = dict(event["metadata"])
+    metadata["usage"] = dict(metadata.get("usage", {}), **usage)
+    metadata["usage"]["totalTokens"] = sum(usage.values()) + metadata["usage"].get("outputTokens", 0)
+    return {"metadata": metadata}
+
+
+def _validation_error(message):
+    return ClientError({"Error": {"Code": "ValidationException", "Message": message}}, "ConverseStream")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--resources", type=int, default=200, help="S3 buckets added to the plan next to the AMI change")
+    parser.add_argument("--ttft-ms", type=float, default=600, help="Bedrock time to first token without cache reads")
+    parser.add_argument("--tokens-per-second", type=float, default=400, help="Bedrock output tokens per second")
+    parser.add_argument("--runs", type=int, default=2, help="Runs of the same plan, the later runs stand for retries")
+    parser.add_argument("--no-prompt-cache", action="store_true", help="Send the prompts without cache points")
+    args = parser.parse_args()
+
+    with open(os.path.join(e2e_latency.FIXTURES_DIR, "bedrock_converse_streams.json"), encoding="utf-8") as file:
+        recordings = json.load(file)
+    with open(os.path.join(e2e_latency.FIXTURES_DIR, "ecs_ami_releases.json"), encoding="utf-8") as file:
+        releases = json.load(file)
+    release_names = sorted(ami_release_index.build_release_index(releases)[0])
+    ami_names = {e2e_latency.OLD_AMI_ID: release_names[0], e2e_latency.NEW_AMI_ID: release_names[1]}
+
+    replay = e2e_latency.ReplayBedrockRuntime(recordings, args.ttft_ms, args.tokens_per_second, guardrail_ms=0)
+    bedrock = PromptCacheStandIn(replay)
+    resource_changes, _ = plan_reducer.reduce_plan(e2e_latency.build_plan(args.resources))
+
+    print(f"resources: {len(resource_changes)}, plan tokens: {plan_reducer.estimate_tokens(plan_reducer.serialize(resource_changes))}")
+    print(f"{'run':>3} {'stage':>10} {'input':>8} {'cache read':>10} {'cache write':>11} {'ttft ms':>8} {'duration ms':>11}")
+    with mock.patch.object(ai, "bedrock_client", bedrock), \
+            mock.patch.object(ai, "guardrail_cache", result_cache.ResultCache(None)), \
+            mock.patch.object(ai, "prompt_cache_enabled", not args.no_prompt_cache), \
+            mock.patch.object(get_ami_releases, "ec2_client", e2e_latency.StubEC2(ami_names, 0)), \
+            mock.patch.object(get_ami_releases, "requests", e2e_latency.StubGitHub(releases, 0)), \
+            mock.patch.object(ami_release_index, "_snapshot", False):
+        analysis_input_tokens = []
+        totals_emitted = []
+        for run in range(args.runs):
+            replay.reset()
+            # The usage metrics are printed as EMF documents on stdout
+            with contextlib.redirect_stdout(io.StringIO()) as emf:
+                ai.eval(None, resource_changes=resource_changes)
+            summary = ai.usage_recorder.summary()
+            stages = summary["stages"]
+            documents = [json.loads(line) for line in emf.getvalue().splitlines() if line.startswith("{")]
+            totals_emitted.append(
+                any(
+                    document.get("Stage") == "total"
+                    and all(document.get(field) == value for field, value in summary["run"].items())
+                    for document in documents
+                )
+            )
+            analysis_input_tokens.append(
+                stages.get("analysis", {}).get("input_tokens", 0) + stages.get("analysis", {}).get("cache_read_input_tokens", 0)
+            )
+            for stage, totals in stages.items():
+                print(
+                    f"{run:>3} {stage:>10} {totals['input_tokens']:>8} {totals['cache_read_input_tokens']:>10} "
+                    f"{totals['cache_write_input_tokens']:>11} {totals['time_to_first_token_ms']:>8} {totals['duration_ms']:>11}"
+                )
+    print("requests as seen by the stand-in:")
+    for request in bedrock.requests:
+        print(f"    {json.dumps(request)}")
+
+    # The analysis stream is read up to its metadata event even when its JSON object completes first
+    if not analysis_input_tokens or min(analysis_input_tokens) == 0:
+        print(f"FAIL analysis stage reported no input tokens: {analysis_input_tokens}")
+        sys.exit(1)
+    if not all(totals_emitted):
+        print(f"FAIL run totals missing from the EMF documents: {totals_emitted}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#####################################################################################
+# DYNAMODB
+#####################################################################################
+
+# Analysis results and per workspace findings, shared by every container of the fulfillment function
+resource "aws_dynamodb_table" "runtask_result_cache" {
+  count        = local.result_cache_table
+  name         = "${local.solution_prefix}-runtask-result-cache"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "cache_key"
+
+  attribute {
+    name = "cache_key"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  server_side_encryption {
+    enabled     = true
+    kms_key_arn = aws_kms_key.runtask_key.arn
+  }
+
+  tags = local.combined_tags
+  #checkov:skip=CKV_AWS_28:cache entries are rebuilt on a miss, no point in time recovery
+}
+
+# Delivery keys of the run task requests, shared by every container of the ingress and callback functions
+resource "aws_dynamodb_table" "runtask_idempotency" {
+  count        = local.idempotency_table
+  name         = "${local.solution_prefix}-runtask-idempotency"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "idempotency_key"
+
+  attribute {
+    name = "idempotency_key"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  server_side_encryption {
+    enabled     = true
+    kms_key_arn = aws_kms_key.runtask_key.arn
+  }
+
+  tags = local.combined_tags
+  #checkov:skip=CKV_AWS_28:keys expire within a day, no point in time recovery
+}
@@ -36,6 +36,18 @@ resource "aws_iam_role_policy" "runtask_eventbridge" {
   })
 }
 
+resource "aws_iam_role_policy" "runtask_eventbridge_idempotency" {
+  count = local.idempotency_table
+  name  = "${local.solution_prefix}-runtask-eventbridge-idempotency-policy"
+  role  = aws_iam_role.runtask_eventbridge.id
+  policy = templatefile("${path.module}/templates/role-policies/runtask-dynamodb-table-role-policy.tpl", {
+    data_aws_region      = data.aws_region.current_region.name
+    resource_table_arn   = aws_dynamodb_table.runtask_idempotency[count.index].arn
+    resource_kms_key_arn = aws_kms_key.runtask_key.arn
+    local_table_actions  = ["dynamodb:GetItem", "dynamodb:PutItem", "dynamodb:DeleteItem"]
+  })
+}
+
 ################# IAM for run task request ##################
 resource "aws_iam_role" "runtask_request" {
   name               = "${local.solution_prefix}-runtask-request"
@@ -62,6 +74,31 @@ resource "aws_iam_role_policy_attachment" "runtask_callback" {
   policy_arn = local.lambda_managed_policies[count.index]
 }
 
+resource "aws_iam_role_policy" "runtask_callback_idempotency" {
+  count = local.idempotency_table
+  name  = "${local.solution_prefix}-runtask-callback-idempotency-policy"
+  role  = aws_iam_role.runtask_callback.id
+  policy = templatefile("${path.module}/templates/role-policies/runtask-dynamodb-table-role-policy.tpl", {
+    data_aws_region      = data.aws_region.current_region.name
+    resource_table_arn   = aws_dynamodb_table.runtask_idempotency[count.index].arn
+    resource_kms_key_arn = aws_kms_key.runtask_key.arn
+    local_table_actions  = ["dynamodb:PutItem"]
+  })
+}
+
+resource "aws_iam_role_policy" "runtask_callback_claim_check" {
+  count = local.claim_check_bucket
+  name  = "${local.solution_prefix}-runtask-callback-claim-check-policy"
+  role  = aws_iam_role.runtask_callback.id
+  policy = templatefile("${path.module}/templates/role-policies/runtask-claim-check-role-policy.tpl", {
+    data_aws_region                 = data.aws_region.current_region.name
+    resource_claim_check_bucket_arn = aws_s3_bucket.runtask_claim_check[count.index].arn
+    resource_kms_key_arn            = aws_kms_key.runtask_key.arn
+    local_claim_check_prefix        = local.claim_check_prefix
+    local_object_actions            = ["s3:GetObject"]
+  })
+}
+
 ################# IAM for run task fulfillment ##################
 resource "aws_iam_role" "runtask_fulfillment" {
   name               = "${local.solution_prefix}-runtask-fulfillment"
@@ -99,6 +136,31 @@ resource "aws_iam_role_policy" "runtask_fulfillment" {
   })
 }
 
+resource "aws_iam_role_policy" "runtask_fulfillment_result_cache" {
+  count = local.result_cache_table
+  name  = "${local.solution_prefix}-runtask-fulfillment-result-cache-policy"
+  role  = aws_iam_role.runtask_fulfillment.id
+  policy = templatefile("${path.module}/templates/role-policies/runtask-dynamodb-table-role-policy.tpl", {
+    data_aws_region      = data.aws_region.current_region.name
+    resource_table_arn   = aws_dynamodb_table.runtask_result_cache[count.index].arn
+    resource_kms_key_arn = aws_kms_key.runtask_key.arn
+    local_table_actions  = ["dynamodb:GetItem", "dynamodb:PutItem"]
+  })
+}
+
+resource "aws_iam_role_policy" "runtask_fulfillment_claim_check" {
+  count = local.claim_check_bucket
+  name  = "${local.solution_prefix}-runtask-fulfillment-claim-check-policy"
+  role  = aws_iam_role.runtask_fulfillment.id
+  policy = templatefile("${path.module}/templates/role-policies/runtask-claim-check-role-policy.tpl", {
+    data_aws_region                 = data.aws_region.current_region.name
+    resource_claim_check_bucket_arn = aws_s3_bucket.runtask_claim_check[count.index].arn
+    resource_kms_key_arn            = aws_kms_key.runtask_key.arn
+    local_claim_check_prefix        = local.claim_check_prefix
+    local_object_actions            = ["s3:PutObject"]
+  })
+}
+
 ################# IAM for run task StateMachine ##################
 resource "aws_iam_role" "runtask_states" {
   name               = "${local.solution_prefix}-runtask-statemachine"
@@ -27,6 +27,8 @@ resource "aws_lambda_function" "runtask_eventbridge" {
       HCP_TF_CF_SIGNATURE    = var.deploy_waf ? local.cloudfront_sig_name : null
       EVENT_BUS_NAME         = var.event_bus_name
       EVENT_RULE_DETAIL_TYPE = local.solution_prefix # ensure uniqueness of event sent to each runtask state machine
+      IDEMPOTENCY_BACKEND    = var.idempotency_backend
+      IDEMPOTENCY_TABLE      = local.idempotency_table == 1 ? aws_dynamodb_table.runtask_idempotency[0].name : null
     }
   }
   tracing_config {
@@ -123,9 +125,19 @@ resource "aws_lambda_function" "runtask_callback" {
   tracing_config {
     mode = "Active"
   }
+  environment {
+    variables = {
+      IDEMPOTENCY_BACKEND = var.idempotency_backend
+      IDEMPOTENCY_TABLE   = local.idempotency_table == 1 ? aws_dynamodb_table.runtask_idempotency[0].name : null
+      CLAIM_CHECK_BACKEND = local.claim_check_bucket == 1 ? "s3" : "none"
+      CLAIM_CHECK_BUCKET  = local.claim_check_bucket == 1 ? aws_s3_bucket.runtask_claim_check[0].id : null
+      CLAIM_CHECK_PREFIX  = local.claim_check_prefix
+    }
+  }
   tags = local.combined_tags
   #checkov:skip=CKV_AWS_116:not using DLQ
   #checkov:skip=CKV_AWS_117:VPC is not required
+  #checkov:skip=CKV_AWS_173:no sensitive data in env var
   #checkov:skip=CKV_AWS_272:skip code-signing
 }
 
@@ -177,8 +189,17 @@ resource "aws_lambda_function" "runtask_fulfillment" {
     variables = {
       CW_LOG_GROUP_NAME         = local.cloudwatch_log_group_name
       BEDROCK_LLM_MODEL         = var.bedrock_llm_model
+      MODEL_TIERS               = jsonencode(var.bedrock_llm_model_tiers)
       BEDROCK_GUARDRAIL_ID      = aws_bedrock_guardrail.runtask_fulfillment.guardrail_id
       BEDROCK_GUARDRAIL_VERSION = aws_bedrock_guardrail_version.runtask_fulfillment.version
+      RESULT_CACHE_BACKEND      = var.result_cache_backend
+      RESULT_CACHE_TABLE        = local.result_cache_table == 1 ? aws_dynamodb_table.runtask_result_cache[0].name : null
+      RESULT_CACHE_TTL          = var.result_cache_ttl
+      WORKSPACE_STORE_BACKEND   = var.result_cache_backend
+      WORKSPACE_STORE_TABLE     = local.result_cache_table == 1 ? aws_dynamodb_table.runtask_result_cache[0].name : null
+      CLAIM_CHECK_BACKEND       = local.claim_check_bucket == 1 ? "s3" : "none"
+      CLAIM_CHECK_BUCKET        = local.claim_check_bucket == 1 ? aws_s3_bucket.runtask_claim_check[0].id : null
+      CLAIM_CHECK_PREFIX        = local.claim_check_prefix
     }
   }
   tags = local.combined_tags
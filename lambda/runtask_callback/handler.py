@@ -18,10 +18,12 @@ CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 import json
 import logging
 import os
-import re
-from urllib.request import urlopen, Request
 from urllib.error import HTTPError, URLError
 
+import claim_check
+import hcp_client
+import idempotency
+
 HCP_TF_HOST_NAME = os.environ.get("HCP_TF_HOST_NAME", "app.terraform.io")
 
 logger = logging.getLogger()
@@ -31,13 +33,17 @@ logger.setLevel(log_level)
 logger.info("Log level set to %s" % logger.getEffectiveLevel())
 
 
-def lambda_handler(event, _):
+def lambda_handler(event, context):
     logger.debug(json.dumps(event))
     try:
         # trim empty url from the payload
         if "fulfillment" in event["payload"]["result"] and event["payload"]["result"]["fulfillment"]["url"] == False:
             event["payload"]["result"]["fulfillment"].pop("url")
 
+        # Rehydrate the results the fulfillment moved to the claim check store
+        if "fulfillment" in event["payload"]["result"]:
+            rehydrate(event["payload"]["result"]["fulfillment"])
+
         if (
             event["payload"]["result"]["request"]["status"] == "unverified"
         ):  # unverified runtask execution
@@ -89,9 +95,12 @@ def lambda_handler(event, _):
         access_token = event["payload"]["detail"]["access_token"]
         headers = __build_standard_headers(access_token)
         response = __patch(
-            endpoint, headers, bytes(json.dumps(payload), encoding="utf-8")
+            endpoint, headers, bytes(json.dumps(payload), encoding="utf-8"), context
         )
         logger.debug("HCP Terraform response: {}".format(response))
+        if response is not None:
+            # Later redeliveries of this run task request are acknowledged without a new execution
+            idempotency.get_store().complete(idempotency.build_key(event["payload"]["detail"]))
         return "completed"
 
     except Exception as e:
@@ -99,6 +108,14 @@ def lambda_handler(event, _):
         raise
 
 
+def rehydrate(fulfillment):
+    """Replace the claim check references of the fulfillment result with the stored values, in place"""
+    claim = fulfillment.pop("claim_check", None) or {}
+    if claim.get("results"):
+        fulfillment["results"] = claim_check.get_store().check_out(claim["results"])
+        logger.info("Results rehydrated from claim check {}".format(claim["results"]))
+
+
 def __build_standard_headers(api_token):
     return {
         "Authorization": "Bearer {}".format(api_token),
@@ -106,11 +123,13 @@ def __build_standard_headers(api_token):
     }
 
 
-def __patch(endpoint, headers, payload):
-    request = Request(endpoint, headers=headers or {}, data=payload, method="PATCH")
+def __patch(endpoint, headers, payload, context=None):
     try:
         if validate_endpoint(endpoint):
-            with urlopen(request, timeout=10) as response:  # nosec URL validation
+            with hcp_client.get_client().request(
+                "PATCH", endpoint, headers=headers, body=payload, timeout=10,
+                deadline=hcp_client.deadline_from_context(context),
+            ) as response:
                 return response.read(), response
         else:
             raise URLError(
@@ -125,6 +144,4 @@ def __patch(endpoint, headers, payload):
 
 
 def validate_endpoint(endpoint):  # validate that the endpoint hostname is valid
-    pattern = "^https:\/\/" + str(HCP_TF_HOST_NAME).replace(".", "\.") + "\/" + ".*"
-    result = re.match(pattern, endpoint)
-    return result
+    return hcp_client.validate_endpoint(endpoint, HCP_TF_HOST_NAME)
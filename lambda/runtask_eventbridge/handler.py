@@ -21,18 +21,26 @@ import os
 import hmac
 import json
 import base64
+import binascii
 import hashlib
 import logging
 import urllib.parse
-import boto3
-import botocore.session
 
-from cgi import parse_header
-from aws_secretsmanager_caching import SecretCache, SecretCacheConfig
+import idempotency
+from lazy import LazyObject
 
-client = botocore.session.get_session().create_client("secretsmanager")
-cache_config = SecretCacheConfig()
-cache = SecretCache(config=cache_config, client=client)
+
+def _create_secret_cache():
+    import botocore.session
+    from aws_secretsmanager_caching import SecretCache, SecretCacheConfig
+
+    client = botocore.session.get_session().create_client("secretsmanager")
+    cache_config = SecretCacheConfig()
+    return SecretCache(config=cache_config, client=client)
+
+
+# Secrets Manager cache and EventBridge client are built on first use, not during the cold start import
+cache = LazyObject(_create_secret_cache)
 
 hcp_tf_hmac_secret_arn = os.environ.get("HCP_TF_HMAC_SECRET_ARN")
 hcp_tf_use_waf = os.environ.get("HCP_TF_USE_WAF")
@@ -47,7 +55,8 @@ logger.info("Log level set to %s" % logger.getEffectiveLevel())
 
 event_bus_name = os.environ.get("EVENT_BUS_NAME", "default")
 event_rule_detail_type = os.environ.get("EVENT_RULE_DETAIL_TYPE", "tfplan-analyzer")
-event_bridge_client = boto3.client("events")
+
+SUPPORTED_CONTENT_TYPES = ("application/json", "application/x-www-form-urlencoded")
 
 ## Add user-agent to event-bridge event
 def _add_header(request, **kwargs):
@@ -55,9 +64,18 @@ def _add_header(request, **kwargs):
     del request.headers["User-Agent"]
     request.headers["User-Agent"] = userAgentHeader
 
-## Add user-agent to event-bridge event
-event_system = event_bridge_client.meta.events
-event_system.register_first("before-sign.events.PutEvents", _add_header)
+
+def _create_event_bridge_client():
+    import boto3
+
+    client = boto3.client("events")
+    ## Add user-agent to event-bridge event
+    event_system = client.meta.events
+    event_system.register_first("before-sign.events.PutEvents", _add_header)
+    return client
+
+
+event_bridge_client = LazyObject(_create_event_bridge_client)
 
 class PutEventError(Exception):
     """Raised when Put Events Failed"""
@@ -65,12 +83,19 @@ class PutEventError(Exception):
 
 def lambda_handler(event, _):
     """Terraform run task function"""
-    logger.debug(json.dumps(event))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(json.dumps(event))
 
-    headers = event.get("headers")
-    # Input validation
+    headers = event.get("headers") or {}
+    # Input validation, only the headers and the body encoding are checked before the signature
     try:
-        json_payload = get_json_payload(event=event)
+        content_type = get_content_type(headers)
+        if content_type not in SUPPORTED_CONTENT_TYPES:
+            raise ValueError("Unsupported content-type")
+        # Decoded once, the same bytes are signed, parsed and forwarded
+        payload_bytes = get_payload_bytes(
+            raw_payload=event.get("body"), is_base64_encoded=event.get("isBase64Encoded", False)
+        )
     except ValueError as err:
         print_error(f"400 Bad Request - {err}", headers)
         return {"statusCode": 400, "body": str(err)}
@@ -88,13 +113,35 @@ def lambda_handler(event, _):
             print_error("401 Unauthorized - Invalid CloudFront Signature", headers)
             return {"statusCode": 401, "body": "Invalid CloudFront Signature"}
 
-        if not contains_valid_signature(event=event):
+        if not contains_valid_signature(headers=headers, payload_bytes=payload_bytes):
             print_error("401 Unauthorized - Invalid Payload Signature", headers)
             return {"statusCode": 401, "body": "Invalid Payload Signature"}
 
-        response = forward_event(json_payload, event_rule_detail_type)
+        # The payload is only parsed once its signature is verified. A body that was not base64 encoded already is
+        # the payload text, its encoded copy is released instead of being decoded again
+        payload = payload_bytes if event.get("isBase64Encoded", False) else event["body"]
+        payload_bytes = None
+        try:
+            json_payload, detail = get_json_payload(payload=payload, content_type=content_type)
+        except ValueError as err:
+            print_error(f"400 Bad Request - {err}", headers)
+            return {"statusCode": 400, "body": str(err)}
+
+        # HCP Terraform redelivers the request when it times out, only the first delivery starts an execution
+        store = idempotency.get_store()
+        idempotency_key = idempotency.build_key(detail) if isinstance(detail, dict) else None
+        status = store.claim(idempotency_key)
+        if status is not None:
+            return {"statusCode": 200, "body": f"Duplicate delivery ignored, run task {status}"}
+
+        try:
+            response = forward_event(json_payload, event_rule_detail_type)
+        except BaseException:
+            store.release(idempotency_key)
+            raise
 
         if response["FailedEntryCount"] > 0:
+            store.release(idempotency_key)
             print_error(
                 "500 FailedEntry Error - The event was not successfully forwarded to Amazon EventBridge\n"
                 + str(response["Entries"][0]),
@@ -122,15 +169,6 @@ def lambda_handler(event, _):
         return {"statusCode": 500, "body": "Internal Server Error"}
 
 
-def normalize_payload(raw_payload, is_base64_encoded):
-    """Decode payload if needed"""
-    if raw_payload is None:
-        raise ValueError("Missing event body")
-    if is_base64_encoded:
-        return base64.b64decode(raw_payload).decode("utf-8")
-    return raw_payload
-
-
 def contains_valid_cloudfront_signature(
     event,
 ):  # Check for the special header value from CloudFront
@@ -146,27 +184,28 @@ def contains_valid_cloudfront_signature(
         return False
 
 
-def contains_valid_signature(event):
+def contains_valid_signature(headers, payload_bytes):
     """Check for the payload signature
     HashiCorp Terraform run task documentation: https://developer.hashicorp.com/terraform/cloud-docs/integrations/run-tasks#securing-your-run-task
     """
     secret = cache.get_secret_string(hcp_tf_hmac_secret_arn)
-    payload_bytes = get_payload_bytes(
-        raw_payload=event["body"], is_base64_encoded=event["isBase64Encoded"]
-    )
     computed_signature = compute_signature(payload_bytes=payload_bytes, secret=secret)
 
     return hmac.compare_digest(
-        event["headers"].get("x-tfc-task-signature", ""), computed_signature
+        headers.get("x-tfc-task-signature", ""), computed_signature
     )
 
 
 def get_payload_bytes(raw_payload, is_base64_encoded):
-    """Get payload bytes to feed hash function"""
+    """Decode the event body into the payload bytes, the input of the signature and of the JSON payload"""
+    if raw_payload is None:
+        raise ValueError("Missing event body")
     if is_base64_encoded:
-        return base64.b64decode(raw_payload)
-    else:
-        return raw_payload.encode()
+        try:
+            return base64.b64decode(raw_payload)
+        except binascii.Error as err:
+            raise ValueError("Invalid base64 body") from err
+    return raw_payload.encode()
 
 
 def compute_signature(payload_bytes, secret):
@@ -175,18 +214,13 @@ def compute_signature(payload_bytes, secret):
     return m.hexdigest()
 
 
-def get_json_payload(event):
-    """Get JSON string from payload"""
-    content_type = get_content_type(event.get("headers", {}))
-    if not (
-        content_type == "application/json"
-        or content_type == "application/x-www-form-urlencoded"
-    ):
-        raise ValueError("Unsupported content-type")
-
-    payload = normalize_payload(
-        raw_payload=event.get("body"), is_base64_encoded=event["isBase64Encoded"]
-    )
+def get_json_payload(payload, content_type):
+    """Get the JSON string from the payload bytes or text, with its parsed value"""
+    if isinstance(payload, bytes):
+        try:
+            payload = payload.decode("utf-8")
+        except UnicodeDecodeError as err:
+            raise ValueError("Invalid UTF-8 payload") from err
 
     if content_type == "application/x-www-form-urlencoded":
         parsed_qs = urllib.parse.parse_qs(payload)
@@ -196,12 +230,12 @@ def get_json_payload(event):
         payload = parsed_qs["payload"][0]
 
     try:
-        json.loads(payload)
+        detail = json.loads(payload)
 
     except ValueError as err:
         raise ValueError("Invalid JSON payload") from err
 
-    return payload
+    return payload, detail
 
 
 def forward_event(payload, detail_type):
@@ -222,13 +256,12 @@ def forward_event(payload, detail_type):
 
 
 def get_content_type(headers):
-    """Helper function to parse content-type from the header"""
+    """Helper function to parse content-type from the header, media types are case insensitive"""
     raw_content_type = headers.get("content-type")
 
     if raw_content_type is None:
         return None
-    content_type, _ = parse_header(raw_content_type)
-    return content_type
+    return raw_content_type.split(";", 1)[0].strip().lower()
 
 
 def print_error(message, headers):
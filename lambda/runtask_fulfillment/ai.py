@@ -1,167 +1,627 @@
+import hashlib
 import json
 import os
 import re
-
-import boto3
-import botocore
-
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import ami_changes
+import bedrock_resilience
+import json_stream
+import kv_store
+import plan_reducer
+import result_cache
+import routing
+import workspace_store
+from usage_metrics import UsageRecorder
 from runtask_utils import generate_runtask_result
+from scheduler import StageScheduler
 from tools.get_ami_releases import GetECSAmisReleases
-from utils import logger, stream_messages, tool_config
-import xml.etree.ElementTree as ET
+from lazy import lazy_client
+from utils import logger, tool_config
 
 # Initialize model_id and region
 model_id = os.environ.get("BEDROCK_LLM_MODEL")
 guardrail_id = os.environ.get("BEDROCK_GUARDRAIL_ID", None)
 guardrail_version = os.environ.get("BEDROCK_GUARDRAIL_VERSION", None)
+stage_max_workers = int(os.environ.get("STAGE_MAX_WORKERS", 4))
+
+# Bump whenever a prompt changes, cached results of older prompts are then ignored
+PROMPT_VERSION = "5"
 
-# Config to avoid timeouts when using long prompts
-config = botocore.config.Config(
-    read_timeout=1800, connect_timeout=1800, retries={"max_attempts": 0}
+# Plans above this estimated size are analyzed in chunks and merged with a final reduce call
+chunk_token_limit = int(os.environ.get("CHUNK_TOKEN_LIMIT", 60000))
+chunk_max_concurrency = int(os.environ.get("CHUNK_MAX_CONCURRENCY", 3))
+
+# Model tiers from the fastest to the most capable model, each stage is routed to the smallest tier that fits it
+model_router = routing.ModelRouter(
+    routing.load_tiers(os.environ.get("MODEL_TIERS"), model_id, chunk_token_limit)
 )
 
-session = boto3.Session()
-bedrock_client = session.client(
-    service_name="bedrock-runtime", config=config
+# The plan is the first block of the analysis and summary prompts, marked with a Converse cache point so the
+# summary reads the prefix the analysis wrote to the prompt cache instead of processing the plan again
+prompt_cache_enabled = os.environ.get("PROMPT_CACHE", "true").lower() == "true"
+prompt_cache_min_tokens = int(os.environ.get("PROMPT_CACHE_MIN_TOKENS", 1024))
+prompt_cache_wait_seconds = float(os.environ.get("PROMPT_CACHE_WAIT_SECONDS", 30))
+
+PLAN_SYSTEM_TEXT = "You are an assistant that helps reading infrastructure changes from JSON objects generated by terraform"
+CACHE_POINT = {"cachePoint": {"type": "default"}}
+
+# Guardrail verdicts are deterministic for a guardrail version, identical texts reuse the previous verdict
+guardrail_cache = result_cache.ResultCache(
+    kv_store.MemoryBackend(int(os.environ.get("GUARDRAIL_CACHE_MAX_ENTRIES", 256))),
+    ttl=int(os.environ.get("GUARDRAIL_CACHE_TTL", 86400)),
+    name="Guardrail cache",
+)
+
+# Optional guardrail check of the plan itself, run next to the first Bedrock stage
+guardrail_input_check = os.environ.get("GUARDRAIL_INPUT_CHECK", "false").lower() == "true"
+# The plan is checked in chunks of at most GUARDRAIL_INPUT_MAX_CHARS, one ApplyGuardrail request each, the chunks
+# past GUARDRAIL_INPUT_MAX_REQUESTS are not checked and the run task message says so
+guardrail_input_max_chars = int(os.environ.get("GUARDRAIL_INPUT_MAX_CHARS", 25000))
+guardrail_input_max_requests = int(os.environ.get("GUARDRAIL_INPUT_MAX_REQUESTS", 8))
+# Consecutive chunks overlap so a phrase cut at a chunk boundary is still seen whole by one of them
+GUARDRAIL_INPUT_OVERLAP_CHARS = 200
+
+
+
+def analysis_config():
+    """Settings other than the model, guardrail and prompts that change the results, part of the result cache key"""
+    return {
+        "model_tiers": [tier._asdict() for tier in model_router.tiers],
+        "guardrail_input_check": guardrail_input_check,
+        "guardrail_input_max_chars": guardrail_input_max_chars,
+        "guardrail_input_max_requests": guardrail_input_max_requests,
+    }
+
+
+# Bounds of the tool-use loop, the loop is asked for a final answer once either limit is reached
+tool_max_iterations = int(os.environ.get("TOOL_MAX_ITERATIONS", 5))
+tool_token_budget = int(os.environ.get("TOOL_TOKEN_BUDGET", 100000))
+tool_max_concurrency = int(os.environ.get("TOOL_MAX_CONCURRENCY", 4))
+
+NO_AMI_CHANGES = "No Amazon Machine Image (AMI) changes found in this plan."
+
+IMPACT_ANALYSIS_FORMAT = "assessment formatted as markdown with sections: ## 🔍 Impact Analysis\n\n### 🚨 Security Concerns\n- **Critical/High/Medium**: Description\n- **Risk Level**: Assessment\n\n### ⚠️ Configuration Issues\n- **Issue Type**: Description\n- **Impact**: Consequence\n\n### 📊 Operational Impact\n- **Infrastructure**: What's being deployed\n- **Cost**: Cost implications\n\n### 💡 Recommendations\n- **Priority 1**: Most critical fix\n- **Priority 2**: Secondary concerns\n- **Warning**: Important warnings"
+
+# Bedrock requests are retried, bounded and optionally hedged by resilient_bedrock instead of botocore, a stream
+# without events is closed after the first event or idle timeout, both well below the Lambda timeout so a stalled
+# request is retried within the run
+resilient_bedrock = bedrock_resilience.ResilientBedrock(
+    max_attempts=int(os.environ.get("BEDROCK_MAX_ATTEMPTS", 4)),
+    base_delay=float(os.environ.get("BEDROCK_RETRY_BASE_DELAY", 1)),
+    max_delay=float(os.environ.get("BEDROCK_RETRY_MAX_DELAY", 20)),
+    first_event_timeout=float(os.environ.get("BEDROCK_FIRST_EVENT_TIMEOUT", 30)),
+    idle_timeout=float(os.environ.get("BEDROCK_STREAM_IDLE_TIMEOUT", 20)),
+    max_concurrency=int(os.environ.get("BEDROCK_MAX_CONCURRENCY", 8)),
+    hedge_after=float(os.environ.get("BEDROCK_HEDGE_AFTER", 0)),
+)
+# Time kept after the Bedrock deadline of a run for the handler to log the results and answer before the timeout
+bedrock_deadline_margin = float(os.environ.get("BEDROCK_DEADLINE_MARGIN", 20))
+
+# The read timeout is only a backstop for the stalled streams and guardrail calls
+bedrock_client = lazy_client(
+    "bedrock-runtime",
+    config={
+        "read_timeout": resilient_bedrock.first_event_timeout + resilient_bedrock.idle_timeout,
+        "connect_timeout": int(os.environ.get("BEDROCK_CONNECT_TIMEOUT", 10)),
+        "retries": {"max_attempts": 0},
+    },
 )
 
+# Bedrock token usage and latency of the current run, per stage
+usage_recorder = UsageRecorder()
+
+def route_analysis(changed_resources):
+    """
+    Serialize the resource changes to analyze and route the analysis stage.
+    Returns:
+        plan_text (str): Serialized resource changes.
+        plan_tokens (int): Estimated tokens of plan_text.
+        complexity (float): Complexity of the resource changes.
+        analysis_route (Route): Route of the analysis stage.
+    """
+    plan_text = plan_reducer.serialize(changed_resources)
+    plan_tokens = plan_reducer.estimate_tokens(plan_text)
+    complexity = routing.estimate_complexity(changed_resources)
+    return plan_text, plan_tokens, complexity, model_router.route("analysis", plan_tokens, complexity)
+
+
 # Input is the terraform plan JSON
-def eval(tf_plan_json):
+def eval(tf_plan_json, resource_changes=None, workspace_id=None, deadline=None):
+
+    usage_recorder.reset()
+    model_router.reset()
+    # No Bedrock request starts or keeps streaming past the deadline of the run
+    resilient_bedrock.deadline = deadline
+
+    # Keep only the changed attribute paths, every prompt below uses the reduced plan
+    if resource_changes is None:
+        resource_changes, _ = plan_reducer.reduce_plan(tf_plan_json)
+
+    # Only send the resource changes not analyzed in a previous run of the workspace
+    fingerprints = {
+        resource_change["address"]: workspace_store.fingerprint(resource_change)
+        for resource_change in resource_changes
+    }
+    changed_resources, cached_findings = resource_changes, {}
+    previous_model_id = None
+    if workspace_id:
+        previous_model_id, previous = workspace_store.get_store().load(workspace_id, PROMPT_VERSION)
+        changed_resources, cached_findings = workspace_store.split_changes(
+            resource_changes, fingerprints, previous
+        )
+
+    # Route each stage to a model tier and strategy from the size and complexity of its input
+    plan_text, plan_tokens, complexity, analysis_route = route_analysis(changed_resources)
+    if cached_findings and analysis_route.model_id != previous_model_id:
+        # Findings are only reused by the model that produced them, the whole plan goes to the routed model
+        logger.info(f"Workspace findings of {previous_model_id} not reused by {analysis_route.model_id}")
+        model_router.reset()
+        changed_resources, cached_findings = resource_changes, {}
+        plan_text, plan_tokens, complexity, analysis_route = route_analysis(changed_resources)
+
+    findings_text = json.dumps(cached_findings, separators=(",", ":")) if cached_findings else ""
+    compacted_text = None
+    if plan_tokens > min(tier.max_input_tokens for tier in model_router.tiers):
+        compacted_text = plan_reducer.serialize(plan_reducer.outline(changed_resources))
+    summary_route = model_router.route(
+        "summary", plan_tokens, complexity,
+        compacted_tokens=plan_reducer.estimate_tokens(compacted_text) if compacted_text else None,
+    )
+
+    # Both stages send the same plan prefix to the same model, the summary waits until the analysis has written it
+    # to the prompt cache, which is done once the model starts answering
+    share_prefix = (
+        prompt_cache_enabled
+        and analysis_route.strategy == routing.DIRECT
+        and summary_route.strategy == routing.DIRECT
+        and analysis_route.model_id == summary_route.model_id
+    )
+    prefix_written = threading.Event() if share_prefix else None
+
+    # Independent stages run concurrently, each guardrail check only waits for its own stage
+    scheduler = StageScheduler(max_workers=stage_max_workers)
+    if analysis_route.strategy == routing.CHUNKED:
+        # Map-reduce over token bounded chunks for plans that exceed the model context window
+        chunks = plan_reducer.chunk_changes(changed_resources, analysis_route.token_limit)
+        scheduler.add("chunks", lambda _: analyze_chunks(chunks, analysis_route.model_id))
+        scheduler.add("analysis", lambda results: reduce_analyses(results["chunks"][0], findings_text, analysis_route.model_id, analysis_route.token_limit), depends_on=["chunks"])
+    else:
+        scheduler.add("analysis", lambda _: analyze_plan(plan_text, findings_text, model=analysis_route.model_id, prefix_written=prefix_written))
+    if summary_route.strategy == routing.COMPACTED:
+        scheduler.add("summary", lambda _: summarize_plan(compacted_text, findings_text, summary_route.model_id))
+    elif summary_route.strategy == routing.CHUNKED and analysis_route.strategy == routing.CHUNKED:
+        scheduler.add("summary", lambda results: summarize_plan(json.dumps([chunk[0] for chunk in results["chunks"][0]]), findings_text, summary_route.model_id), depends_on=["chunks"])
+    else:
+        scheduler.add("summary", lambda _: summarize_plan(plan_text, findings_text, summary_route.model_id, prefix_written=prefix_written))
+    # AMI transitions are found locally, the AMI stage only calls Bedrock when the plan changes an AMI
+    plan_ami_changes = ami_changes.find_ami_changes(resource_changes)
+    if plan_ami_changes:
+        ami_route = model_router.route(
+            "ami", plan_reducer.estimate_tokens(plan_reducer.serialize(plan_ami_changes)), complexity
+        )
+        scheduler.add("ami", lambda _: analyze_amis(plan_ami_changes, ami_route.model_id))
+        scheduler.add("ami_guardrail", lambda results: guardrail_inspection(str(results["ami"])), depends_on=["ami"])
+    if guardrail_input_check:
+        scheduler.add("plan_guardrail", lambda _: inspect_plan_input(plan_text))
+    scheduler.add("summary_guardrail", lambda results: guardrail_inspection(str(results["summary"])), depends_on=["summary"])
+    scheduler.add("impact_guardrail", lambda results: guardrail_inspection(str(results["analysis"][1])), depends_on=["analysis"])
+    stage_results = scheduler.run()
+
+    analysis_response_text, impact_analysis_text, findings = stage_results["analysis"]
+    # Resource changes of the chunks whose analysis failed are named first in the impact analysis
+    failed_addresses = stage_results["chunks"][1] if "chunks" in stage_results else []
+    if failed_addresses:
+        impact_analysis_text = "Incomplete analysis, the analysis failed for {} resource changes: {}\n\n{}".format(
+            len(failed_addresses), ", ".join(failed_addresses), impact_analysis_text
+        )
+    result = stage_results.get("ami", NO_AMI_CHANGES)
+    description = stage_results["summary"]
+    usage_summary = usage_recorder.emit(workspace_id=workspace_id)
+    model_router.emit(scheduler.timings, usage_summary["stages"])
+
+    if workspace_id and findings:
+        addresses = {}
+        for address, address_fingerprint in fingerprints.items():
+            finding = findings.get(address, cached_findings.get(address))
+            if finding:
+                addresses[address] = {"fingerprint": address_fingerprint, "finding": finding}
+        workspace_store.get_store().save(workspace_id, analysis_route.model_id, PROMPT_VERSION, addresses)
+
+    logger.info("##### Report #####")
+    logger.info("Analysis : {}".format(analysis_response_text))
+    logger.info("Impact Analysis: {}".format(impact_analysis_text))
+    logger.info("AMI summary: {}".format(result))
+    logger.info("Terraform plan summary: {}".format(description))
+
+    results = []
+
+    # The plan was analyzed concurrently with its input check, withhold every outcome when the check intervened
+    guardrail_status, guardrail_response, checked_chars = stage_results.get("plan_guardrail", (True, None, len(plan_text)))
+    if not guardrail_status:
+        omitted = "Output omitted due to Terraform plan input : {}".format(guardrail_response)
+        description = impact_analysis_text = result = omitted
+        for name in ("summary_guardrail", "impact_guardrail", "ami_guardrail"):
+            stage_results[name] = (True, None)
+
+    guardrail_status, guardrail_response = stage_results["summary_guardrail"]
+    if guardrail_status:
+        results.append(generate_runtask_result(outcome_id="Plan-Summary", description="Summary of Terraform plan", result=description[:9000])) # body max limit of 10,000 chars
+    else:
+        results.append(generate_runtask_result(outcome_id="Plan-Summary", description="Summary of Terraform plan", result="Output omitted due to : {}".format(guardrail_response)))
+
+    guardrail_status, guardrail_response = stage_results["impact_guardrail"]
+    if guardrail_status:
+        results.append(generate_runtask_result(outcome_id="Impact-Analysis", description="Security and operational impact assessment", result=impact_analysis_text[:9000], incomplete=bool(failed_addresses)))
+    else:
+        results.append(generate_runtask_result(outcome_id="Impact-Analysis", description="Security and operational impact assessment", result="Output omitted due to : {}".format(guardrail_response)))
+
+    # The fixed text reported without AMI changes does not need a guardrail check
+    guardrail_status, guardrail_response = stage_results.get("ami_guardrail", (True, None))
+    if guardrail_status:
+        results.append(generate_runtask_result(outcome_id="AMI-Summary", description="Summary of AMI changes", result=result[:700]))
+    else:
+        results.append(generate_runtask_result(outcome_id="AMI-Summary", description="Summary of AMI changes", result="Output omitted due to : {}".format(guardrail_response)))
+
+    runtask_high_level ="Terraform plan analyzer using Amazon Bedrock, expand the findings below to learn more. Click `view more details` to get the detailed logs"
+    if failed_addresses:
+        runtask_high_level += ". The analysis failed for {} resource changes, see the impact analysis".format(len(failed_addresses))
+    if checked_chars < len(plan_text):
+        runtask_high_level += ". The guardrail input check only covered the first {} of {} plan characters".format(checked_chars, len(plan_text))
+    return runtask_high_level, results
+
+def plan_prefix(plan_text, findings_text="", cache=False):
+    """
+    First content blocks of the prompts built from the plan, identical for every stage.
+    With cache, a cache point follows the plan when it is long enough to be cached by Bedrock.
+    Docs - https://docs.aws.amazon.com/bedrock/latest/userguide/prompt-caching.html
+    """
+    text = f"""
+    Terraform plan, each changed resource address with only the attribute paths that change, unchanged attributes are omitted:
+    {plan_text}
+    """
+    if findings_text:
+        text += f"""
+    Resources unchanged since the previous analysis of this workspace and their findings, they are not repeated in the Terraform plan above but must be covered as well:
+    {findings_text}
+    """
+    content = [{"text": text}]
+    if cache and plan_reducer.estimate_tokens(text) >= prompt_cache_min_tokens:
+        content.append(CACHE_POINT)
+    return content
+
+def analyze_plan(plan_text, findings_text="", stage="analysis", model=None, prefix_written=None):
 
     #####################################################################
     ##### First, do generic evaluation of the Terraform plan output #####
     #####################################################################
 
     logger.info("##### Evaluating Terraform plan output #####")
-    prompt = """
+    prompt = f"""
     You must respond with ONLY a JSON object. Do not include any explanatory text, conversation, or markdown formatting.
 
-    Analyze the terraform plan and return this exact JSON structure:
-    {"thinking": "brief analysis", "resources": "list of resources being created, modified, or deleted", "impact_analysis": "assessment formatted as markdown with sections: ## 🔍 Impact Analysis\n\n### 🚨 Security Concerns\n- **Critical/High/Medium**: Description\n- **Risk Level**: Assessment\n\n### ⚠️ Configuration Issues\n- **Issue Type**: Description\n- **Impact**: Consequence\n\n### 📊 Operational Impact\n- **Infrastructure**: What's being deployed\n- **Cost**: Cost implications\n\n### 💡 Recommendations\n- **Priority 1**: Most critical fix\n- **Priority 2**: Secondary concerns\n- **Warning**: Important warnings"}
-
-    Terraform plan:
-    """
-
-    prompt += f"""
-    {tf_plan_json["resource_changes"]}
+    Analyze the terraform plan above and return this exact JSON structure:
+    {{"thinking": "brief analysis", "resources": "list of resources being created, modified, or deleted", "findings": {{"<resource address>": "one sentence finding for each resource address in the Terraform plan"}}, "impact_analysis": "{IMPACT_ANALYSIS_FORMAT}"}}
     """
 
     messages = [
         {
             "role": "user",
-            "content": [
-                {
-                    "text": prompt,
-                }
-            ],
+            "content": plan_prefix(plan_text, findings_text, cache=prefix_written is not None) + [{"text": prompt}],
         }
     ]
 
-    system_text = "You are an assistant that helps reading infrastructure changes from JSON objects generated by terraform"
-
-    stop_reason, analysis_response = stream_messages(
-        bedrock_client, model_id, messages, system_text
-    )
+    json_parser = json_stream.IncrementalObjectParser()
+    try:
+        stop_reason, analysis_response, usage = resilient_bedrock.stream_messages(
+            bedrock_client, model or model_id, messages, PLAN_SYSTEM_TEXT, json_parser=json_parser,
+            on_first_token=prefix_written.set if prefix_written is not None else None,
+        )
+    finally:
+        # Never leave the summary waiting, the prefix is not cached when the call failed
+        if prefix_written is not None:
+            prefix_written.set()
+    usage_recorder.record(stage, usage)
 
     logger.debug("Analysis response: {}".format(analysis_response))
+    logger.info("Analysis fields complete after ms : {}".format(json.dumps(json_parser.field_ms)))
 
     try:
-        parsed_response = clean_response(analysis_response["content"][0]["text"])
+        parsed_response = parse_response(analysis_response, json_parser)
         analysis_response_text = parsed_response["resources"]
         impact_analysis_text = parsed_response.get("impact_analysis", "No impact analysis available")
+        findings = parsed_response.get("findings", {})
+        if not isinstance(findings, dict):
+            findings = {}
     except Exception as e:
         logger.error(f"Error parsing analysis response: {e}")
         analysis_response_text = "Error: Could not parse Terraform plan analysis"
         impact_analysis_text = "Error: Could not parse impact analysis"
+        findings = {}
 
     logger.debug("Analysis response Text: {}".format(analysis_response_text))
+    return analysis_response_text, impact_analysis_text, findings
+
+def analyze_chunks(chunks, model=None):
 
     #####################################################################
-    ######## Secondly, evaluate AMIs per analysis                ########
+    ##### Map step, evaluate each chunk of the Terraform plan       #####
+    #####################################################################
+
+    logger.info(f"##### Evaluating Terraform plan in {len(chunks)} chunks #####")
+
+    def analyze_chunk(chunk):
+        try:
+            return analyze_plan(plan_reducer.serialize(chunk), stage="chunk_analysis", model=model)
+        except Exception as e:
+            logger.error(f"Chunk analysis failed: {type(e).__name__}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=chunk_max_concurrency) as executor:
+        results = list(executor.map(analyze_chunk, chunks))
+
+    chunk_results = []
+    failed_addresses = []
+    for chunk, chunk_result in zip(chunks, results):
+        if chunk_result is None or str(chunk_result[0]).startswith("Error"):
+            failed_addresses.extend(resource_change["address"] for resource_change in chunk)
+        else:
+            chunk_results.append(chunk_result)
+    if failed_addresses:
+        logger.error(f"Analysis failed for {len(failed_addresses)} resource changes in {len(chunks) - len(chunk_results)} chunks")
+    return chunk_results, failed_addresses
+
+def reduce_analyses(chunk_results, findings_text="", model=None, token_limit=None):
+
+    #####################################################################
+    ##### Reduce step, merge the analyses of every chunk            #####
+    #####################################################################
+
+    if not chunk_results:
+        return "Error: Could not parse Terraform plan analysis", "Error: Could not parse impact analysis", {}
+
+    logger.info("##### Merging Terraform plan chunk analyses #####")
+    findings = {}
+    partial_analyses = []
+    for analysis_response_text, impact_analysis_text, chunk_findings in chunk_results:
+        findings.update(chunk_findings)
+        partial_analyses.append({"resources": analysis_response_text, "impact_analysis": impact_analysis_text})
+
+    # The partial analyses of a large plan may not fit one request, they are merged in batches until they do
+    prompt_tokens = plan_reducer.estimate_tokens(merge_prompt([], findings_text))
+    rounds = 0
+    while token_limit and len(partial_analyses) > 1 and prompt_tokens + analyses_tokens(partial_analyses) > token_limit:
+        rounds += 1
+        batch_tokens = token_limit - plan_reducer.estimate_tokens(merge_prompt([]))
+        partial_analyses = [trim_analysis(partial, batch_tokens // 2) for partial in partial_analyses]
+        batches = batch_analyses(partial_analyses, batch_tokens)
+        logger.info(f"Merge round {rounds}: {len(partial_analyses)} partial analyses in {len(batches)} batches")
+        with ThreadPoolExecutor(max_workers=chunk_max_concurrency) as executor:
+            partial_analyses = list(
+                executor.map(lambda batch: batch[0] if len(batch) == 1 else merge_analyses(batch, model=model), batches)
+            )
+
+    merged = merge_analyses(partial_analyses, findings_text, model)
+    return merged["resources"], merged["impact_analysis"], findings
+
+def analyses_tokens(partial_analyses):
+    return plan_reducer.estimate_tokens(json.dumps(partial_analyses))
+
+def batch_analyses(partial_analyses, max_tokens):
+    """Consecutive batches of at most max_tokens estimated tokens, each batch but the last holds two analyses or more"""
+    batches = [[]]
+    batch_tokens = 0
+    for partial in partial_analyses:
+        tokens = analyses_tokens([partial])
+        if len(batches[-1]) >= 2 and batch_tokens + tokens > max_tokens:
+            batches.append([])
+            batch_tokens = 0
+        batches[-1].append(partial)
+        batch_tokens += tokens
+    return batches
+
+def trim_analysis(partial, max_tokens):
+    """Shorten the texts of a partial analysis above max_tokens estimated tokens, two of them fit one merge request"""
+    if analyses_tokens([partial]) <= max_tokens:
+        return partial
+    logger.warning(f"Partial analysis of {analyses_tokens([partial])} tokens trimmed to {max_tokens} tokens before merging")
+    # Both texts share the budget, a third of it each leaves room for the JSON escapes
+    max_chars = max_tokens * 4 // 3
+    return {key: (value if isinstance(value, str) else json.dumps(value))[:max_chars] for key, value in partial.items()}
+
+def merge_prompt(partial_analyses, findings_text=""):
+    prompt = f"""
+    You must respond with ONLY a JSON object. Do not include any explanatory text, conversation, or markdown formatting.
+
+    The terraform plan was too large for a single analysis and each part of it was analyzed separately. Merge the partial analyses below, removing duplicates, and return this exact JSON structure:
+    {{"thinking": "brief analysis", "resources": "list of resources being created, modified, or deleted", "impact_analysis": "{IMPACT_ANALYSIS_FORMAT}"}}
+
+    Partial analyses:
+    {json.dumps(partial_analyses)}
+    """
+
+    if findings_text:
+        prompt += f"""
+    Resources unchanged since the previous analysis of this workspace and their findings, they must also be covered by the resources list and the impact analysis:
+    {findings_text}
+    """
+    return prompt
+
+def merge_analyses(partial_analyses, findings_text="", model=None):
+    """Merge partial analyses with one Bedrock call, they are concatenated when the response can not be parsed"""
+    messages = [{"role": "user", "content": [{"text": merge_prompt(partial_analyses, findings_text)}]}]
+    json_parser = json_stream.IncrementalObjectParser()
+    stop_reason, response, usage = resilient_bedrock.stream_messages(
+        bedrock_client=bedrock_client,
+        model_id=model or model_id,
+        messages=messages,
+        system_text="You are an assistant that helps reading infrastructure changes from JSON objects generated by terraform",
+        json_parser=json_parser,
+    )
+    usage_recorder.record("analysis_reduce", usage)
+
+    try:
+        parsed_response = parse_response(response, json_parser)
+        return {
+            "resources": parsed_response["resources"],
+            "impact_analysis": parsed_response.get("impact_analysis", "No impact analysis available"),
+        }
+    except Exception as e:
+        logger.error(f"Error parsing merged analysis response: {e}")
+        return {
+            "resources": "\n".join(partial["resources"] for partial in partial_analyses if isinstance(partial["resources"], str)),
+            "impact_analysis": "\n\n".join(partial["impact_analysis"] for partial in partial_analyses if isinstance(partial["impact_analysis"], str)),
+        }
+
+def analyze_amis(plan_ami_changes, model=None):
+
+    #####################################################################
+    ######## Secondly, evaluate the AMI changes of the plan      ########
     #####################################################################
     logger.info("##### Evaluating AMI information #####")
     prompt = f"""
-    For any Amazon Machine Image (AMI) changes in this analysis, use the get_ami_releases function to compare old and new AMI details including kernel, docker, and ECS agent versions.
+    Compare the old and new Amazon Machine Image (AMI) of each of these AMI changes including kernel, docker, and ECS agent versions, use the get_ami_releases function for any other AMI you need.
 
-    Analysis: {analysis_response_text}
+    AMI changes: {json.dumps(plan_ami_changes, separators=(",", ":"))}
     """
 
-    messages = [{"role": "user", "content": [{"text": prompt}]}]
+    # The AMI ids are already known, call the tool directly instead of waiting for the model to request it
+    tool_use = {"role": "assistant", "content": [{"toolUse": {
+        "toolUseId": "tooluse_plan_ami_changes",
+        "name": "GetECSAmisReleases",
+        "input": {"image_ids": ami_changes.ami_ids(plan_ami_changes)},
+    }}]}
+    messages = [{"role": "user", "content": [{"text": prompt}]}, tool_use, execute_tool_calls(tool_use["content"])]
 
-    stop_reason, response = stream_messages(
+    stop_reason, response, usage = resilient_bedrock.stream_messages(
         bedrock_client=bedrock_client,
-        model_id=model_id,
+        model_id=model or model_id,
         messages=messages,
         system_text="Provide direct, technical analysis of AMI changes without conversational language.",
         tool_config=tool_config,
     )
+    usage_recorder.record("ami", usage)
 
     # Add response to message history
     messages.append(response)
+    tokens_used = usage.get("total_tokens") or 0
 
     # Check if there is an invoke function request from Claude
+    iterations = 0
     while stop_reason == "tool_use":
-        for content in response["content"]:
-            if "toolUse" in content:
-                tool = content["toolUse"]
+        iterations += 1
+        tool_result_message = execute_tool_calls(response["content"])
 
-                if tool["name"] == "GetECSAmisReleases":
+        # Release notes of earlier turns were already analyzed, do not resend them on every turn
+        compact_tool_results(messages)
 
-                    release_details = GetECSAmisReleases().execute(
-                        tool["input"]["image_ids"]
-                    )
-                    release_details_info = release_details if release_details else "No release notes were found the ami."
+        final_turn = iterations >= tool_max_iterations or tokens_used >= tool_token_budget
+        if final_turn:
+            logger.warning(f"AMI tool loop stopped after {iterations} iterations and {tokens_used} tokens")
+            tool_result_message["content"].append({"text": "Tool call limit reached, answer with the information gathered so far without calling tools."})
 
-                    tool_result = {
-                        "toolUseId": tool["toolUseId"],
-                        "content": [{"json": {"release_detail": release_details_info}}],
-                    }
-
-                    tool_result_message = {
-                        "role": "user",
-                        "content": [{"toolResult": tool_result}],
-                    }
-                    # Add the result info to message array
-                    messages.append(tool_result_message)
+        # Add the result info to message array
+        messages.append(tool_result_message)
 
         # Send the messages, including the tool result, to the model.
-        stop_reason, response = stream_messages(
+        stop_reason, response, usage = resilient_bedrock.stream_messages(
             bedrock_client=bedrock_client,
-            model_id=model_id,
+            model_id=model or model_id,
             messages=messages,
             system_text="Provide direct, technical analysis of AMI changes without conversational language.",
             tool_config=tool_config,
         )
+        usage_recorder.record("ami", usage)
+        tokens_used += usage.get("total_tokens") or 0
 
         # Add response to message history
         messages.append(response)
+        if final_turn:
+            break
 
     # Extract the actual response text from Bedrock
-    if response and "content" in response and len(response["content"]) > 0:
-        result = response["content"][0]["text"]
+    texts = [content["text"] for content in (response or {}).get("content", []) if content.get("text")]
+    if texts:
+        result = "\n".join(texts)
         logger.debug("AMI analysis response: {}".format(result))
     else:
         result = "Error: No AMI analysis response received from Bedrock"
         logger.error("No AMI analysis content received from Bedrock")
 
+    return result
+
+def execute_tool_calls(content_blocks):
+    """
+    Run every tool call of one model turn concurrently.
+    Returns:
+        dict: A single user message with one toolResult per toolUse block, in the order of the calls.
+    """
+    tool_uses = [content["toolUse"] for content in content_blocks if "toolUse" in content]
+
+    def execute(tool):
+        if tool["name"] != "GetECSAmisReleases":
+            return {"toolUseId": tool["toolUseId"], "content": [{"text": f"Unknown tool {tool['name']}"}], "status": "error"}
+        try:
+            release_details = GetECSAmisReleases().execute(tool["input"]["image_ids"])
+        except Exception as e:
+            logger.error(f"Error executing {tool['name']}: {e}")
+            return {"toolUseId": tool["toolUseId"], "content": [{"text": f"Error: {e}"}], "status": "error"}
+        release_details_info = release_details if release_details else "No release notes were found the ami."
+        return {"toolUseId": tool["toolUseId"], "content": [{"json": {"release_detail": release_details_info}}]}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(tool_max_concurrency, len(tool_uses)))) as executor:
+        tool_results = list(executor.map(execute, tool_uses))
+
+    return {"role": "user", "content": [{"toolResult": tool_result} for tool_result in tool_results]}
+
+def compact_tool_results(messages):
+    """Replace the release notes of tool results already sent to the model with the AMIs they described"""
+    for message in messages:
+        if message["role"] != "user":
+            continue
+        for content in message["content"]:
+            tool_result = content.get("toolResult")
+            if not tool_result:
+                continue
+            for block in tool_result["content"]:
+                release_detail = block.get("json", {}).get("release_detail")
+                if isinstance(release_detail, list):
+                    block["json"] = {
+                        "release_detail": [
+                            {key: entry[key] for key in ("ami_id", "ami_name", "os_name", "os_architecture") if key in entry}
+                            for entry in release_detail
+                        ],
+                        "note": "Release details compacted, they were provided in an earlier turn.",
+                    }
+
+def summarize_plan(plan_text, findings_text="", model=None, prefix_written=None):
+
     #####################################################################
     ######### Third, generate short summary                     #########
     #####################################################################
 
     logger.info("##### Generating short summary #####")
-    prompt = f"""
-    Provide a concise summary of these Terraform changes. Focus on what resources are being created, modified, or deleted:
-
-    {tf_plan_json["resource_changes"]}
+    prompt = """
+    Provide a concise summary of the Terraform changes above. Focus on what resources are being created, modified, or deleted.
+    Provide a direct, technical summary without conversational language.
     """
-    message_desc = [{"role": "user", "content": [{"text": prompt}]}]
-    stop_reason, response = stream_messages(
+    message_desc = [
+        {
+            "role": "user",
+            "content": plan_prefix(plan_text, findings_text, cache=prefix_written is not None) + [{"text": prompt}],
+        }
+    ]
+    if prefix_written is not None and not prefix_written.wait(prompt_cache_wait_seconds):
+        logger.warning(f"Plan prefix not cached after {prompt_cache_wait_seconds} seconds, summarizing without it")
+    stop_reason, response, usage = resilient_bedrock.stream_messages(
         bedrock_client=bedrock_client,
-        model_id=model_id,
+        model_id=model or model_id,
         messages=message_desc,
-        system_text="Provide a direct, technical summary without conversational language.",
+        system_text=PLAN_SYSTEM_TEXT,
         tool_config=None,
     )
+    usage_recorder.record("summary", usage)
 
     # Extract the actual response text from Bedrock
     if response and "content" in response and len(response["content"]) > 0:
@@ -171,35 +631,34 @@ def eval(tf_plan_json):
         description = "Error: No response received from Bedrock"
         logger.error("No response content received from Bedrock")
 
-    logger.info("##### Report #####")
-    logger.info("Analysis : {}".format(analysis_response_text))
-    logger.info("Impact Analysis: {}".format(impact_analysis_text))
-    logger.info("AMI summary: {}".format(result))
-    logger.info("Terraform plan summary: {}".format(description))
-
-    results = []
-
-    guardrail_status, guardrail_response = guardrail_inspection(str(description))
-    if guardrail_status:
-        results.append(generate_runtask_result(outcome_id="Plan-Summary", description="Summary of Terraform plan", result=description[:9000])) # body max limit of 10,000 chars
-    else:
-        results.append(generate_runtask_result(outcome_id="Plan-Summary", description="Summary of Terraform plan", result="Output omitted due to : {}".format(guardrail_response)))
-        description = "Bedrock guardrail triggered : {}".format(guardrail_response)
-
-    guardrail_status, guardrail_response = guardrail_inspection(str(impact_analysis_text))
-    if guardrail_status:
-        results.append(generate_runtask_result(outcome_id="Impact-Analysis", description="Security and operational impact assessment", result=impact_analysis_text[:9000]))
-    else:
-        results.append(generate_runtask_result(outcome_id="Impact-Analysis", description="Security and operational impact assessment", result="Output omitted due to : {}".format(guardrail_response)))
+    return description
 
-    guardrail_status, guardrail_response = guardrail_inspection(str(result))
-    if guardrail_status:
-        results.append(generate_runtask_result(outcome_id="AMI-Summary", description="Summary of AMI changes", result=result[:700]))
-    else:
-        results.append(generate_runtask_result(outcome_id="AMI-Summary", description="Summary of AMI changes", result="Output omitted due to : {}".format(guardrail_response)))
+def inspect_plan_input(plan_text):
+    """
+    Guardrail check of the plan in overlapping chunks, sent concurrently within the Bedrock concurrency limit.
+    Returns:
+        status (bool): False when the guardrail intervened on any chunk.
+        response (str): Guardrail output of the first chunk it intervened on.
+        checked_chars (int): Length of the plan prefix covered by the checked chunks.
+    """
+    step = max(1, guardrail_input_max_chars - GUARDRAIL_INPUT_OVERLAP_CHARS)
+    starts = list(range(0, max(1, len(plan_text) - GUARDRAIL_INPUT_OVERLAP_CHARS), step))
+    checked = starts[:guardrail_input_max_requests]
+    checked_chars = min(len(plan_text), checked[-1] + guardrail_input_max_chars)
+    if len(checked) < len(starts):
+        logger.warning(
+            f"Guardrail input check limited to {len(checked)} of {len(starts)} chunks, "
+            f"the first {checked_chars} of {len(plan_text)} plan characters"
+        )
 
-    runtask_high_level ="Terraform plan analyzer using Amazon Bedrock, expand the findings below to learn more. Click `view more details` to get the detailed logs"
-    return runtask_high_level, results
+    with ThreadPoolExecutor(max_workers=max(1, min(chunk_max_concurrency, len(checked)))) as executor:
+        verdicts = list(executor.map(
+            lambda start: guardrail_inspection(plan_text[start:start + guardrail_input_max_chars], "INPUT"), checked
+        ))
+    for status, response in verdicts:
+        if not status:
+            return False, response, checked_chars
+    return True, verdicts[0][1], checked_chars
 
 def guardrail_inspection(input_text, input_mode = 'OUTPUT'):
 
@@ -208,9 +667,17 @@ def guardrail_inspection(input_text, input_mode = 'OUTPUT'):
     #####################################################################
 
     if guardrail_id and guardrail_version:
+        cache_key = hashlib.sha256(
+            json.dumps([guardrail_id, guardrail_version, input_mode, input_text]).encode("utf-8")
+        ).hexdigest()
+        verdict = guardrail_cache.get(cache_key)
+        if verdict:
+            return tuple(verdict)
+
         logger.info("##### Scanning Terraform plan output with Amazon Bedrock Guardrail #####")
 
-        response = bedrock_client.apply_guardrail(
+        response = resilient_bedrock.apply_guardrail(
+            bedrock_client,
             guardrailIdentifier=guardrail_id,
             guardrailVersion=guardrail_version,
             source=input_mode,
@@ -229,15 +696,25 @@ def guardrail_inspection(input_text, input_mode = 'OUTPUT'):
             logger.info("Guardrail action : {}".format(response["action"]))
             logger.info("Guardrail output : {}".format(response["outputs"]))
             logger.debug("Guardrail assessments : {}".format(response["assessments"]))
-            return False, response["outputs"][0]["text"]
+            verdict = (False, response["outputs"][0]["text"])
+            guardrail_cache.put(cache_key, verdict)
+            return verdict
 
         elif response["action"] in ["NONE"]:
             logger.info("No Guardrail action required")
-            return True, "No Guardrail action required"
+            verdict = (True, "No Guardrail action required")
+            guardrail_cache.put(cache_key, verdict)
+            return verdict
 
     else:
         return True, "Guardrail inspection skipped"
 
+def parse_response(response, json_parser):
+    # Fields decoded while streaming, the complete text is only cleaned up when it was not a single JSON object
+    if json_parser.complete:
+        return json_parser.fields
+    return clean_response(response["content"][0]["text"])
+
 def clean_response(json_str):
     try:
         # First try to parse as-is
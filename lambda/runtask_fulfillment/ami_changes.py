@@ -0,0 +1,50 @@
+import re
+
+from utils import logger
+
+AMI_ID_PATTERN = re.compile(r"^ami-[0-9a-f]{8}(?:[0-9a-f]{9})?$")
+
+
+def find_ami_changes(resource_changes):
+    """
+    Find the AMI id transitions in the reduced resource changes, without calling Bedrock.
+    Any changed attribute path whose old or new value is an AMI id counts, whatever its name or nesting, so
+    aws_instance.ami, launch template and launch configuration image_id, and the image overrides inlined in
+    auto scaling groups, fleets or ECS capacity provider launch templates are all covered.
+    Args:
+        resource_changes (list): Reduced resource changes, see plan_reducer.reduce_plan.
+
+    Returns:
+        list: One {address, type, actions, attribute, before, after} entry per changed AMI attribute.
+    """
+    ami_changes = []
+    for resource_change in resource_changes:
+        for path, change in resource_change.get("changes", {}).items():
+            before, after = change.get("before"), change.get("after")
+            if not (is_ami_id(before) or is_ami_id(after)):
+                continue
+            ami_changes.append({
+                "address": resource_change.get("address"),
+                "type": resource_change.get("type"),
+                "actions": resource_change.get("actions"),
+                "attribute": path,
+                "before": before,
+                "after": after,
+            })
+
+    logger.info(f"Found {len(ami_changes)} AMI changes in {len(resource_changes)} resource changes")
+    return ami_changes
+
+
+def ami_ids(ami_changes):
+    """Distinct AMI ids of the transitions, old and new, in order of appearance"""
+    ids = []
+    for ami_change in ami_changes:
+        for value in (ami_change["before"], ami_change["after"]):
+            if is_ami_id(value) and value not in ids:
+                ids.append(value)
+    return ids
+
+
+def is_ami_id(value):
+    return isinstance(value, str) and AMI_ID_PATTERN.match(value) is not None
@@ -0,0 +1,355 @@
+import random
+import threading
+import time
+
+from utils import logger, stream_messages
+
+# Error codes worth another attempt, event stream errors use the same codes with a lower case first letter
+RETRYABLE_ERROR_CODES = {
+    code.lower()
+    for code in (
+        "ThrottlingException",
+        "TooManyRequestsException",
+        "ServiceUnavailableException",
+        "InternalServerException",
+        "ModelNotReadyException",
+        "ModelTimeoutException",
+        "ModelStreamErrorException",
+        "RequestTimeout",
+    )
+}
+THROTTLING_ERROR_CODES = {"throttlingexception", "toomanyrequestsexception"}
+
+# Connection and timeout errors, matched by class name so botocore is not imported during the cold start
+RETRYABLE_ERROR_TYPES = {"HTTPClientError", "ConnectionError", "ProtocolError", "IncompleteRead", "TimeoutError"}
+
+
+class StreamStalledError(Exception):
+    """Raised when a response stream sent no event within the idle timeout"""
+    pass
+
+
+class RequestCancelledError(Exception):
+    """Raised in a hedged request whose twin answered first"""
+    pass
+
+
+class DeadlineExceededError(Exception):
+    """Raised when the run has no time left for a Bedrock request, before the Lambda function times out"""
+    pass
+
+
+def error_code(error):
+    return str(getattr(error, "response", {}).get("Error", {}).get("Code", "")).lower()
+
+
+def is_retryable(error):
+    if isinstance(error, StreamStalledError) or error_code(error) in RETRYABLE_ERROR_CODES:
+        return True
+    return any(cls.__name__ in RETRYABLE_ERROR_TYPES for cls in type(error).__mro__)
+
+
+def is_throttling(error):
+    return error_code(error) in THROTTLING_ERROR_CODES
+
+
+class AdaptiveLimiter:
+    """
+    Bounds the concurrent Bedrock requests of every thread of the container.
+    The limit halves on each throttling error and grows back by one request per limit successes.
+    """
+
+    def __init__(self, max_concurrency):
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self.condition = threading.Condition()
+
+    def acquire(self, blocking=True):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                if not blocking:
+                    return False
+                self.condition.wait()
+            self.in_flight += 1
+            return True
+
+    def release(self, throttled=False):
+        with self.condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(1.0, self.limit / 2)
+            else:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+
+class MonitoredStream:
+    """
+    Response stream wrapper closing the stream when no event arrives in time, the first event may take
+    first_event_timeout while the prompt is processed, the following ones idle_timeout. The stream is also closed
+    at the deadline of the run, however steadily it answers.
+    """
+
+    def __init__(self, stream, first_event_timeout, idle_timeout, on_first_event=None, deadline=None):
+        self.stream = stream
+        self.first_event_timeout = first_event_timeout
+        self.idle_timeout = idle_timeout
+        self.on_first_event = on_first_event
+        self.deadline = deadline
+        self.last_event = time.monotonic()
+        self.received = False
+        self.stalled = False
+        self.expired = False
+        self.cancelled = False
+        self.done = threading.Event()
+
+    def __iter__(self):
+        threading.Thread(target=self._watch, daemon=True).start()
+        try:
+            for event in self.stream:
+                self._check()
+                self.last_event = time.monotonic()
+                if not self.received:
+                    self.received = True
+                    if self.on_first_event is not None:
+                        self.on_first_event()
+                yield event
+        except (StreamStalledError, RequestCancelledError):
+            raise
+        except Exception as e:
+            self._check()
+            raise e
+        finally:
+            self.done.set()
+        self._check()
+
+    def _check(self):
+        if self.cancelled:
+            raise RequestCancelledError("Request cancelled, its hedged twin answered first")
+        if self.expired:
+            raise DeadlineExceededError("Response stream closed at the deadline of the run")
+        if self.stalled:
+            timeout = self.idle_timeout if self.received else self.first_event_timeout
+            raise StreamStalledError(f"No response stream event within {timeout} seconds")
+
+    def _watch(self):
+        poll = min(1.0, self.idle_timeout / 4, self.first_event_timeout / 4)
+        while not self.done.wait(poll):
+            if self.deadline is not None and time.monotonic() > self.deadline:
+                self.expired = True
+                self._close_stream()
+                return
+            timeout = self.idle_timeout if self.received else self.first_event_timeout
+            if time.monotonic() - self.last_event > timeout:
+                self.stalled = True
+                self._close_stream()
+                return
+
+    def _close_stream(self):
+        close = getattr(self.stream, "close", None)
+        if close is not None:
+            try:
+                close()
+            except Exception as e:
+                logger.debug(f"Closing the response stream failed: {e}")
+
+    def cancel(self):
+        self.cancelled = True
+        self.done.set()
+        self._close_stream()
+
+    def close(self):
+        self.done.set()
+        self._close_stream()
+
+
+class _MonitoredClient:
+    """Client handed to stream_messages for one request, its converse_stream returns a MonitoredStream"""
+
+    def __init__(self, client, first_event_timeout, idle_timeout, on_first_event, deadline=None):
+        self.client = client
+        self.first_event_timeout = first_event_timeout
+        self.idle_timeout = idle_timeout
+        self.on_first_event = on_first_event
+        self.deadline = deadline
+        self.stream = None
+        self.cancelled = False
+
+    def converse_stream(self, **kwargs):
+        if self.cancelled:
+            raise RequestCancelledError("Request cancelled before it was sent")
+        response = self.client.converse_stream(**kwargs)
+        self.stream = MonitoredStream(
+            response["stream"], self.first_event_timeout, self.idle_timeout, self.on_first_event, self.deadline
+        )
+        if self.cancelled:
+            self.stream.cancel()
+        return dict(response, stream=self.stream)
+
+    def cancel(self):
+        self.cancelled = True
+        if self.stream is not None:
+            self.stream.cancel()
+
+
+class ResilientBedrock:
+    """
+    Wrapper of stream_messages and apply_guardrail for a Bedrock runtime client built without botocore retries.
+    - Throttling and transient errors are retried with exponential backoff and full jitter.
+    - A response stream without events for idle_timeout seconds (first_event_timeout for the first one) is
+      closed and retried.
+    - Requests of every thread share one AdaptiveLimiter, throttling lowers its limit.
+    - With hedge_after, a second identical request is sent when the first has not started answering after that
+      many seconds, the first one to answer is kept and the other one is cancelled. The hedged request is only
+      sent when the limiter has a free slot.
+    - With a deadline, set per run from the remaining Lambda execution time, no attempt or retry starts after it
+      and open response streams are closed at it, so the run fails before the function times out.
+    """
+
+    def __init__(self, max_attempts=4, base_delay=1.0, max_delay=20.0, first_event_timeout=30.0,
+                 idle_timeout=20.0, max_concurrency=4, hedge_after=0.0, sleep=time.sleep):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.first_event_timeout = first_event_timeout
+        self.idle_timeout = idle_timeout
+        self.hedge_after = hedge_after
+        self.limiter = AdaptiveLimiter(max_concurrency)
+        self.sleep = sleep
+        # Monotonic time, see hcp_client.deadline_from_context
+        self.deadline = None
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def _retry(self, name, call):
+        for attempt in range(self.max_attempts):
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                raise DeadlineExceededError(f"Bedrock {name} attempt {attempt + 1} not started, the run deadline passed")
+            try:
+                return call(attempt)
+            except Exception as e:
+                if attempt + 1 >= self.max_attempts or not is_retryable(e):
+                    raise
+                delay = self.backoff(attempt)
+                if self.deadline is not None and time.monotonic() + delay >= self.deadline:
+                    logger.warning(f"Bedrock {name} attempt {attempt + 1} failed with {type(e).__name__}, no time left to retry")
+                    raise
+                logger.warning(f"Bedrock {name} attempt {attempt + 1} failed with {type(e).__name__}: {e}, retrying in {delay:.1f} seconds")
+                self.sleep(delay)
+
+    def _limited(self, call, blocking=True):
+        if not self.limiter.acquire(blocking):
+            return None
+        throttled = False
+        try:
+            return call()
+        except Exception as e:
+            throttled = is_throttling(e)
+            raise
+        finally:
+            self.limiter.release(throttled)
+
+    def apply_guardrail(self, bedrock_client, **kwargs):
+        """bedrock_client.apply_guardrail with retries, within the concurrency limit"""
+        return self._retry("apply_guardrail", lambda _: self._limited(lambda: bedrock_client.apply_guardrail(**kwargs)))
+
+    def stream_messages(self, bedrock_client, model_id, messages, system_text, tool_config=None,
+                        stop_sequences=None, json_parser=None, on_first_token=None):
+        """utils.stream_messages with retries, stall detection, the concurrency limit and optional hedging"""
+        first_token_sent = threading.Event()
+
+        def first_token():
+            # Only once, even when the response of a retry or of the hedged request is kept
+            if not first_token_sent.is_set():
+                first_token_sent.set()
+                if on_first_token is not None:
+                    on_first_token()
+
+        def attempt(number):
+            stop_reason, message, usage, parser = self._hedged(
+                bedrock_client, model_id, messages, system_text, tool_config, stop_sequences, json_parser, first_token
+            )
+            if json_parser is not None:
+                json_parser.adopt(parser)
+            usage["retries"] = number
+            return stop_reason, message, usage
+
+        return self._retry("converse_stream", attempt)
+
+    def _hedged(self, bedrock_client, model_id, messages, system_text, tool_config, stop_sequences, json_parser, first_token):
+        changed = threading.Condition()
+        requests = []
+        winner = []
+
+        def request(hedged):
+            """Send one request, returns its [client, ("result" | "error", value)] entry"""
+            parser = json_parser.fork() if json_parser is not None else None
+
+            def on_first_event():
+                with changed:
+                    if not winner:
+                        winner.append(entry)
+                        for other in requests:
+                            if other is not entry:
+                                other[0].cancel()
+                    changed.notify_all()
+
+            def on_first_token():
+                if winner and winner[0] is entry:
+                    first_token()
+
+            def call():
+                stop_reason, message, usage = stream_messages(
+                    client, model_id, messages, system_text, tool_config=tool_config,
+                    stop_sequences=stop_sequences, json_parser=parser, on_first_token=on_first_token,
+                )
+                # Updated in place, the metadata of an early returned response still lands in the same usage
+                usage["hedged_requests"] = int(hedged)
+                return stop_reason, message, usage, parser
+
+            client = _MonitoredClient(
+                bedrock_client, self.first_event_timeout, self.idle_timeout, on_first_event, self.deadline
+            )
+            entry = [client, None]
+            with changed:
+                requests.append(entry)
+            try:
+                outcome = ("result", self._limited(call, blocking=not hedged))
+            except Exception as e:
+                outcome = ("error", e)
+            with changed:
+                entry[1] = outcome
+                changed.notify_all()
+            return entry
+
+        if not self.hedge_after:
+            _, (kind, value) = request(hedged=False)
+            if kind == "error":
+                raise value
+            return value
+
+        threading.Thread(target=request, args=(False,), daemon=True).start()
+        with changed:
+            changed.wait_for(lambda: winner or any(entry[1] for entry in requests), timeout=self.hedge_after)
+            hedge = not winner and not any(entry[1] for entry in requests)
+        if hedge:
+            logger.info(f"Bedrock request without answer after {self.hedge_after} seconds, sending a hedged request")
+            threading.Thread(target=request, args=(True,), daemon=True).start()
+
+        # Wait for the request that answered first, or for every request when none answered
+        expected = 2 if hedge else 1
+        with changed:
+            changed.wait_for(lambda: (winner and winner[0][1]) or (
+                len(requests) == expected and all(entry[1] for entry in requests)
+            ))
+            entries = winner if winner else list(requests)
+
+        errors = []
+        for _, (kind, value) in entries:
+            if kind == "result" and value is not None:
+                return value
+            if kind == "error" and not isinstance(value, RequestCancelledError):
+                errors.append(value)
+        raise errors[0] if errors else RequestCancelledError("No hedged request answered")
@@ -2,10 +2,14 @@ import json
 import logging
 import os
 
-import boto3
-
 import ai
+import claim_check
+import hcp_client
+import plan_reducer
+import result_cache
 import runtask_utils
+from lazy import lazy_client
+from log_sink import RunTaskLogSink
 
 region = os.environ.get("AWS_REGION", None)
 dev_mode = os.environ.get("DEV_MODE", "true")
@@ -14,13 +18,12 @@ log_level = os.environ.get("log_level", logging.INFO)
 logger = logging.getLogger()
 logger.setLevel(log_level)
 
-session = boto3.Session()
-cwl_client = session.client('logs')
+cwl_client = lazy_client('logs')
 
 # THIS IS THE MAIN FUNCTION TO IMPLEMENT BUSINESS LOGIC
 # TO PROCESS THE TERRAFORM PLAN FILE or TERRAFORM CONFIG (.tar.gz)
 # SCHEMA - https://developer.hashicorp.com/terraform/cloud-docs/api-docs/run-tasks/run-tasks-integration#severity-and-status-tags
-def process_run_task(type: str, data: str, run_id: str):
+def process_run_task(type: str, data: str, run_id: str, workspace_id: str = None, deadline: float = None):
     url = None
     results = []
     status = "passed"
@@ -33,35 +36,62 @@ def process_run_task(type: str, data: str, run_id: str):
 
     if type == "pre_plan":
         # --> Process the Terraform config file here and change the above values accordingly
-        logger.debug(f"Processing plan: {data}")
+        logger.debug("Processing plan: %s", data)
 
     elif type == "post_plan":
 
         # --> Process the Terraform plan file here and change the above values accordingly
-        logger.debug(f"Processing plan: {data}")
-        message, results = ai.eval(data)
+        logger.debug("Processing plan: %s", data)
+        resource_changes, _ = plan_reducer.reduce_plan(data)
+        cache = result_cache.get_cache()
+        cache_key = result_cache.build_key(
+            resource_changes, ai.model_id, ai.guardrail_id, ai.guardrail_version, ai.PROMPT_VERSION,
+            config=ai.analysis_config(),
+        )
+
+        cached = cache.get(cache_key)
+        if cached:
+            message, results = cached["message"], cached["results"]
+        else:
+            message, results = ai.eval(
+                data, resource_changes=resource_changes, workspace_id=workspace_id, deadline=deadline
+            )
+            if result_cache.is_cacheable(results):
+                cache.put(cache_key, {"message": message, "results": results})
 
     return url, status, message, results
 
 def write_run_task_log(run_id: str, results: list, cw_log_group_dest: str):
+    log_sink = RunTaskLogSink(cwl_client, cw_log_group_dest, run_id)
     for result in results:
         if result["type"] == "task-result-outcomes":
-            runtask_utils.log_helper(
-                cwl_client = cwl_client,
-                log_group_name = cw_log_group_dest,
-                log_stream_name = run_id,
-                log_message = result["attributes"]["description"]
-            )
-
-            runtask_utils.log_helper(
-                cwl_client = cwl_client,
-                log_group_name = cw_log_group_dest,
-                log_stream_name = run_id,
-                log_message = result["attributes"]["body"]
-            )
+            log_sink.write(result["attributes"]["description"])
+            log_sink.write(result["attributes"]["body"])
+    log_sink.flush()
+
+
+def check_in_results(name, results, state):
+    """
+    Write the results to the claim check store when the Step Functions state would exceed its budget with them.
+    Returns:
+        claim (dict): Reference of the stored results, None when they stay in the state.
+        results (list): Results left in the state, empty when they were stored.
+    """
+    store = claim_check.get_store()
+    if not store.enabled:
+        return None, results
+    try:
+        reference = store.offload(f"{name}/results.json", results, state_bytes=len(json.dumps(state)))
+    except Exception as e:
+        # The results stay in the state, as without the claim check
+        logger.error(f"Claim check failed for {name}: {e}")
+        return None, results
+    if reference is None:
+        return None, results
+    return {"results": reference}, []
 
 # Main handler for the Lambda function
-def lambda_handler(event, _):
+def lambda_handler(event, context):
 
     logger.debug(json.dumps(event, indent=4))
 
@@ -71,6 +101,7 @@ def lambda_handler(event, _):
         "status": "failed",
         "message": "Successful!",
         "results": [],
+        "claim_check": None,
     }
 
     try:
@@ -98,7 +129,7 @@ def lambda_handler(event, _):
 
                 # Download the config to a folder
                 config_file = runtask_utils.download_config(
-                    configuration_version_download_url, access_token
+                    configuration_version_download_url, access_token, context
                 )
                 logger.debug(
                     f"Config downloaded for Workspace: {organization_name}/{workspace_id}, Run: {run_id}\n downloaded at {os.getcwd()}/config"
@@ -117,7 +148,7 @@ def lambda_handler(event, _):
 
                 # Get the plan JSON
                 plan_json, error = runtask_utils.get_plan(
-                    plan_json_api_url, access_token
+                    plan_json_api_url, access_token, context
                 )
                 if plan_json:
                     logger.debug(
@@ -126,7 +157,8 @@ def lambda_handler(event, _):
 
                     # Run the implemented business logic here
                     url, status, message, results = process_run_task(
-                        type="post_plan", data=plan_json, run_id=run_id
+                        type="post_plan", data=plan_json, run_id=run_id, workspace_id=workspace_id,
+                        deadline=hcp_client.deadline_from_context(context, ai.bedrock_deadline_margin),
                     )
 
                     # Write output to cloudwatch log
@@ -138,11 +170,15 @@ def lambda_handler(event, _):
                     logger.debug(f"{error}")
                     message = error
 
+            # Results that would not fit the state travel through the state machine as a claim check reference
+            claim, results = check_in_results(event.get("job_name") or run_id, results, event["payload"])
+
             runtask_response = {
                 "url": url,
                 "status": status,
                 "message": message,
                 "results": results,
+                "claim_check": claim,
             }
             return runtask_response
 
@@ -0,0 +1,101 @@
+import json
+import re
+import time
+
+# Outside strings only brackets, commas and string starts matter, inside strings only quotes and escapes
+_STRUCTURAL = re.compile(r'["{}\[\],]')
+_STRING_SPECIAL = re.compile(r'["\\]')
+
+
+class IncrementalObjectParser:
+    """
+    Parses the first JSON object of a model response from its text deltas as they are streamed.
+    Text before the object, such as a tag or a code fence, is ignored. Each top level member is decoded as soon as
+    the following comma or the closing brace arrives, and `complete` is set once the object closes so the caller
+    can return the response without waiting for the end of the stream.
+    """
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.member = []
+        self.fields = {}
+        self.field_ms = {}
+        self.complete = False
+        self.failed = False
+
+    def fork(self):
+        """New parser for a request that is sent again"""
+        return IncrementalObjectParser()
+
+    def adopt(self, other):
+        """Take over the state of the parser of the request whose response was kept"""
+        self.__dict__.update(other.__dict__)
+
+    def feed(self, text):
+        if self.complete or self.failed:
+            return
+        position = 0
+        if self.depth == 0:
+            position = text.find("{") + 1
+            if position == 0:
+                return
+            self.depth = 1
+        member_start = position
+
+        length = len(text)
+        while position < length:
+            if self.escape:
+                self.escape = False
+                position += 1
+                continue
+            if self.in_string:
+                match = _STRING_SPECIAL.search(text, position)
+                if match is None:
+                    break
+                position = match.end()
+                if match.group() == "\\":
+                    self.escape = True
+                else:
+                    self.in_string = False
+                continue
+
+            match = _STRUCTURAL.search(text, position)
+            if match is None:
+                break
+            token = match.group()
+            position = match.end()
+            if token == '"':
+                self.in_string = True
+            elif token in "{[":
+                self.depth += 1
+            elif token in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    self.member.append(text[member_start:position - 1])
+                    self._end_member()
+                    self.complete = not self.failed
+                    return
+            elif self.depth == 1:
+                self.member.append(text[member_start:position - 1])
+                self._end_member()
+                member_start = position
+
+        self.member.append(text[member_start:])
+
+    def _end_member(self):
+        member = "".join(self.member).strip()
+        self.member = []
+        if not member:
+            return
+        try:
+            decoded = json.loads("{" + member + "}")
+        except ValueError:
+            # Not valid JSON, the caller falls back to parsing the complete text
+            self.failed = True
+            return
+        for key, value in decoded.items():
+            self.fields[key] = value
+            self.field_ms[key] = round((time.monotonic() - self.started_at) * 1000)
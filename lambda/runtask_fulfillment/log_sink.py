@@ -0,0 +1,139 @@
+import threading
+import time
+
+from utils import logger
+
+# PutLogEvents quotas, each event counts its UTF-8 message size plus 26 bytes towards the batch size
+# Docs - https://docs.aws.amazon.com/AmazonCloudWatchLogs/latest/APIReference/API_PutLogEvents.html
+MAX_BATCH_BYTES = 1048576
+MAX_BATCH_EVENTS = 10000
+EVENT_OVERHEAD_BYTES = 26
+MAX_EVENT_BYTES = 262144 - EVENT_OVERHEAD_BYTES
+
+
+class RunTaskLogSink:
+    """
+    Buffers the messages of one run and writes them to a dedicated log stream on flush.
+    The stream is created once and the events are sent in as few PutLogEvents calls as the quotas allow,
+    messages above the event size quota are split in several events.
+    """
+
+    def __init__(self, cwl_client, log_group_name, log_stream_name):
+        self.cwl_client = cwl_client
+        self.log_group_name = log_group_name
+        self.log_stream_name = log_stream_name
+        self.events = []
+        self.stream_created = False
+
+    def write(self, log_message):
+        timestamp = int(round(time.time() * 1000))
+        message = time.strftime("%Y-%m-%d %H:%M:%S") + ": " + str(log_message)
+        for part in split_message(message):
+            self.events.append({"timestamp": timestamp, "message": part})
+
+    def flush(self):
+        """Send the buffered events, API and connection errors are logged so the run task result is still returned"""
+        if not self.events:
+            return
+        try:
+            self._create_stream()
+            for batch in batch_events(self.events):
+                self.cwl_client.put_log_events(
+                    logGroupName=self.log_group_name,
+                    logStreamName=self.log_stream_name,
+                    logEvents=batch,
+                )
+            self.events = []
+        except Exception as e:
+            # ClientError as well as connection errors and read timeouts of botocore
+            logger.error(
+                f"Unable to write run task log to {self.log_group_name}/{self.log_stream_name}: {type(e).__name__}: {e}"
+            )
+
+    def _create_stream(self):
+        if self.stream_created:
+            return
+        try:
+            self.cwl_client.create_log_stream(logGroupName=self.log_group_name, logStreamName=self.log_stream_name)
+        except Exception as e:
+            # Matched by error code so botocore is not imported during the cold start
+            if getattr(e, "response", {}).get("Error", {}).get("Code") != "ResourceAlreadyExistsException":
+                raise
+        self.stream_created = True
+
+
+def split_message(message, max_bytes=MAX_EVENT_BYTES):
+    """Split a message in parts of at most max_bytes UTF-8 bytes without cutting a multi-byte character"""
+    data = message.encode("utf-8")
+    if len(data) <= max_bytes:
+        return [message]
+    parts = []
+    start = 0
+    while start < len(data):
+        end = min(start + max_bytes, len(data))
+        while end < len(data) and (data[end] & 0xC0) == 0x80:
+            end -= 1
+        parts.append(data[start:end].decode("utf-8"))
+        start = end
+    return parts
+
+
+def batch_events(events, max_bytes=MAX_BATCH_BYTES, max_events=MAX_BATCH_EVENTS):
+    """Group the events, in chronological order, into PutLogEvents batches within the size and count quotas"""
+    batch = []
+    batch_bytes = 0
+    for event in sorted(events, key=lambda event: event["timestamp"]):
+        event_bytes = len(event["message"].encode("utf-8")) + EVENT_OVERHEAD_BYTES
+        if batch and (batch_bytes + event_bytes > max_bytes or len(batch) == max_events):
+            yield batch
+            batch, batch_bytes = [], 0
+        batch.append(event)
+        batch_bytes += event_bytes
+    if batch:
+        yield batch
+
+
+class LocalLogsClient:
+    """
+    In-memory stand-in of the CloudWatch Logs client for local runs and benchmarks.
+    Enforces the PutLogEvents quotas, adds a fixed latency per call and counts the calls per operation.
+    """
+
+    def __init__(self, latency_seconds=0.0):
+        self.latency_seconds = latency_seconds
+        self.streams = {}
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def _call(self, operation):
+        with self.lock:
+            self.calls[operation] = self.calls.get(operation, 0) + 1
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+    def create_log_stream(self, logGroupName, logStreamName):
+        self._call("CreateLogStream")
+        with self.lock:
+            if (logGroupName, logStreamName) in self.streams:
+                raise _client_error("ResourceAlreadyExistsException", "CreateLogStream")
+            self.streams[(logGroupName, logStreamName)] = []
+        return {}
+
+    def put_log_events(self, logGroupName, logStreamName, logEvents, sequenceToken=None):
+        self._call("PutLogEvents")
+        batch_bytes = sum(len(event["message"].encode("utf-8")) + EVENT_OVERHEAD_BYTES for event in logEvents)
+        if len(logEvents) > MAX_BATCH_EVENTS or batch_bytes > MAX_BATCH_BYTES:
+            raise _client_error("InvalidParameterException", "PutLogEvents")
+        if any(len(event["message"].encode("utf-8")) > MAX_EVENT_BYTES for event in logEvents):
+            raise _client_error("InvalidParameterException", "PutLogEvents")
+        with self.lock:
+            if (logGroupName, logStreamName) not in self.streams:
+                raise _client_error("ResourceNotFoundException", "PutLogEvents")
+            self.streams[(logGroupName, logStreamName)].extend(logEvents)
+        return {"nextSequenceToken": str(len(self.streams[(logGroupName, logStreamName)]))}
+
+
+def _client_error(code, operation):
+    from botocore.exceptions import ClientError
+
+    return ClientError({"Error": {"Code": code, "Message": code}}, operation)
@@ -0,0 +1,200 @@
+import json
+from collections import OrderedDict
+
+from utils import logger
+
+UNKNOWN_VALUE = "(known after apply)"
+SENSITIVE_VALUE = "(sensitive value)"
+
+
+def reduce_plan(tf_plan_json):
+    """
+    Reduce the Terraform plan to the attribute paths that actually change.
+    Args:
+        tf_plan_json (JSON): The Terraform plan JSON.
+
+    Returns:
+        resource_changes (list): One entry per changed resource address, with only the changed attribute paths.
+        stats (dict): Size of the original and reduced resource changes.
+    """
+    original_changes = tf_plan_json.get("resource_changes", [])
+    resource_changes = []
+
+    for resource_change in original_changes:
+        change = resource_change.get("change", {})
+        actions = change.get("actions", [])
+        if actions in (["no-op"], ["read"]):
+            continue
+
+        reduced_change = {
+            "address": resource_change.get("address"),
+            "type": resource_change.get("type"),
+            "actions": actions,
+        }
+        if resource_change.get("module_address"):
+            reduced_change["module_address"] = resource_change["module_address"]
+        if resource_change.get("action_reason"):
+            reduced_change["action_reason"] = resource_change["action_reason"]
+
+        # Deleted resources only need their address and action
+        if change.get("after") is not None:
+            changes = {}
+            _diff(
+                before=change.get("before"),
+                after=change.get("after"),
+                unknown=change.get("after_unknown"),
+                before_sensitive=change.get("before_sensitive"),
+                after_sensitive=change.get("after_sensitive"),
+                path="",
+                changes=changes,
+            )
+            reduced_change["changes"] = changes
+
+        resource_changes.append(reduced_change)
+
+    stats = {
+        "resources_total": len(original_changes),
+        "resources_changed": len(resource_changes),
+        "original_size": len(serialize(original_changes)),
+        "reduced_size": len(serialize(resource_changes)),
+    }
+    stats["reduction_percent"] = (
+        round(100 * (1 - stats["reduced_size"] / stats["original_size"]), 1)
+        if stats["original_size"]
+        else 0.0
+    )
+    logger.info("Plan reduction stats : {}".format(json.dumps(stats)))
+
+    return resource_changes, stats
+
+
+def serialize(resource_changes):
+    # Compact JSON used by every prompt built from the reduced plan
+    return json.dumps(resource_changes, separators=(",", ":"), default=str)
+
+
+def estimate_tokens(text):
+    # Rough estimate, JSON averages about four characters per token
+    return len(text) // 4 + 1
+
+
+def outline(resource_changes):
+    """Compacted plan for the stages that only list the changes, the changed attribute paths without their values"""
+    outlined = []
+    for resource_change in resource_changes:
+        outlined_change = {key: value for key, value in resource_change.items() if key != "changes"}
+        if "changes" in resource_change:
+            outlined_change["changed_attributes"] = list(resource_change["changes"])
+        outlined.append(outlined_change)
+    return outlined
+
+
+def chunk_changes(resource_changes, max_tokens):
+    """
+    Split the reduced resource changes into chunks of at most max_tokens estimated tokens.
+    Resources of the same module are kept in the same chunk unless the module alone exceeds the limit.
+    """
+    modules = OrderedDict()
+    for resource_change in resource_changes:
+        modules.setdefault(resource_change.get("module_address", ""), []).append(
+            (resource_change, estimate_tokens(serialize(resource_change)))
+        )
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    for module_changes in modules.values():
+        module_tokens = sum(tokens for _, tokens in module_changes)
+        if current and current_tokens + module_tokens > max_tokens:
+            chunks.append(current)
+            current, current_tokens = [], 0
+        for resource_change, tokens in module_changes:
+            if current and current_tokens + tokens > max_tokens:
+                chunks.append(current)
+                current, current_tokens = [], 0
+            current.append(resource_change)
+            current_tokens += tokens
+    if current:
+        chunks.append(current)
+
+    logger.info(f"Split {len(resource_changes)} resource changes into {len(chunks)} chunks")
+    return chunks
+
+
+def _diff(before, after, unknown, before_sensitive, after_sensitive, path, changes):
+    if unknown is True:
+        changes[path] = {
+            "before": _mask(before, before_sensitive),
+            "after": UNKNOWN_VALUE,
+        }
+        return
+
+    if before_sensitive is True or after_sensitive is True:
+        if before != after:
+            changes[path] = {
+                "before": _mask(before, before_sensitive),
+                "after": _mask(after, after_sensitive),
+            }
+        return
+
+    if isinstance(before, dict) or isinstance(after, dict):
+        if _is_container(before, dict) and _is_container(after, dict):
+            before = before or {}
+            after = after or {}
+            keys = set(before) | set(after)
+            if isinstance(unknown, dict):
+                keys |= set(unknown)
+            for key in sorted(keys):
+                _diff(
+                    before=before.get(key),
+                    after=after.get(key),
+                    unknown=_child(unknown, key),
+                    before_sensitive=_child(before_sensitive, key),
+                    after_sensitive=_child(after_sensitive, key),
+                    path=f"{path}.{key}" if path else str(key),
+                    changes=changes,
+                )
+            return
+
+    if isinstance(before, list) or isinstance(after, list):
+        if _is_container(before, list) and _is_container(after, list):
+            before = before or []
+            after = after or []
+            length = max(len(before), len(after))
+            if isinstance(unknown, list):
+                length = max(length, len(unknown))
+            for index in range(length):
+                _diff(
+                    before=before[index] if index < len(before) else None,
+                    after=after[index] if index < len(after) else None,
+                    unknown=_child(unknown, index),
+                    before_sensitive=_child(before_sensitive, index),
+                    after_sensitive=_child(after_sensitive, index),
+                    path=f"{path}[{index}]",
+                    changes=changes,
+                )
+            return
+
+    if before != after:
+        changes[path] = {"before": before, "after": after}
+
+
+def _is_container(value, container_type):
+    return value is None or isinstance(value, container_type)
+
+
+def _child(value, key):
+    # Unknown and sensitive maps mirror the value structure, a bare True covers the whole subtree
+    if value is True:
+        return True
+    if isinstance(value, dict):
+        return value.get(key)
+    if isinstance(value, list) and isinstance(key, int) and key < len(value):
+        return value[key]
+    return None
+
+
+def _mask(value, sensitive):
+    if sensitive is True and value is not None:
+        return SENSITIVE_VALUE
+    return value
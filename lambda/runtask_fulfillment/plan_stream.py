@@ -0,0 +1,158 @@
+import json
+import re
+
+# Top level keys of the plan JSON used by the analyzers, everything else is skipped while streaming
+PLAN_KEYS = ("format_version", "terraform_version", "resource_changes")
+
+READ_SIZE = 256 * 1024
+
+_TOP_LEVEL = re.compile(rb'["{}\[\],:]')
+# Inside nested values only brackets matter, skip everything else including complete strings in one match
+_NESTED_SKIP = re.compile(rb'(?:[^"{}\[\]]+|"[^"\\]*(?:\\.[^"\\]*)*")*', re.DOTALL)
+# Rest of a string literal up to its closing quote, or to the end of the read
+_STRING_BODY = re.compile(rb'[^"\\]*(?:\\.[^"\\]*)*', re.DOTALL)
+
+
+def load_keys(stream, keys=PLAN_KEYS, read_size=READ_SIZE):
+    """
+    Incrementally parse a JSON object from a binary stream and only decode the wanted top level keys.
+    Args:
+        stream: File like object returning bytes.
+        keys (tuple): Top level keys to keep.
+        read_size (int): Number of bytes read per iteration.
+
+    Returns:
+        dict: The wanted keys found in the document.
+    """
+    extractor = TopLevelKeyExtractor(keys)
+    while True:
+        data = stream.read(read_size)
+        if not data:
+            break
+        extractor.feed(data)
+    return extractor.result()
+
+
+class TopLevelKeyExtractor:
+    """
+    Scans JSON bytes for the values of selected top level keys.
+    Only the bytes of the wanted values and of the top level key names are retained, memory is bounded by their
+    size and the read size. A string literal split across reads is resumed where the previous read stopped.
+    """
+
+    def __init__(self, keys):
+        self.keys = set(keys)
+        self.depth = 0
+        self.expect_key = False
+        self.current_key = None
+        self.in_string = False
+        self.escape = False
+        self.key_parts = None
+        self.capture = None
+        self.values = {}
+
+    def feed(self, data):
+        position = 0
+        capture_start = 0 if self.capture is not None else None
+        length = len(data)
+
+        if self.in_string:
+            end = self._string_end(data, 0)
+            if self.key_parts is not None:
+                self.key_parts.append(data[:end])
+            if end is None:
+                position = length
+            else:
+                self.in_string = False
+                position = end
+                if self.key_parts is not None:
+                    self._set_key(b"".join(self.key_parts))
+                    self.key_parts = None
+
+        while True:
+            if self.depth > 1:
+                position = _NESTED_SKIP.match(data, position).end()
+                if position == length:
+                    break
+                token = data[position:position + 1]
+                if token == b'"':
+                    end = self._string_end(data, position + 1)
+                    if end is None:
+                        self.in_string = True
+                        break
+                    position = end
+                    continue
+                self.depth += 1 if token in b"{[" else -1
+                position += 1
+                continue
+
+            match = _TOP_LEVEL.search(data, position)
+            if match is None:
+                break
+            token = match.group()
+
+            if token == b'"':
+                is_key = self.depth == 1 and self.expect_key
+                end = self._string_end(data, match.end())
+                if end is None:
+                    self.in_string = True
+                    if is_key:
+                        self.key_parts = [data[match.start():]]
+                    break
+                if is_key:
+                    self._set_key(data[match.start():end])
+                position = end
+                continue
+            elif token in (b"{", b"["):
+                self.depth += 1
+                if self.depth == 1:
+                    self.expect_key = True
+            elif token in (b"}", b"]"):
+                self.depth -= 1
+                if self.depth == 0:
+                    capture_start = self._end_capture(data, capture_start, match.start())
+            elif self.depth == 1 and token == b":":
+                if self.current_key in self.keys:
+                    self.capture = []
+                    capture_start = match.end()
+            elif self.depth == 1 and token == b",":
+                capture_start = self._end_capture(data, capture_start, match.start())
+                self.current_key = None
+                self.expect_key = True
+            position = match.end()
+
+        if self.capture is not None:
+            self.capture.append(data[capture_start:])
+
+    def _string_end(self, data, position):
+        """
+        Position after the closing quote of the string literal continuing at position, None when the string goes
+        on in the next read. Every byte is scanned once, skipped strings are not kept.
+        """
+        if self.escape:
+            # The backslash ended the previous read, its escaped character starts this one
+            self.escape = False
+            position += 1
+        end = _STRING_BODY.match(data, position).end()
+        if end == len(data):
+            return None
+        if data[end:end + 1] == b"\\":
+            self.escape = True
+            return None
+        return end + 1
+
+    def _set_key(self, token):
+        self.current_key = json.loads(token)
+        self.expect_key = False
+
+    def _end_capture(self, data, capture_start, end):
+        if self.capture is not None:
+            self.capture.append(data[capture_start:end])
+            self.values[self.current_key] = json.loads(b"".join(self.capture))
+            self.capture = None
+        return None
+
+    def result(self):
+        if self.depth != 0 or self.in_string:
+            raise ValueError("Incomplete JSON document")
+        return self.values
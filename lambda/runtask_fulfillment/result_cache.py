@@ -0,0 +1,88 @@
+import hashlib
+import json
+import os
+import time
+
+import kv_store
+from runtask_utils import INCOMPLETE_LABEL
+from utils import logger
+
+cache_backend = os.environ.get("RESULT_CACHE_BACKEND", "memory")
+cache_ttl = int(os.environ.get("RESULT_CACHE_TTL", 86400))
+cache_max_entries = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", 128))
+cache_max_bytes = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+# The memory backend shares the Lambda memory with the plan and the analysis, its bound is lower than the disk one
+cache_memory_max_bytes = int(os.environ.get("RESULT_CACHE_MEMORY_MAX_BYTES", 16 * 1024 * 1024))
+cache_dir = os.environ.get("RESULT_CACHE_DIR", "/tmp/runtask-result-cache")
+cache_table_name = os.environ.get("RESULT_CACHE_TABLE", None)
+
+
+def build_key(resource_changes, model_id, guardrail_id, guardrail_version, prompt_version, config=None):
+    """
+    Content address of an analysis, any change to the plan, model, guardrail, prompts or to the other settings
+    of the analysis in config (model tiers, guardrail input check) yields a new key.
+    """
+    canonical = json.dumps(
+        {
+            "resource_changes": resource_changes,
+            "model_id": model_id,
+            "guardrail_id": guardrail_id,
+            "guardrail_version": guardrail_version,
+            "prompt_version": prompt_version,
+            "config": config,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        default=str,
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def is_cacheable(results):
+    # Never store a failed or partly failed analysis, the next run should retry Bedrock
+    return all(
+        not str(result["attributes"]["body"]).startswith("Error")
+        and not any(tag.get("label") == INCOMPLETE_LABEL for tag in result["attributes"].get("tags", {}).get("status", []))
+        for result in results
+    )
+
+
+@kv_store.per_container
+def get_cache():
+    backend = kv_store.build_backend(
+        cache_backend,
+        directory=cache_dir,
+        table_name=cache_table_name,
+        max_entries=cache_max_entries,
+        memory_max_bytes=cache_memory_max_bytes,
+        disk_max_bytes=cache_max_bytes,
+    )
+    return ResultCache(backend, ttl=cache_ttl)
+
+
+class ResultCache:
+    """Backend errors are logged and read as misses, the name labels the log lines of each cache"""
+
+    def __init__(self, backend, ttl=86400, name="Result cache"):
+        self.backend = backend
+        self.ttl = ttl
+        self.name = name
+
+    def get(self, key):
+        if self.backend is None:
+            return None
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            logger.error(f"{self.name} read failed: {e}")
+            return None
+        logger.info("{} {} for key {}".format(self.name, "hit" if value else "miss", key))
+        return value
+
+    def put(self, key, value):
+        if self.backend is None:
+            return
+        try:
+            self.backend.put(key, value, expires_at=time.time() + self.ttl)
+        except Exception as e:
+            logger.error(f"{self.name} write failed: {e}")
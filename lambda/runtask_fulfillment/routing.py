@@ -0,0 +1,173 @@
+import json
+import threading
+from collections import namedtuple
+
+from utils import logger
+
+# Resource changes weigh more when they destroy something or touch access and network boundaries
+ACTION_WEIGHTS = {"create": 1.0, "update": 1.0, "delete": 2.0}
+REPLACE_WEIGHT = 3.0
+SENSITIVE_TYPE_WEIGHT = 2.0
+SENSITIVE_TYPE_PREFIXES = (
+    "aws_iam_",
+    "aws_kms_",
+    "aws_security_group",
+    "aws_vpc_security_group",
+    "aws_network_acl",
+    "aws_s3_bucket_policy",
+    "aws_s3_bucket_public_access_block",
+    "aws_route",
+    "aws_lb_listener",
+    "aws_wafv2_",
+    "aws_secretsmanager_",
+)
+ATTRIBUTE_WEIGHT = 0.1
+MAX_WEIGHTED_ATTRIBUTES = 20
+
+# The short summary only lists the changes, it tolerates a smaller model than the security analysis
+STAGE_COMPLEXITY_WEIGHTS = {"analysis": 1.0, "ami": 0.5, "summary": 0.25}
+
+# Pipeline and usage stages measured for the outcome of each routed stage
+ROUTED_STAGES = {
+    "analysis": (("chunks", "analysis"), ("analysis", "chunk_analysis", "analysis_reduce")),
+    "summary": (("summary",), ("summary",)),
+    "ami": (("ami",), ("ami",)),
+}
+
+DIRECT = "direct"
+COMPACTED = "compacted"
+CHUNKED = "chunked"
+
+Tier = namedtuple("Tier", ["model_id", "max_input_tokens", "max_complexity"])
+Route = namedtuple("Route", ["stage", "model_id", "tier", "strategy", "input_tokens", "complexity", "token_limit"])
+
+
+def load_tiers(tiers_json, default_model_id, default_max_input_tokens):
+    """
+    Parse the model tiers, ordered from the fastest to the most capable model.
+    Args:
+        tiers_json (str): JSON list of {"model_id", "max_input_tokens", "max_complexity"}, the limits are optional.
+        default_model_id (str): Single tier used when no tiers are configured.
+        default_max_input_tokens (int): Input token limit of the tiers that do not set one.
+
+    Returns:
+        list: Tier tuples, the last tier takes every stage the other tiers do not fit.
+    """
+    tiers = []
+    if tiers_json:
+        try:
+            for tier in json.loads(tiers_json):
+                tiers.append(Tier(
+                    model_id=tier["model_id"],
+                    max_input_tokens=int(tier.get("max_input_tokens") or default_max_input_tokens),
+                    max_complexity=float(tier["max_complexity"]) if tier.get("max_complexity") is not None else None,
+                ))
+        except (ValueError, TypeError, KeyError) as e:
+            logger.error(f"Invalid model tiers configuration, using {default_model_id} for every stage: {e}")
+            tiers = []
+    if not tiers:
+        tiers = [Tier(model_id=default_model_id, max_input_tokens=default_max_input_tokens, max_complexity=None)]
+    return tiers
+
+
+def estimate_complexity(resource_changes):
+    """Score of the reduced resource changes, grows with the actions, the sensitive resource types and changed attributes"""
+    score = 0.0
+    for resource_change in resource_changes:
+        actions = resource_change.get("actions", [])
+        if "create" in actions and "delete" in actions:
+            score += REPLACE_WEIGHT
+        else:
+            score += sum(ACTION_WEIGHTS.get(action, 0.0) for action in actions)
+        if str(resource_change.get("type", "")).startswith(SENSITIVE_TYPE_PREFIXES):
+            score += SENSITIVE_TYPE_WEIGHT
+        score += ATTRIBUTE_WEIGHT * min(len(resource_change.get("changes", {})), MAX_WEIGHTED_ATTRIBUTES)
+    return round(score, 1)
+
+
+class ModelRouter:
+    """
+    Picks the model and the strategy of each Bedrock stage from its estimated input tokens and complexity.
+    The smallest tier within both limits of the stage gets it. Inputs larger than every eligible tier
+    are either compacted, when the stage accepts a compacted input that fits, or chunked.
+    """
+
+    def __init__(self, tiers):
+        self.tiers = tiers
+        self.lock = threading.Lock()
+        self.routes = []
+
+    def reset(self):
+        with self.lock:
+            self.routes = []
+
+    @property
+    def max_input_tokens(self):
+        return max(tier.max_input_tokens for tier in self.tiers)
+
+    def route(self, stage, input_tokens, complexity=0.0, compacted_tokens=None):
+        """
+        Args:
+            stage (str): Routed stage, one of STAGE_COMPLEXITY_WEIGHTS.
+            input_tokens (int): Estimated tokens of the stage input.
+            complexity (float): Complexity of the plan, weighted by the stage.
+            compacted_tokens (int): Estimated tokens of the compacted input, None when the stage can not be compacted.
+
+        Returns:
+            Route: Model, tier index and strategy of the stage, token_limit bounds each chunk of a chunked stage.
+        """
+        weighted = round(complexity * STAGE_COMPLEXITY_WEIGHTS.get(stage, 1.0), 1)
+        eligible = [
+            (index, tier) for index, tier in enumerate(self.tiers)
+            if tier.max_complexity is None or weighted <= tier.max_complexity
+        ] or [(len(self.tiers) - 1, self.tiers[-1])]
+
+        strategy = CHUNKED
+        index, tier = eligible[-1]
+        for size, candidate in ((input_tokens, DIRECT), (compacted_tokens, COMPACTED)):
+            fitting = [(index, tier) for index, tier in eligible if size is not None and size <= tier.max_input_tokens]
+            if fitting:
+                strategy = candidate
+                index, tier = fitting[0]
+                break
+
+        route = Route(
+            stage=stage,
+            model_id=tier.model_id,
+            tier=index,
+            strategy=strategy,
+            input_tokens=input_tokens,
+            complexity=weighted,
+            token_limit=tier.max_input_tokens,
+        )
+        with self.lock:
+            self.routes.append(route)
+        logger.info("Model route : {}".format(json.dumps(route._asdict())))
+        return route
+
+    def emit(self, timings, usage_stages):
+        """
+        Log every routing decision of the run with its latency and token usage, to tune the tier limits.
+        Args:
+            timings (dict): Stage scheduler timings in milliseconds.
+            usage_stages (dict): Per stage totals of the usage recorder summary.
+        """
+        with self.lock:
+            routes = list(self.routes)
+
+        outcomes = []
+        for route in routes:
+            pipeline_stages, usage_names = ROUTED_STAGES.get(route.stage, ((route.stage,), (route.stage,)))
+            usage = [usage_stages[name] for name in usage_names if name in usage_stages]
+            outcome = dict(
+                route._asdict(),
+                duration_ms=sum(timings.get(name, 0) for name in pipeline_stages),
+                calls=sum(totals["calls"] for totals in usage),
+                actual_input_tokens=sum(totals["input_tokens"] for totals in usage),
+                cache_read_input_tokens=sum(totals["cache_read_input_tokens"] for totals in usage),
+                output_tokens=sum(totals["output_tokens"] for totals in usage),
+                model_latency_ms=sum(totals["latency_ms"] for totals in usage),
+            )
+            logger.info("Model route outcome : {}".format(json.dumps(outcome)))
+            outcomes.append(outcome)
+        return outcomes
@@ -0,0 +1,60 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from utils import logger
+
+
+class StageScheduler:
+    """
+    Runs pipeline stages as a dependency graph, each stage starts as soon as all of its dependencies completed.
+    A stage function receives the dictionary of results of the stages completed so far.
+    """
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self.stages = {}
+        self.timings = {}
+
+    def add(self, name, func, depends_on=()):
+        if name in self.stages:
+            raise ValueError(f"Stage {name} is already defined")
+        for dependency in depends_on:
+            if dependency not in self.stages:
+                raise ValueError(f"Stage {name} depends on unknown stage {dependency}")
+        self.stages[name] = (func, tuple(depends_on))
+        return self
+
+    def run(self):
+        results = {}
+        pending = dict(self.stages)
+        running = {}
+        started = {}
+        run_start = time.monotonic()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                for name in [name for name, (_, depends_on) in pending.items() if all(d in results for d in depends_on)]:
+                    func, _ = pending.pop(name)
+                    started[name] = time.monotonic()
+                    running[executor.submit(func, dict(results))] = name
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    elapsed = time.monotonic() - started[name]
+                    self.timings[name] = round(elapsed * 1000)
+                    try:
+                        results[name] = future.result()
+                    except Exception:
+                        logger.error(f"Stage {name} failed after {self.timings[name]} ms")
+                        for other in running:
+                            other.cancel()
+                        raise
+                    logger.info(f"Stage {name} completed in {self.timings[name]} ms")
+
+        logger.info(
+            "All stages completed in {} ms, stage timings (ms): {}".format(
+                round((time.monotonic() - run_start) * 1000), self.timings
+            )
+        )
+        return results
@@ -0,0 +1,117 @@
+import json
+import logging
+import mmap
+import os
+import re
+
+logger = logging.getLogger()
+
+AMI_NAME_PATTERN = re.compile(r"[\w.\-]+")
+
+# Snapshot generated at build time by build_ami_release_index.py and packaged next to this module
+SNAPSHOT_PATH = os.environ.get(
+    "AMI_RELEASE_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "ami_release_index.tsv"),
+)
+
+_snapshot = None
+
+
+def build_release_index(releases):
+    """
+    Parse every release body once and index the release details by AMI name.
+    Returns:
+        names (dict): AMI name to list of release details, in release order.
+        texts (list): (text, release details) pairs for substring lookups of names not in the index.
+    """
+    import markdown_to_json  # only needed when the release notes are parsed
+
+    names = {}
+    texts = []
+    for release in releases:
+        details = markdown_to_json.dictify(release["body"] or "")
+        for os_name in details.keys():
+            if not os_name.startswith("Amazon"):
+                continue
+            if os_name == "Amazon ECS-optimized Amazon Linux AMI":
+                entries = [(str(item), {"os_name": os_name, "details": details[os_name]}) for item in details[os_name]]
+            elif isinstance(details[os_name], dict):
+                entries = [
+                    (str(details[os_name][os_architecture][0]), {
+                        "os_architecture": os_architecture,
+                        "os_name": os_name,
+                        "details": details[os_name][os_architecture],
+                    })
+                    for os_architecture in details[os_name].keys()
+                    if details[os_name][os_architecture]
+                ]
+            else:
+                continue
+
+            for text, entry in entries:
+                texts.append((text, entry))
+                for name in set(AMI_NAME_PATTERN.findall(text)):
+                    if is_ami_name(name):
+                        names.setdefault(name, []).append(entry)
+    return names, texts
+
+
+def is_ami_name(token):
+    # Skip version numbers and words of the release notes, AMI names are long dash separated tokens
+    return len(token) > 10 and "-" in token
+
+
+def write_snapshot(path, names, metadata):
+    """
+    Write the index as UTF-8 lines `<ami name>\\t<JSON release details>` sorted by name, after one metadata line.
+    Sorted fixed format lines let ReleaseSnapshot binary search the memory mapped file without loading it.
+    """
+    with open(path, "wb") as file:
+        file.write(b"#" + json.dumps(metadata, separators=(",", ":")).encode("utf-8") + b"\n")
+        for name in sorted(names, key=lambda name: name.encode("utf-8")):
+            file.write(
+                name.encode("utf-8") + b"\t"
+                + json.dumps(names[name], separators=(",", ":"), ensure_ascii=True).encode("utf-8") + b"\n"
+            )
+
+
+class ReleaseSnapshot:
+    """Read only view of a snapshot file, lookups are binary searches over the memory mapped lines"""
+
+    def __init__(self, path):
+        with open(path, "rb") as file:
+            self.data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        metadata_end = self.data.find(b"\n")
+        self.metadata = json.loads(self.data[1:metadata_end])
+        self.data_start = metadata_end + 1
+
+    def lookup(self, ami_name):
+        key = ami_name.encode("utf-8")
+        low, high = self.data_start, len(self.data)
+        while low < high:
+            middle = (low + high) // 2
+            line_start = self.data.rfind(b"\n", low, middle)
+            line_start = low if line_start == -1 else line_start + 1
+            line_end = self.data.find(b"\n", line_start)
+            separator = self.data.find(b"\t", line_start, line_end)
+            name = self.data[line_start:separator]
+            if name == key:
+                return json.loads(self.data[separator + 1:line_end])
+            if name < key:
+                low = line_end + 1
+            else:
+                high = line_start
+        return None
+
+
+def get_snapshot():
+    """Open the packaged snapshot once per container, None when the package has no snapshot"""
+    global _snapshot
+    if _snapshot is None:
+        try:
+            _snapshot = ReleaseSnapshot(SNAPSHOT_PATH)
+            logger.info(f"Loaded ECS AMI release snapshot {_snapshot.metadata}")
+        except (OSError, ValueError) as e:
+            logger.info(f"No ECS AMI release snapshot available: {e}")
+            _snapshot = False
+    return _snapshot or None
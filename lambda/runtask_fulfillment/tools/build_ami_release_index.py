@@ -0,0 +1,82 @@
+"""
+Build the ECS AMI release snapshot packaged with the fulfillment Lambda.
+
+Walks every page of the amazon-ecs-ami GitHub releases, or reads recorded release pages, and writes the sorted
+index read by ami_release_index.ReleaseSnapshot. Set GITHUB_TOKEN to raise the GitHub API rate limit.
+
+Usage:
+    python3 tools/build_ami_release_index.py --output tools/ami_release_index.tsv
+    python3 tools/build_ami_release_index.py --releases-file releases.json --output /tmp/ami_release_index.tsv
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from ami_release_index import build_release_index, write_snapshot
+
+RELEASES_URL = "https://api.github.com/repos/aws/amazon-ecs-ami/releases"
+PER_PAGE = 100
+
+
+def fetch_releases(url=RELEASES_URL, max_pages=100):
+    """Follow the GitHub pagination Link headers and return the releases of all pages"""
+    import requests
+
+    headers = {"Accept": "application/vnd.github+json"}
+    if os.environ.get("GITHUB_TOKEN"):
+        headers["Authorization"] = f"Bearer {os.environ['GITHUB_TOKEN']}"
+
+    releases = []
+    params = {"per_page": PER_PAGE}
+    for _ in range(max_pages):
+        response = requests.get(url, headers=headers, params=params, timeout=30)
+        response.raise_for_status()
+        releases.extend(response.json())
+        next_page = response.links.get("next")
+        if not next_page:
+            return releases
+        url, params = next_page["url"], None
+    raise RuntimeError(f"More than {max_pages} release pages, increase --max-pages")
+
+
+def load_releases(paths):
+    """Recorded release pages, each file holds the JSON array returned by one page of the releases API"""
+    releases = []
+    for path in paths:
+        with open(path, encoding="utf-8") as file:
+            releases.extend(json.load(file))
+    return releases
+
+
+def build(releases, output):
+    names, _ = build_release_index(releases)
+    published = [release.get("published_at") or release.get("tag_name") or "" for release in releases]
+    # No build time in the snapshot, the same releases give the same file and the same Lambda package hash
+    metadata = {
+        "latest_release": max(published) if published else None,
+        "releases": len(releases),
+        "ami_names": len(names),
+    }
+    write_snapshot(output, names, metadata)
+    return metadata
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", required=True, help="Snapshot file to write")
+    parser.add_argument("--releases-file", action="append", help="Recorded releases page, can be repeated")
+    parser.add_argument("--max-pages", type=int, default=100, help="Maximum number of release pages to fetch")
+    args = parser.parse_args()
+
+    if args.releases_file:
+        releases = load_releases(args.releases_file)
+    else:
+        releases = fetch_releases(max_pages=args.max_pages)
+    metadata = build(releases, args.output)
+    print(f"Wrote {args.output}: {json.dumps(metadata)}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
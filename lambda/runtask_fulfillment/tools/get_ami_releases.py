@@ -1,66 +1,117 @@
-import requests
-import boto3
-import markdown_to_json
+import os
+import threading
+import time
+
+from lazy import lazy_client, lazy_import
+from tools.ami_release_index import build_release_index, get_snapshot
 from utils import logger
 
-session = boto3.Session()
-ec2_client = session.client(service_name="ec2")
+# Only loaded when a plan changes an AMI that is not in the packaged snapshot
+requests = lazy_import("requests")
+ec2_client = lazy_client("ec2")
+
+RELEASES_URL = "https://api.github.com/repos/aws/amazon-ecs-ami/releases"
+releases_ttl = int(os.environ.get("AMI_RELEASES_TTL", 3600))
+releases_retry_ttl = 60  # retry a failed refresh sooner, the stale index is kept meanwhile
+
+# EC2 accepts at most 200 values per filter
+DESCRIBE_IMAGES_BATCH_SIZE = 200
+
+# AMI id -> name, AMI names are immutable so entries never expire
+_ami_names = {}
+_ami_names_lock = threading.Lock()
+
+# AMI name -> release details, built once per container and refreshed after the TTL
+_release_index = {"expires_at": 0, "etag": None, "names": {}, "texts": []}
+_release_index_lock = threading.Lock()
+
+
+def get_release_index():
+    """Return the release index, refreshing it with a conditional request once the TTL expired"""
+    with _release_index_lock:
+        if time.time() < _release_index["expires_at"]:
+            return _release_index
+
+        headers = {"Accept": "application/vnd.github+json"}
+        if _release_index["etag"]:
+            headers["If-None-Match"] = _release_index["etag"]
+        try:
+            response = requests.get(RELEASES_URL, headers=headers, timeout=30)
+            if response.status_code == 304:
+                logger.info("ECS AMI releases not modified, reusing release index")
+            else:
+                response.raise_for_status()
+                names, texts = build_release_index(response.json())
+                _release_index.update(names=names, texts=texts, etag=response.headers.get("ETag"))
+                logger.info(f"Built ECS AMI release index with {len(names)} AMI names")
+            _release_index["expires_at"] = time.time() + releases_ttl
+        except Exception as e:
+            logger.error(f"Unable to refresh ECS AMI releases: {e}")
+            _release_index["expires_at"] = time.time() + min(releases_ttl, releases_retry_ttl)
+        return _release_index
+
 
 class GetECSAmisReleases:
     def execute(self, ami_ids):
         return self.get_ecs_amis_releases_info(ami_ids)
 
     def get_ecs_amis_releases_info(self, ami_ids):
-        response = requests.get(
-            "https://api.github.com/repos/aws/amazon-ecs-ami/releases",
-            timeout=30
-        )
-        response_json = response.json()
+        snapshot = get_snapshot()
+        release_index = None
+        ami_names = self.get_ami_names_from_ids(ami_ids)
         releases_info = []
-        ami_data = []
         for ami_id in ami_ids:
-            ami_data.append({"name": self.get_ami_name_from_id(ami_id), "id": ami_id})
-
-        for ami in ami_data:
-            for release in response_json:
-                details = markdown_to_json.dictify(release["body"])
-                for os_name in details.keys():
-                    if os_name.startswith("Amazon"):
-                        if os_name == "Amazon ECS-optimized Amazon Linux AMI":
-                            if ami["name"] in details[os_name]:
-                                logger.info(
-                                    f"Found release notes for {ami['id']}: {ami['name']}"
-                                )
-                                releases_info.append(
-                                    {
-                                        "ami_id": ami["id"],
-                                        "ami_name": ami["name"],
-                                        "os_name": os_name,
-                                        "details": details[os_name],
-                                    }
-                                )
-                                break
-                        else:
-                            for os_architecture in details[os_name].keys():
-                                if ami["name"] in details[os_name][os_architecture][0]:
-                                    logger.info(
-                                        f"Found release notes for {ami['id']}: {ami['name']}"
-                                    )
-                                    releases_info.append(
-                                        {
-                                            "ami_id": ami["id"],
-                                            "ami_name": ami["name"],
-                                            "os_architecture": os_architecture,
-                                            "os_name": os_name,
-                                            "details": details[os_name][
-                                                os_architecture
-                                            ],
-                                        }
-                                    )
-                                    break
+            if ami_id not in ami_names:
+                continue
+            ami = {"name": ami_names[ami_id], "id": ami_id}
+            entries = snapshot.lookup(ami["name"]) if snapshot and ami["name"] else None
+            if entries is None:
+                # Released after the packaged snapshot was built, or not an ECS-optimized AMI
+                if release_index is None:
+                    release_index = get_release_index()
+                entries = self.lookup_release_details(release_index, ami["name"])
+            for entry in entries:
+                logger.info(f"Found release notes for {ami['id']}: {ami['name']}")
+                releases_info.append({"ami_id": ami["id"], "ami_name": ami["name"], **entry})
 
         return releases_info
 
+    def lookup_release_details(self, release_index, ami_name):
+        if not ami_name:
+            return []
+        entries = release_index["names"].get(ami_name)
+        if entries is None:
+            # Names that are not a single token, fall back to scanning the pre-parsed release texts
+            entries = [entry for text, entry in release_index["texts"] if ami_name in text]
+        return entries
+
+    def get_ami_names_from_ids(self, ami_ids):
+        """
+        Resolve AMI ids to names with batched describe_images calls, names are cached across warm invocations.
+        Ids of missing or deregistered images are left out of the result.
+        """
+        with _ami_names_lock:
+            ami_names = {ami_id: _ami_names[ami_id] for ami_id in ami_ids if ami_id in _ami_names}
+        missing_ids = sorted(set(ami_ids) - set(ami_names))
+
+        paginator = ec2_client.get_paginator("describe_images")
+        for index in range(0, len(missing_ids), DESCRIBE_IMAGES_BATCH_SIZE):
+            batch = missing_ids[index:index + DESCRIBE_IMAGES_BATCH_SIZE]
+            # An image-id filter, unlike ImageIds, does not fail the whole call when one id is not found
+            for page in paginator.paginate(
+                Filters=[{"Name": "image-id", "Values": batch}], IncludeDeprecated=True, IncludeDisabled=True
+            ):
+                for image in page["Images"]:
+                    if image.get("Name"):
+                        ami_names[image["ImageId"]] = image["Name"]
+
+        with _ami_names_lock:
+            _ami_names.update(ami_names)
+
+        not_found = set(missing_ids) - set(ami_names)
+        if not_found:
+            logger.info(f"AMI ids not found: {sorted(not_found)}")
+        return ami_names
+
     def get_ami_name_from_id(self, ami_id):
-        describe_image_response = ec2_client.describe_images(ImageIds=[ami_id])
-        return describe_image_response["Images"][0]["Name"]
+        return self.get_ami_names_from_ids([ami_id]).get(ami_id)
@@ -0,0 +1,130 @@
+import json
+import os
+import threading
+import time
+
+from utils import logger, wait_for_usage
+
+metrics_namespace = os.environ.get("METRICS_NAMESPACE", "TFPlanAnalyzer")
+# Price per 1000 tokens of each run token field, e.g. {"input_tokens": 0.003, "output_tokens": 0.015}, empty disables the estimate
+token_prices_json = os.environ.get("BEDROCK_TOKEN_PRICES", "")
+# Responses returned once their JSON object closed deliver their usage later, the emit waits that long for them
+usage_wait_seconds = float(os.environ.get("BEDROCK_USAGE_WAIT_SECONDS", 5))
+
+USAGE_FIELDS = [
+    "input_tokens",
+    "output_tokens",
+    "total_tokens",
+    "cache_read_input_tokens",
+    "cache_write_input_tokens",
+    "latency_ms",
+    "time_to_first_token_ms",
+    "duration_ms",
+    "retries",
+    "hedged_requests",
+]
+RUN_FIELDS = ["input_tokens", "output_tokens", "total_tokens", "cache_read_input_tokens", "cache_write_input_tokens"]
+
+
+def load_prices(prices_json):
+    """
+    Parse the token prices of the cost estimate.
+    Args:
+        prices_json (str): JSON object of price per 1000 tokens by run token field.
+
+    Returns:
+        dict: Prices by field, empty when none are configured or the configuration is invalid.
+    """
+    if not prices_json:
+        return {}
+    try:
+        prices = {field: float(price) for field, price in json.loads(prices_json).items()}
+    except (ValueError, TypeError, AttributeError) as e:
+        logger.error(f"Invalid token prices configuration, the run cost is not estimated: {e}")
+        return {}
+    unknown = sorted(set(prices) - set(RUN_FIELDS))
+    if unknown:
+        logger.error(f"Token prices of unknown fields ignored: {unknown}")
+    return {field: price for field, price in prices.items() if field in RUN_FIELDS}
+
+
+class UsageRecorder:
+    """Collects the Bedrock usage records of one run, per stage"""
+
+    def __init__(self, prices=None):
+        self.prices = load_prices(token_prices_json) if prices is None else prices
+        self.lock = threading.Lock()
+        self.records = []
+
+    def reset(self):
+        with self.lock:
+            self.records = []
+
+    def record(self, stage, usage):
+        # The usage itself is kept, a response stream still read in the background fills in its tokens
+        with self.lock:
+            self.records.append((stage, usage))
+
+    def summary(self):
+        """Aggregate the records per stage and for the whole run"""
+        with self.lock:
+            records = list(self.records)
+
+        stages = {}
+        for stage, usage in records:
+            totals = stages.setdefault(stage, {"calls": 0, **{field: 0 for field in USAGE_FIELDS}})
+            totals["calls"] += 1
+            for field in USAGE_FIELDS:
+                totals[field] += usage.get(field) or 0
+
+        run = {"calls": len(records)}
+        for field in RUN_FIELDS:
+            run[field] = sum(totals[field] for totals in stages.values())
+        if self.prices:
+            run["estimated_cost"] = round(sum(run.get(field, 0) * price / 1000 for field, price in self.prices.items()), 6)
+        return {"stages": stages, "run": run}
+
+    def emit(self, workspace_id=None):
+        """
+        Log the aggregated usage as CloudWatch Embedded Metric Format (EMF), one document per stage and one with
+        the run totals under the stage `total`.
+        Docs - https://docs.aws.amazon.com/AmazonCloudWatch/latest/monitoring/CloudWatch_Embedded_Metric_Format_Specification.html
+        """
+        pending = wait_for_usage(usage_wait_seconds)
+        if pending:
+            logger.warning(f"Usage of {pending} responses not received within {usage_wait_seconds} seconds")
+        summary = self.summary()
+        logger.info("Model usage summary : {}".format(json.dumps(summary)))
+
+        timestamp = int(time.time() * 1000)
+        documents = [(stage, totals) for stage, totals in summary["stages"].items()]
+        if summary["stages"]:
+            documents.append(("total", summary["run"]))
+        for stage, totals in documents:
+            document = {
+                "_aws": {
+                    "Timestamp": timestamp,
+                    "CloudWatchMetrics": [
+                        {
+                            "Namespace": metrics_namespace,
+                            "Dimensions": [["Stage"]],
+                            "Metrics": [{"Name": name, "Unit": _unit(name)} for name in totals],
+                        }
+                    ],
+                },
+                "Stage": stage,
+                "WorkspaceId": workspace_id,
+                **totals,
+            }
+            # EMF documents must be written as plain JSON lines, without the logging prefix
+            print(json.dumps(document))
+
+        return summary
+
+
+def _unit(name):
+    if name.endswith("_ms"):
+        return "Milliseconds"
+    if name == "estimated_cost":
+        return "None"
+    return "Count"
@@ -1,5 +1,7 @@
 import logging
 import json
+import threading
+import time
 
 # Setup logging
 logging.basicConfig(format='%(levelname)s: %(message)s')
@@ -29,13 +31,20 @@ tool_config = {
 }
 
 
+# Response streams read up to their metadata event after stream_messages returned
+_usage_drains = set()
+_usage_drains_lock = threading.Lock()
+
+
 # Bedrock streaming method
 def stream_messages(bedrock_client,
                     model_id,
                     messages,
                     system_text,
                     tool_config=None,
-                    stop_sequences=None):
+                    stop_sequences=None,
+                    json_parser=None,
+                    on_first_token=None):
     """
     Sends a message to a model and streams the response.
     Args:
@@ -45,10 +54,15 @@ def stream_messages(bedrock_client,
         system_text (str): The system text to send to the model.
         tool_config : Tool Information to send to the model.
         stop_sequences: Stop sequences to send to the model.
+        json_parser: Optional json_stream.IncrementalObjectParser fed with the text deltas, the response is
+            returned as soon as the parser has read a complete top level object, the rest of the stream is read
+            in the background and its metadata fills in the token usage, see wait_for_usage.
+        on_first_token: Optional callable invoked once, when the first delta of the response is received.
 
     Returns:
         stop_reason (str): The reason why the model stopped generating text.
         message (JSON): The message that the model generated.
+        usage (dict): Token usage and latency of the call.
     """
     temperature = 0.5
     inference_config = {"temperature": temperature}
@@ -57,6 +71,7 @@ def stream_messages(bedrock_client,
 
     logger.info("Streaming messages with model %s", model_id)
     system_prompts = [{"text": system_text}]
+    start_time = time.monotonic()
 
     if tool_config is None:
         response = bedrock_client.converse_stream(
@@ -78,13 +93,27 @@ def stream_messages(bedrock_client,
     message = {}
     content = []
     message['content'] = content
-    text = ''
+    text_parts = []
+    input_parts = []
     tool_use = {}
+    object_complete = False
+    usage = {
+        "model_id": model_id,
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "total_tokens": 0,
+        "cache_read_input_tokens": 0,
+        "cache_write_input_tokens": 0,
+        "latency_ms": None,
+        "time_to_first_token_ms": None,
+        "duration_ms": None,
+    }
 
     logger.debug(response)
 
     #stream the response into a message.
-    for chunk in response['stream']:
+    events = iter(response['stream'])
+    for chunk in events:
         if 'messageStart' in chunk:
             message['role'] = chunk['messageStart']['role']
         elif 'contentBlockStart' in chunk:
@@ -92,25 +121,86 @@ def stream_messages(bedrock_client,
             tool_use['toolUseId'] = tool['toolUseId']
             tool_use['name'] = tool['name']
         elif 'contentBlockDelta' in chunk:
+            if usage['time_to_first_token_ms'] is None:
+                usage['time_to_first_token_ms'] = round((time.monotonic() - start_time) * 1000)
+                if on_first_token is not None:
+                    on_first_token()
             delta = chunk['contentBlockDelta']['delta']
             if 'toolUse' in delta:
-                if 'input' not in tool_use:
-                    tool_use['input'] = ''
-                tool_use['input'] += delta['toolUse']['input']
+                input_parts.append(delta['toolUse']['input'])
             elif 'text' in delta:
-                text += delta['text']
-                if logging.root.level <= logging.INFO:
-                    logger.debug(delta['text'], end='')
+                text_parts.append(delta['text'])
+                if json_parser is not None:
+                    json_parser.feed(delta['text'])
+                    if json_parser.complete:
+                        # The fields are final, the trailing text is dropped
+                        object_complete = True
+                        content.append({'text': ''.join(text_parts)})
+                        stop_reason = 'end_turn'
+                        break
         elif 'contentBlockStop' in chunk:
-            if 'input' in tool_use:
-                tool_use['input'] = json.loads(tool_use['input'])
+            if tool_use:
+                tool_use['input'] = json.loads(''.join(input_parts) or '{}')
                 content.append({'toolUse': tool_use})
                 tool_use = {}
+                input_parts = []
             else:
-                content.append({'text': text})
-                text = ''
+                content.append({'text': ''.join(text_parts)})
+                text_parts = []
 
         elif 'messageStop' in chunk:
             stop_reason = chunk['messageStop']['stopReason']
 
-    return stop_reason, message
+        elif 'metadata' in chunk:
+            read_metadata(usage, chunk['metadata'])
+
+    usage['duration_ms'] = round((time.monotonic() - start_time) * 1000)
+    logger.info("Model usage : {}".format(json.dumps(usage)))
+    if object_complete:
+        drain_usage(events, usage)
+
+    return stop_reason, message, usage
+
+
+def read_metadata(usage, metadata):
+    """Token usage and latency of the metadata event of a response stream"""
+    usage['input_tokens'] = metadata.get('usage', {}).get('inputTokens', 0)
+    usage['output_tokens'] = metadata.get('usage', {}).get('outputTokens', 0)
+    usage['total_tokens'] = metadata.get('usage', {}).get('totalTokens', 0)
+    usage['cache_read_input_tokens'] = metadata.get('usage', {}).get('cacheReadInputTokens', 0)
+    usage['cache_write_input_tokens'] = metadata.get('usage', {}).get('cacheWriteInputTokens', 0)
+    usage['latency_ms'] = metadata.get('metrics', {}).get('latencyMs')
+
+
+def drain_usage(events, usage):
+    """Read the rest of a response stream in a background thread, its metadata event updates usage in place"""
+    def drain():
+        try:
+            for chunk in events:
+                if 'metadata' in chunk:
+                    read_metadata(usage, chunk['metadata'])
+            logger.info("Model usage after the response : {}".format(json.dumps(usage)))
+        except Exception as e:
+            logger.warning(f"Usage of the {usage['model_id']} response not received: {type(e).__name__}: {e}")
+        finally:
+            with _usage_drains_lock:
+                _usage_drains.discard(thread)
+
+    thread = threading.Thread(target=drain, daemon=True)
+    with _usage_drains_lock:
+        _usage_drains.add(thread)
+    thread.start()
+
+
+def wait_for_usage(timeout):
+    """
+    Wait until the streams drained by drain_usage have delivered their usage.
+    Returns:
+        int: Streams still read after the timeout, their usage misses the metadata.
+    """
+    deadline = time.monotonic() + timeout
+    with _usage_drains_lock:
+        threads = list(_usage_drains)
+    for thread in threads:
+        thread.join(max(0.0, deadline - time.monotonic()))
+    return sum(thread.is_alive() for thread in threads)
@@ -0,0 +1,82 @@
+import hashlib
+import json
+import os
+
+import kv_store
+import result_cache
+from utils import logger
+
+store_backend = os.environ.get("WORKSPACE_STORE_BACKEND", "memory")
+store_ttl = int(os.environ.get("WORKSPACE_STORE_TTL", 7 * 86400))
+store_max_entries = int(os.environ.get("WORKSPACE_STORE_MAX_ENTRIES", 256))
+store_dir = os.environ.get("WORKSPACE_STORE_DIR", "/tmp/runtask-workspace-store")
+store_table_name = os.environ.get("WORKSPACE_STORE_TABLE", None)
+
+
+def fingerprint(resource_change):
+    """Stable hash of a reduced resource change"""
+    canonical = json.dumps(resource_change, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def split_changes(resource_changes, fingerprints, previous):
+    """
+    Split the resource changes into the ones that need a new analysis and the cached findings of the others.
+    Args:
+        resource_changes (list): Reduced resource changes of the current plan.
+        fingerprints (dict): Address to fingerprint of the current plan.
+        previous (dict): Address to fingerprint and finding of the last analyzed plan.
+
+    Returns:
+        changed_resources (list): Resource changes not analyzed before.
+        cached_findings (dict): Address to finding of the unchanged resource changes.
+    """
+    changed_resources = []
+    cached_findings = {}
+    for resource_change in resource_changes:
+        address = resource_change["address"]
+        entry = previous.get(address)
+        if entry and entry["fingerprint"] == fingerprints[address]:
+            cached_findings[address] = entry["finding"]
+        else:
+            changed_resources.append(resource_change)
+
+    logger.info(
+        f"Incremental analysis: {len(changed_resources)} changed, {len(cached_findings)} unchanged resource addresses"
+    )
+    return changed_resources, cached_findings
+
+
+@kv_store.per_container
+def get_store():
+    backend = kv_store.build_backend(
+        store_backend, directory=store_dir, table_name=store_table_name, max_entries=store_max_entries
+    )
+    return WorkspaceStore(backend, ttl=store_ttl)
+
+
+class WorkspaceStore:
+    """
+    Per workspace fingerprints and findings of the last analyzed plan, with the model that produced them.
+    Entries produced by another prompt version are ignored.
+    """
+
+    def __init__(self, backend, ttl=7 * 86400):
+        self.cache = result_cache.ResultCache(backend, ttl=ttl, name="Workspace store")
+
+    def load(self, workspace_id, prompt_version):
+        """
+        Returns:
+            model_id (str): Model of the stored findings, None when there are none.
+            addresses (dict): Address to fingerprint and finding of the last analyzed plan.
+        """
+        entry = self.cache.get(f"workspace:{workspace_id}")
+        if not entry or entry["prompt_version"] != prompt_version:
+            return None, {}
+        return entry["model_id"], entry["addresses"]
+
+    def save(self, workspace_id, model_id, prompt_version, addresses):
+        self.cache.put(
+            f"workspace:{workspace_id}",
+            {"model_id": model_id, "prompt_version": prompt_version, "addresses": addresses},
+        )
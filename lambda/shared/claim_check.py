@@ -0,0 +1,153 @@
+"""Claim check store keeping large run task artifacts out of the Step Functions state, shared by the fulfillment and callback Lambda functions"""
+
+import json
+import logging
+import os
+import threading
+from urllib.parse import urlsplit
+
+import kv_store
+from lazy import lazy_client
+
+claim_check_backend = os.environ.get("CLAIM_CHECK_BACKEND", "none")
+claim_check_bucket = os.environ.get("CLAIM_CHECK_BUCKET", None)
+claim_check_prefix = os.environ.get("CLAIM_CHECK_PREFIX", "runtask/")
+claim_check_dir = os.environ.get("CLAIM_CHECK_DIR", "/tmp/runtask-claim-check")
+# Step Functions fails an execution whose state, input or output, exceeds 256 KB of UTF-8 text
+STATE_LIMIT_BYTES = 256 * 1024
+# Room kept for the states after the fulfillment, the callback result and the Lambda invoke response wrapper
+claim_check_reserve = int(os.environ.get("CLAIM_CHECK_RESERVE_BYTES", 16 * 1024))
+# Optional lower bound, values above it are checked in even when the state fits, 0 only checks in what must be
+claim_check_threshold = int(os.environ.get("CLAIM_CHECK_THRESHOLD_BYTES", 0))
+
+logger = logging.getLogger()
+
+
+@kv_store.per_container
+def get_store():
+    if claim_check_backend == "s3" and claim_check_bucket:
+        backend = S3Backend(claim_check_bucket)
+    elif claim_check_backend == "filesystem":
+        backend = FilesystemBackend(directory=claim_check_dir)
+    else:
+        backend = None
+    return ClaimCheckStore(
+        backend, prefix=claim_check_prefix, reserve_bytes=claim_check_reserve, threshold_bytes=claim_check_threshold
+    )
+
+
+class ClaimCheckStore:
+    """
+    Writes JSON values to an object store and hands out references to them, the Step Functions state only
+    carries the references. Objects are never deleted by the functions, a retried state reads them again,
+    expire them with a lifecycle rule of the bucket.
+    """
+
+    def __init__(self, backend, prefix="runtask/", reserve_bytes=16 * 1024, threshold_bytes=0):
+        self.backend = backend
+        self.prefix = prefix
+        self.reserve_bytes = reserve_bytes
+        self.threshold_bytes = threshold_bytes
+
+    @property
+    def budget_bytes(self):
+        """Largest state the fulfillment result may produce"""
+        return STATE_LIMIT_BYTES - self.reserve_bytes
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def check_in(self, name, value):
+        """
+        Args:
+            name (str): Object name below the prefix, e.g. <execution name>/results.json.
+            value: JSON serializable value.
+
+        Returns:
+            str: Reference of the stored object, None when the claim check is disabled.
+        """
+        if self.backend is None:
+            return None
+        data = json.dumps(value, separators=(",", ":")).encode("utf-8")
+        reference = self.backend.put(f"{self.prefix}{name}", data)
+        logger.info(f"Claim check {reference} written, {len(data)} bytes")
+        return reference
+
+    def offload(self, name, value, state_bytes=0):
+        """
+        Check the value in when the state would not fit the budget with it, or when it exceeds the optional
+        threshold.
+        Args:
+            name (str): Object name below the prefix.
+            value: JSON serializable value added to the state.
+            state_bytes (int): Size of the rest of the state.
+
+        Returns:
+            str: Reference of the stored value, None when it stays in the state.
+        """
+        if self.backend is None:
+            return None
+        # Measured as the Lambda runtime serializes its response, non ASCII characters take 6 bytes escaped
+        size = len(json.dumps(value))
+        over_budget = state_bytes + size > self.budget_bytes
+        if not over_budget and not (self.threshold_bytes and size > self.threshold_bytes):
+            return None
+        logger.info(
+            f"Claim check of {name}: {size} bytes with a state of {state_bytes} bytes, budget {self.budget_bytes} bytes"
+        )
+        return self.check_in(name, value)
+
+    def check_out(self, reference):
+        """Value of a reference returned by check_in"""
+        if self.backend is None:
+            raise ValueError(f"Claim check {reference} can not be read, CLAIM_CHECK_BACKEND is not configured")
+        return json.loads(self.backend.get(reference))
+
+
+class FilesystemBackend:
+    """Objects stored as files below a local directory, for tests and local runs of both functions"""
+
+    def __init__(self, directory="/tmp/runtask-claim-check"):
+        self.directory = os.path.realpath(directory)
+
+    def put(self, key, data):
+        path = os.path.join(self.directory, key)
+        self._check(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, path)
+        return f"file://{path}"
+
+    def get(self, reference):
+        parts = urlsplit(reference)
+        if parts.scheme != "file":
+            raise ValueError(f"Claim check {reference} is not a file reference")
+        self._check(parts.path)
+        with open(parts.path, "rb") as file:
+            return file.read()
+
+    def _check(self, path):
+        # References come from the state input, only paths below the directory are read or written
+        if os.path.commonpath([self.directory, os.path.realpath(path)]) != self.directory:
+            raise ValueError(f"Claim check path {path} is outside {self.directory}")
+
+
+class S3Backend:
+    """Objects stored in an S3 bucket, the functions need s3:PutObject and s3:GetObject on the prefix"""
+
+    def __init__(self, bucket, client=None):
+        self.bucket = bucket
+        self.client = client if client is not None else lazy_client("s3")
+
+    def put(self, key, data):
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data, ContentType="application/json")
+        return f"s3://{self.bucket}/{key}"
+
+    def get(self, reference):
+        parts = urlsplit(reference)
+        if parts.scheme != "s3" or parts.netloc != self.bucket:
+            raise ValueError(f"Claim check {reference} is not an object of the bucket {self.bucket}")
+        return self.client.get_object(Bucket=self.bucket, Key=parts.path.lstrip("/"))["Body"].read()
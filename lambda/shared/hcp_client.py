@@ -0,0 +1,251 @@
+"""HCP Terraform API client shared by the run task Lambda functions"""
+
+import email.utils
+import http.client
+import io
+import logging
+import os
+import random
+import re
+import threading
+import time
+import zlib
+from urllib.error import HTTPError, URLError
+from urllib.parse import urljoin, urlsplit
+
+HCP_TF_HOST_NAME = os.environ.get("HCP_TF_HOST_NAME", "app.terraform.io")
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+REDIRECT_STATUS_CODES = (301, 302, 303, 307, 308)
+
+logger = logging.getLogger()
+
+
+def validate_endpoint(endpoint, host_name=HCP_TF_HOST_NAME):
+    # validate that the endpoint hostname is valid
+    pattern = r"^https://" + str(host_name).replace(".", r"\.") + r"/.*"
+    return re.match(pattern, endpoint)
+
+
+def deadline_from_context(context, margin_seconds=5):
+    """Absolute monotonic deadline derived from the remaining Lambda execution time"""
+    if context is None:
+        return None
+    return time.monotonic() + context.get_remaining_time_in_millis() / 1000 - margin_seconds
+
+
+class HCPClient:
+    """
+    Keeps one keep-alive connection per host, reused across warm invocations.
+    Requests ask for gzip, retry throttling and transient errors with exponential backoff and jitter honoring
+    Retry-After, and follow redirects (e.g. to the HCP Terraform archivist) without forwarding the token to other hosts.
+    """
+
+    def __init__(self, host_name=HCP_TF_HOST_NAME, max_attempts=5, base_delay=0.5, max_delay=20, max_redirects=5):
+        self.host_name = host_name
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_redirects = max_redirects
+        self.connections = {}
+        self.lock = threading.Lock()
+
+    def request(self, method, url, headers=None, body=None, timeout=30, deadline=None):
+        """
+        Send a request to HCP Terraform and return an HCPResponse, the caller must read or close it.
+        Args:
+            method (str): HTTP method.
+            url (str): Endpoint URL, its host must be the HCP Terraform host.
+            headers (dict): Request headers.
+            body (bytes): Request body.
+            timeout (int): Maximum socket timeout in seconds.
+            deadline (float): Monotonic time after which no new attempt is started, see deadline_from_context.
+
+        Raises:
+            URLError: Invalid endpoint, connection failure or deadline exceeded.
+            HTTPError: Non successful status after retries.
+        """
+        if not validate_endpoint(url, self.host_name):
+            raise URLError(f"Invalid endpoint URL, expected host is: {self.host_name}")
+
+        headers = dict(headers or {})
+        headers.setdefault("Accept-Encoding", "gzip")
+
+        for _ in range(self.max_redirects + 1):
+            response = self._send_with_retries(method, url, headers, body, timeout, deadline)
+            if response.status not in REDIRECT_STATUS_CODES:
+                if response.status >= 400:
+                    raise _http_error(url, response)
+                return response
+
+            location = response.getheader("Location")
+            response.read()  # drain so the connection can be reused
+            if not location:
+                raise HTTPError(url, response.status, "Redirect without location", response.headers, None)
+            next_url = urljoin(url, location)
+            if urlsplit(next_url).scheme != "https":
+                raise URLError(f"Refusing redirect to non HTTPS URL {next_url}")
+            if urlsplit(next_url).netloc != urlsplit(url).netloc:
+                # Redirect targets such as the archivist use signed URLs, never forward the API token
+                headers = {key: value for key, value in headers.items() if key.lower() != "authorization"}
+            if response.status == 303:
+                method, body = "GET", None
+            url = next_url
+
+        raise URLError(f"Too many redirects for {url}")
+
+    def _send_with_retries(self, method, url, headers, body, timeout, deadline):
+        for attempt in range(1, self.max_attempts + 1):
+            attempt_timeout = timeout
+            if deadline is not None:
+                attempt_timeout = min(timeout, deadline - time.monotonic())
+                if attempt_timeout <= 0:
+                    raise URLError(f"Deadline exceeded before attempt {attempt} for {url}")
+
+            retry_after = None
+            try:
+                response = self._send(method, url, headers, body, attempt_timeout)
+                if response.status not in RETRY_STATUS_CODES:
+                    return response
+                retry_after = _parse_retry_after(response.getheader("Retry-After"))
+                if attempt == self.max_attempts:
+                    raise _http_error(url, response)
+                response.read()  # drain so the connection can be reused
+                logger.warning(f"HCP Terraform returned {response.status} for {method} {url}, attempt {attempt}")
+            except (http.client.HTTPException, OSError) as error:
+                self._drop_connection(url)
+                if attempt == self.max_attempts:
+                    raise URLError(error)
+                logger.warning(f"HCP Terraform request error {error} for {method} {url}, attempt {attempt}")
+
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))  # nosec jitter only
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            if deadline is not None and time.monotonic() + delay >= deadline:
+                raise URLError(f"Deadline exceeded while retrying {url}")
+            time.sleep(delay)
+
+    def _send(self, method, url, headers, body, timeout):
+        parts = urlsplit(url)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+
+        connection = self._get_connection(parts.netloc)
+        connection.timeout = timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+        except Exception:
+            connection.close()
+            raise
+        return HCPResponse(response, connection, self, parts.netloc)
+
+    def _get_connection(self, netloc):
+        with self.lock:
+            connection = self.connections.pop(netloc, None)
+        if connection is None:
+            connection = http.client.HTTPSConnection(netloc)
+        return connection
+
+    def release(self, netloc, connection):
+        with self.lock:
+            if netloc in self.connections:
+                connection.close()
+            else:
+                self.connections[netloc] = connection
+
+    def _drop_connection(self, url):
+        with self.lock:
+            connection = self.connections.pop(urlsplit(url).netloc, None)
+        if connection is not None:
+            connection.close()
+
+
+class HCPResponse:
+    """File like response body, transparently decompresses gzip and returns the connection to the pool"""
+
+    def __init__(self, response, connection, client, netloc):
+        self.response = response
+        self.connection = connection
+        self.client = client
+        self.netloc = netloc
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+        self.decompressor = None
+        if (response.getheader("Content-Encoding") or "").lower() == "gzip":
+            self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.closed = False
+
+    def getheader(self, name, default=None):
+        return self.response.getheader(name, default)
+
+    def read(self, size=-1):
+        if self.closed:
+            return b""
+        if self.decompressor is None:
+            data = self.response.read() if size is None or size < 0 else self.response.read(size)
+        else:
+            data = b""
+            while not data and not self.response.isclosed():
+                raw = self.response.read() if size is None or size < 0 else self.response.read(size)
+                if not raw:
+                    break
+                data = self.decompressor.decompress(raw)
+            if self.response.isclosed():
+                data += self.decompressor.flush()
+        if self.response.isclosed():
+            self._finish()
+        return data
+
+    def close(self):
+        if not self.closed:
+            if not self.response.isclosed():
+                # Unread body, the connection can not be reused
+                self.connection.close()
+            self._finish()
+
+    def _finish(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.response.will_close or self.connection.sock is None:
+            self.connection.close()
+        else:
+            self.client.release(self.netloc, self.connection)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+
+def _http_error(url, response):
+    body = response.read()
+    return HTTPError(url, response.status, response.reason, response.headers, io.BytesIO(body))
+
+
+def _parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        parsed = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, parsed.timestamp() - time.time()) if parsed else None
+
+
+_client = HCPClient()
+
+
+def get_client():
+    """Module level client, its connection pool survives across warm invocations"""
+    return _client
@@ -0,0 +1,104 @@
+"""Idempotency keys of the run task deliveries, shared by the ingress and callback Lambda functions"""
+
+import logging
+import os
+import time
+
+import kv_store
+
+IN_FLIGHT = "in_flight"
+COMPLETED = "completed"
+
+idempotency_backend = os.environ.get("IDEMPOTENCY_BACKEND", "memory")
+# An in flight key outlives the Step Functions execution it started, after that a redelivery starts a new one
+in_flight_ttl = int(os.environ.get("IDEMPOTENCY_IN_FLIGHT_TTL", 900))
+completed_ttl = int(os.environ.get("IDEMPOTENCY_COMPLETED_TTL", 86400))
+idempotency_max_entries = int(os.environ.get("IDEMPOTENCY_MAX_ENTRIES", 1024))
+idempotency_dir = os.environ.get("IDEMPOTENCY_DIR", "/tmp/runtask-idempotency")
+idempotency_table_name = os.environ.get("IDEMPOTENCY_TABLE", None)
+
+logger = logging.getLogger()
+
+
+def build_key(payload):
+    """
+    Idempotency key of a run task request payload, HCP Terraform sends the same run, stage and task result
+    again when a delivery times out.
+    Returns:
+        str: run_id:stage:task_result_id, None when the payload lacks one of them or is a verification request.
+    """
+    # Verification requests of the run task setup carry fixed placeholder ids, every one of them must pass
+    if payload.get("access_token") == "test-token":
+        return None
+    task_result_id = payload.get("task_result_id")
+    if not task_result_id:
+        # .../api/v2/task-results/<task_result_id>/callback
+        parts = str(payload.get("task_result_callback_url") or "").rstrip("/").split("/")
+        if len(parts) >= 3 and parts[-3] == "task-results":
+            task_result_id = parts[-2]
+    run_id = payload.get("run_id")
+    stage = payload.get("stage")
+    if not (run_id and stage and task_result_id):
+        return None
+    return f"{run_id}:{stage}:{task_result_id}"
+
+
+@kv_store.per_container
+def get_store():
+    """
+    Only the dynamodb backend is shared by every container and by the callback function, memory and disk catch
+    the redeliveries reaching the same container and serve local runs.
+    """
+    backend = kv_store.build_backend(
+        idempotency_backend,
+        directory=idempotency_dir,
+        table_name=idempotency_table_name,
+        key_name="idempotency_key",
+        max_entries=idempotency_max_entries,
+    )
+    return IdempotencyStore(backend, in_flight_ttl=in_flight_ttl, completed_ttl=completed_ttl)
+
+
+class IdempotencyStore:
+    """
+    Status of each delivery key: claimed as in flight before the event is forwarded, released when forwarding
+    fails, completed once the callback reached HCP Terraform. Backend errors fail open, a duplicate run is
+    cheaper than a dropped one.
+    """
+
+    def __init__(self, backend, in_flight_ttl=900, completed_ttl=86400):
+        self.backend = backend
+        self.in_flight_ttl = in_flight_ttl
+        self.completed_ttl = completed_ttl
+
+    def claim(self, key):
+        """
+        Returns:
+            str: Status of the existing unexpired entry when the key is a duplicate, None when the claim succeeded.
+        """
+        if self.backend is None or key is None:
+            return None
+        try:
+            status = self.backend.put_if_absent(key, IN_FLIGHT, expires_at=time.time() + self.in_flight_ttl)
+        except Exception as e:
+            logger.error(f"Idempotency claim failed for key {key}: {e}")
+            return None
+        if status is not None:
+            logger.info(f"Duplicate delivery for key {key}, status {status}")
+        return status
+
+    def complete(self, key):
+        if self.backend is None or key is None:
+            return
+        try:
+            self.backend.put(key, COMPLETED, expires_at=time.time() + self.completed_ttl)
+        except Exception as e:
+            logger.error(f"Idempotency completion failed for key {key}: {e}")
+
+    def release(self, key):
+        if self.backend is None or key is None:
+            return
+        try:
+            self.backend.delete(key)
+        except Exception as e:
+            logger.error(f"Idempotency release failed for key {key}: {e}")
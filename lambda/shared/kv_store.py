@@ -0,0 +1,320 @@
+"""Expiring key value backends of the result cache, workspace store and idempotency store, shared by the run task Lambda functions"""
+
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# DynamoDB rejects items larger than 400 KB
+DYNAMODB_MAX_ITEM_BYTES = 400 * 1024
+
+logger = logging.getLogger()
+
+
+def per_container(factory):
+    """
+    Decorator building the value of factory on the first call, later calls and warm invocations of the container
+    get the same value.
+    """
+    lock = threading.Lock()
+    built = []
+
+    @functools.wraps(factory)
+    def get():
+        if not built:
+            with lock:
+                if not built:
+                    built.append(factory())
+        return built[0]
+
+    return get
+
+
+def build_backend(kind, directory, table_name=None, key_name="cache_key", max_entries=1024,
+                  memory_max_bytes=0, disk_max_bytes=0):
+    """
+    Backend of a *_BACKEND setting, memory and disk only serve the container, dynamodb is shared by every container
+    and function using the table.
+    Args:
+        kind (str): memory, disk or dynamodb, any other value or dynamodb without table_name disables the store.
+        directory (str): Directory of the disk backend.
+        table_name (str): Table of the dynamodb backend.
+        key_name (str): Partition key of the table.
+        max_entries (int): Entries kept by the memory backend.
+        memory_max_bytes (int): Serialized values kept by the memory backend, 0 for no bound.
+        disk_max_bytes (int): Files kept by the disk backend, 0 for no bound.
+
+    Returns:
+        Backend, None when the store is disabled.
+    """
+    if kind == "memory":
+        return MemoryBackend(max_entries=max_entries, max_bytes=memory_max_bytes)
+    if kind == "disk":
+        return DiskBackend(directory=directory, max_bytes=disk_max_bytes)
+    if kind == "dynamodb" and table_name:
+        import boto3
+
+        return DynamoDBBackend(boto3.resource("dynamodb").Table(table_name), key_name=key_name)
+    return None
+
+
+class MemoryBackend:
+    """
+    LRU entries living in the Lambda container memory, the least recently used entries are evicted above
+    max_entries or above max_bytes of serialized values
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            return self._get(key)
+
+    def _get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.time():
+            self._remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key, value, expires_at):
+        # Only measured when the size is bounded, the serialization is not free
+        size = len(json.dumps(value, separators=(",", ":"), default=str).encode("utf-8")) if self.max_bytes else 0
+        with self.lock:
+            self._put(key, value, expires_at, size)
+
+    def put_if_absent(self, key, value, expires_at):
+        """
+        Returns:
+            Value of the unexpired entry of the key, None when the value was stored.
+        """
+        size = len(json.dumps(value, separators=(",", ":"), default=str).encode("utf-8")) if self.max_bytes else 0
+        with self.lock:
+            existing = self._get(key)
+            if existing is not None:
+                return existing
+            self._put(key, value, expires_at, size)
+            return None
+
+    def _put(self, key, value, expires_at, size):
+        self._remove(key)
+        if self.max_bytes and size > self.max_bytes:
+            logger.info(f"Entry {key} exceeds the memory store size, skipped")
+            return
+        self.entries[key] = (expires_at, value, size)
+        self.total_bytes += size
+        while len(self.entries) > self.max_entries or (self.max_bytes and self.total_bytes > self.max_bytes):
+            _, (_, _, evicted_size) = self.entries.popitem(last=False)
+            self.total_bytes -= evicted_size
+
+    def delete(self, key):
+        with self.lock:
+            self._remove(key)
+
+    def _remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.total_bytes -= entry[2]
+
+
+class DiskBackend:
+    """
+    One JSON file per key under /tmp, the least recently used files are evicted above max_bytes.
+    put_if_absent links a complete file in place only when none exists, so concurrent invocations of the
+    container agree on one value.
+    """
+
+    def __init__(self, directory, max_bytes=0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key.replace("/", "_").replace(":", "_") + ".json")
+
+    def _read(self, path):
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                entry = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+        return entry if entry["expires_at"] >= time.time() else None
+
+    def get(self, key):
+        path = self._path(key)
+        entry = self._read(path)
+        if entry is None:
+            self._remove(path)
+            return None
+        os.utime(path)  # mark as recently used
+        return entry["value"]
+
+    def put(self, key, value, expires_at):
+        path = self._path(key)
+        os.replace(self._write_temp(path, value, expires_at), path)
+        self._evict()
+
+    def put_if_absent(self, key, value, expires_at):
+        """
+        Returns:
+            Value of the unexpired entry of the key, None when the value was stored.
+        """
+        path = self._path(key)
+        temp_path = self._write_temp(path, value, expires_at)
+        try:
+            for _ in range(2):
+                try:
+                    # The link is created with its whole content or not at all
+                    os.link(temp_path, path)
+                    self._evict()
+                    return None
+                except FileExistsError:
+                    entry = self._read(path)
+                    if entry is not None:
+                        return entry["value"]
+                    self._remove(path)
+            # Lost the race twice, another invocation holds the key
+            return value
+        finally:
+            os.remove(temp_path)
+
+    def _write_temp(self, path, value, expires_at):
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump({"expires_at": expires_at, "value": value}, file)
+        return temp_path
+
+    def delete(self, key):
+        self._remove(self._path(key))
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        if not self.max_bytes:
+            return
+        files = []
+        total_bytes = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, name))
+            total_bytes += stat.st_size
+        for _, size, name in sorted(files):
+            if total_bytes <= self.max_bytes:
+                break
+            self._remove(os.path.join(self.directory, name))
+            total_bytes -= size
+
+
+class DynamoDBBackend:
+    """
+    Entries of a DynamoDB table with partition key key_name, values are stored as JSON in the `value` attribute
+    and put_if_absent is a conditional put.
+    Enable DynamoDB TTL on the `expires_at` attribute to let the table evict expired entries.
+    """
+
+    def __init__(self, table, key_name="cache_key"):
+        self.table = table
+        self.key_name = key_name
+
+    def get(self, key):
+        item = self.table.get_item(Key={self.key_name: key}).get("Item")
+        if item is None or int(item["expires_at"]) < time.time():
+            return None
+        return json.loads(item["value"])
+
+    def put(self, key, value, expires_at):
+        serialized = json.dumps(value, separators=(",", ":"))
+        if len(serialized.encode("utf-8")) > DYNAMODB_MAX_ITEM_BYTES:
+            logger.info(f"Entry {key} exceeds the DynamoDB item size, skipped")
+            return
+        self.table.put_item(Item={self.key_name: key, "value": serialized, "expires_at": int(expires_at)})
+
+    def put_if_absent(self, key, value, expires_at):
+        """
+        Returns:
+            Value of the unexpired entry of the key, None when the value was stored.
+        """
+        try:
+            self.table.put_item(
+                Item={self.key_name: key, "value": json.dumps(value, separators=(",", ":")), "expires_at": int(expires_at)},
+                ConditionExpression=f"attribute_not_exists({self.key_name}) OR expires_at < :now",
+                ExpressionAttributeValues={":now": int(time.time())},
+                ReturnValuesOnConditionCheckFailure="ALL_OLD",
+            )
+            return None
+        except Exception as e:
+            # Matched by error code so botocore is not imported during the cold start
+            if getattr(e, "response", {}).get("Error", {}).get("Code") != "ConditionalCheckFailedException":
+                raise
+            item = e.response.get("Item") or self.table.get_item(Key={self.key_name: key}).get("Item") or {}
+        existing = item.get("value")
+        if isinstance(existing, dict):  # low level attribute value of ReturnValuesOnConditionCheckFailure
+            existing = existing.get("S")
+        # Deleted since the failed condition, the holder released it while this call ran
+        return json.loads(existing) if existing else value
+
+    def delete(self, key):
+        self.table.delete_item(Key={self.key_name: key})
+
+
+class ConditionalCheckFailedError(Exception):
+    """Failed conditional put of LocalDynamoDBTable, with the response of the botocore ClientError"""
+
+    def __init__(self, item):
+        super().__init__("The conditional request failed")
+        self.response = {
+            "Error": {"Code": "ConditionalCheckFailedException", "Message": "The conditional request failed"},
+            "Item": {
+                name: {"S": value} if isinstance(value, str) else {"N": str(value)} for name, value in item.items()
+            },
+        }
+
+
+class LocalDynamoDBTable:
+    """
+    In-memory stand-in for a boto3 DynamoDB Table, for local runs and tests. The conditional put of
+    DynamoDBBackend.put_if_absent fails when an unexpired item exists.
+    """
+
+    def __init__(self, key_name="cache_key"):
+        self.key_name = key_name
+        self.items = {}
+        self.lock = threading.Lock()
+
+    def get_item(self, Key):
+        with self.lock:
+            item = self.items.get(Key[self.key_name])
+        return {"Item": dict(item)} if item is not None else {}
+
+    def put_item(self, Item, ConditionExpression=None, ExpressionAttributeValues=None, **_):
+        with self.lock:
+            existing = self.items.get(Item[self.key_name])
+            if ConditionExpression and existing and existing["expires_at"] >= ExpressionAttributeValues[":now"]:
+                raise ConditionalCheckFailedError(existing)
+            self.items[Item[self.key_name]] = dict(Item)
+        return {}
+
+    def delete_item(self, Key):
+        with self.lock:
+            self.items.pop(Key[self.key_name], None)
+        return {}
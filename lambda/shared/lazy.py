@@ -0,0 +1,61 @@
+"""Lazy construction of AWS clients and heavy modules shared by the run task Lambda functions"""
+
+import importlib
+import threading
+
+
+class LazyObject:
+    """
+    Proxy that builds its target with the factory on first attribute access and reuses it afterwards.
+    Module level clients and modules defined this way cost nothing at import, which keeps cold starts short
+    for invocations that never use them, and the target still survives across warm invocations.
+    """
+
+    def __init__(self, factory, name=None):
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_name", name or getattr(factory, "__name__", "lazy object"))
+        object.__setattr__(self, "_target", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def _get(self):
+        target = self._target
+        if target is None:
+            with self._lock:
+                target = self._target
+                if target is None:
+                    target = self._factory()
+                    object.__setattr__(self, "_target", target)
+        return target
+
+    def __getattr__(self, name):
+        return getattr(self._get(), name)
+
+    def __repr__(self):
+        state = "loaded" if self._target is not None else "not loaded"
+        return f"<LazyObject {self._name} ({state})>"
+
+
+def lazy_client(service_name, config=None, **kwargs):
+    """
+    boto3 client created on first use.
+    Args:
+        service_name (str): AWS service name, e.g. "bedrock-runtime".
+        config (dict): Optional botocore.config.Config arguments, only imported when the client is built.
+        kwargs: Other boto3 client arguments.
+    """
+    def factory():
+        import boto3
+
+        client_kwargs = dict(kwargs)
+        if config is not None:
+            import botocore.config
+
+            client_kwargs["config"] = botocore.config.Config(**config)
+        return boto3.Session().client(service_name=service_name, **client_kwargs)
+
+    return LazyObject(factory, name=f"{service_name} client")
+
+
+def lazy_import(module_name):
+    """Module imported on first attribute access"""
+    return LazyObject(lambda: importlib.import_module(module_name), name=module_name)
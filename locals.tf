@@ -13,6 +13,11 @@ locals {
   lambda_python_runtime       = var.lambda_python_runtime
   lambda_architecture         = [var.lambda_architecture]
 
+  result_cache_table = var.result_cache_backend == "dynamodb" ? 1 : 0
+  idempotency_table  = var.idempotency_backend == "dynamodb" ? 1 : 0
+  claim_check_bucket = var.claim_check_enabled ? 1 : 0
+  claim_check_prefix = "runtask/"
+
   cloudwatch_log_group_name = var.cloudwatch_log_group_name
 
   waf_deployment = var.deploy_waf ? 1 : 0
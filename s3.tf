@@ -0,0 +1,55 @@
+#####################################################################################
+# S3
+#####################################################################################
+
+# Claim check objects, fulfillment results too large for the Step Functions state
+resource "aws_s3_bucket" "runtask_claim_check" {
+  count         = local.claim_check_bucket
+  bucket        = "${local.solution_prefix}-claim-check-${data.aws_caller_identity.current_account.account_id}"
+  force_destroy = true
+  tags          = local.combined_tags
+  #checkov:skip=CKV_AWS_18:no access logging for transient claim check objects
+  #checkov:skip=CKV_AWS_21:objects are written once and expire, no versioning
+  #checkov:skip=CKV_AWS_144:no cross-region replication for transient claim check objects
+  #checkov:skip=CKV2_AWS_62:no event notifications required
+}
+
+resource "aws_s3_bucket_public_access_block" "runtask_claim_check" {
+  count                   = local.claim_check_bucket
+  bucket                  = aws_s3_bucket.runtask_claim_check[count.index].id
+  block_public_acls       = true
+  block_public_policy     = true
+  ignore_public_acls      = true
+  restrict_public_buckets = true
+}
+
+resource "aws_s3_bucket_server_side_encryption_configuration" "runtask_claim_check" {
+  count  = local.claim_check_bucket
+  bucket = aws_s3_bucket.runtask_claim_check[count.index].id
+  rule {
+    apply_server_side_encryption_by_default {
+      sse_algorithm     = "aws:kms"
+      kms_master_key_id = aws_kms_key.runtask_key.arn
+    }
+    bucket_key_enabled = true
+  }
+}
+
+# Objects are only read by the execution that wrote them, the functions never delete them
+resource "aws_s3_bucket_lifecycle_configuration" "runtask_claim_check" {
+  count  = local.claim_check_bucket
+  bucket = aws_s3_bucket.runtask_claim_check[count.index].id
+  rule {
+    id     = "expire-claim-checks"
+    status = "Enabled"
+    filter {
+      prefix = local.claim_check_prefix
+    }
+    expiration {
+      days = var.claim_check_expiration_days
+    }
+    abort_incomplete_multipart_upload {
+      days_after_initiation = 1
+    }
+  }
+}
@@ -0,0 +1,25 @@
+{
+    "Version": "2012-10-17",
+    "Statement": [
+        {
+            "Action": ${jsonencode(local_object_actions)},
+            "Resource": "${resource_claim_check_bucket_arn}/${local_claim_check_prefix}*",
+            "Effect": "Allow",
+            "Sid": "ClaimCheckObjectOps"
+        },
+        {
+            "Action": [
+                "kms:Decrypt",
+                "kms:GenerateDataKey*"
+            ],
+            "Resource": "${resource_kms_key_arn}",
+            "Effect": "Allow",
+            "Sid": "ClaimCheckKmsOps",
+            "Condition": {
+                "StringEquals": {
+                    "kms:ViaService": "s3.${data_aws_region}.amazonaws.com"
+                }
+            }
+        }
+    ]
+}
\ No newline at end of file
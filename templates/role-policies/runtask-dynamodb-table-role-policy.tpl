@@ -0,0 +1,26 @@
+{
+    "Version": "2012-10-17",
+    "Statement": [
+        {
+            "Action": ${jsonencode(local_table_actions)},
+            "Resource": "${resource_table_arn}",
+            "Effect": "Allow",
+            "Sid": "DynamoDBItemOps"
+        },
+        {
+            "Action": [
+                "kms:Decrypt",
+                "kms:DescribeKey",
+                "kms:GenerateDataKey*"
+            ],
+            "Resource": "${resource_kms_key_arn}",
+            "Effect": "Allow",
+            "Sid": "DynamoDBKmsOps",
+            "Condition": {
+                "StringEquals": {
+                    "kms:ViaService": "dynamodb.${data_aws_region}.amazonaws.com"
+                }
+            }
+        }
+    ]
+}
\ No newline at end of file
@@ -151,4 +151,56 @@ variable "bedrock_llm_model" {
   description = "Bedrock LLM model to use (supports cross-region inference profiles)"
   type        = string
   default     = "global.anthropic.claude-sonnet-4-20250514-v1:0"
-}
\ No newline at end of file
+}
+
+variable "bedrock_llm_model_tiers" {
+  description = "Optional Bedrock model tiers (model ids or inference profiles), ordered from the fastest to the most capable model. Each analysis stage uses the first tier whose input token and complexity limits fit it, the last tier takes every other stage. Defaults to bedrock_llm_model for every stage"
+  type = list(object({
+    model_id         = string
+    max_input_tokens = optional(number)
+    max_complexity   = optional(number)
+  }))
+  default = []
+}
+
+variable "result_cache_backend" {
+  description = "Backend of the analysis result cache and of the per workspace findings: dynamodb for a table created by this module and shared by every Lambda container, memory or disk to keep them within one Lambda container, none to disable them"
+  type        = string
+  default     = "dynamodb"
+  validation {
+    condition     = contains(["dynamodb", "memory", "disk", "none"], var.result_cache_backend)
+    error_message = "Valid values for var: result_cache_backend are dynamodb, memory, disk, none"
+  }
+}
+
+variable "result_cache_ttl" {
+  description = "Time in seconds a cached analysis result is reused for an identical plan"
+  type        = number
+  default     = 86400
+}
+
+variable "idempotency_backend" {
+  description = "Backend of the delivery keys that drop duplicate run task requests: dynamodb for a table created by this module and shared by every Lambda container, memory or disk to only catch the duplicates reaching the same Lambda container, none to disable it"
+  type        = string
+  default     = "dynamodb"
+  validation {
+    condition     = contains(["dynamodb", "memory", "disk", "none"], var.idempotency_backend)
+    error_message = "Valid values for var: idempotency_backend are dynamodb, memory, disk, none"
+  }
+}
+
+variable "claim_check_enabled" {
+  description = "Set to true to create an S3 bucket for the fulfillment results that would exceed the Step Functions state limit, the state then only carries a reference to them"
+  type        = bool
+  default     = true
+}
+
+variable "claim_check_expiration_days" {
+  description = "Number of days after which the claim check objects are deleted"
+  type        = number
+  default     = 1
+  validation {
+    condition     = var.claim_check_expiration_days >= 1
+    error_message = "Variable var: claim_check_expiration_days must be at least 1"
+  }
+}